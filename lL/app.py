@@ -1,21 +1,268 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, current_app, render_template, request, redirect, url_for, session, flash, jsonify, abort, make_response, Response, g
+from flask import has_app_context, has_request_context, request_started, request_finished, before_render_template, template_rendered
+from flask.cli import AppGroup
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, or_, and_, event, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.orm import joinedload, contains_eager
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from datetime import datetime
-from PIL import Image
-import pydicom
-import nibabel as nib
-import numpy as np
+from werkzeug.utils import secure_filename, send_file
+from datetime import datetime, date, timedelta
+from collections import OrderedDict
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from storage import UPLOAD_FOLDER
+from scheduling import PriorityExecutor
+from events import create_broker, format_sse
+from search import create_search_index, query_terms, is_search_table
+import importlib
+import metrics
+import storage
+import functools
+import click
+import threading
+import hashlib
+import zipfile
+import hmac
+import operator
+import shutil
+import json
+import queue
+import sqlite3
+import time
+import uuid
 import os
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'medical-secret-key-2024'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///medical_platform.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB
+# وحدات الصور تحمل عند أول استخدام: pydicom و nibabel و numpy و PIL تستغرق أغلب وقت تشغيل
+# العملية وذاكرتها، فعمليات الويب التي تخدم الدخول ولوحات التحكم فقط لا تحملها أبداً
+class LazyModule:
+    """وحدة تستورد عند أول وصول لأحد أسمائها"""
+    
+    def __init__(self, name):
+        self._name = name
+    
+    def __getattr__(self, attribute):
+        # import_module آمن مع الخيوط ويعيد الوحدة من sys.modules بعد أول تحميل
+        return getattr(importlib.import_module(self._name), attribute)
+
+imaging = LazyModule('imaging')
+normalization = LazyModule('normalization')
+tiering = LazyModule('tiering')
+
+# ملفات التشغيل: full تسجل كل المسارات، و web تستبعد مسارات imaging_routes التي تعالج الصور
+# (/create_post و /upload_image و /api/uploads و /api/image/<id>/slices) لتشغيل عمليات خفيفة
+# لباقي الصفحات، ويوجه الخادم الأمامي هذه المسارات إلى عمليات full
+APP_PROFILES = {'full': ('web', 'imaging'), 'web': ('web',)}
+
+def configure_app(app):
+    app.config['SECRET_KEY'] = 'medical-secret-key-2024'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///medical_platform.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB
+    # عدد العمليات المخصصة لتوليد المعاينات وعدد محاولات التحويل قبل اعتباره فاشلاً
+    app.config['PREVIEW_WORKERS'] = int(os.environ.get('PREVIEW_WORKERS', 2))
+    # عدد الخيوط التي تحفظ ملفات الطلب الواحد بالتوازي (البصمة، النسخ، بناء أحجام السلاسل)
+    # وهي مشتركة بين كل الطلبات فلا يتجاوز عدد الملفات المحفوظة في نفس الوقت هذا العدد
+    app.config['UPLOAD_WORKERS'] = int(os.environ.get('UPLOAD_WORKERS', 4))
+    app.config['PREVIEW_MAX_ATTEMPTS'] = int(os.environ.get('PREVIEW_MAX_ATTEMPTS', 3))
+    # الرفع المجزأ: الحد الأقصى لحجم الدراسة الكاملة ومدة صلاحية جلسة الرفع غير المكتملة
+    # (كل جزء يبقى محكوماً بـ MAX_CONTENT_LENGTH)
+    app.config['MAX_UPLOAD_SIZE'] = int(os.environ.get('MAX_UPLOAD_SIZE', 2 * 1024 * 1024 * 1024))  # 2GB
+    app.config['UPLOAD_SESSION_TTL'] = timedelta(hours=int(os.environ.get('UPLOAD_SESSION_TTL_HOURS', 24)))
+    # ذاكرة الشرائح المؤقتة لعارض الأحجام (في الذاكرة وعلى القرص)
+    app.config['SLICE_CACHE_DIR'] = os.environ.get('SLICE_CACHE_DIR', os.path.join(app.instance_path, 'slice_cache'))
+    app.config['SLICE_CACHE_MEMORY'] = int(os.environ.get('SLICE_CACHE_MEMORY', 64 * 1024 * 1024))  # 64MB
+    app.config['SLICE_CACHE_DISK'] = int(os.environ.get('SLICE_CACHE_DISK', 1024 * 1024 * 1024))  # 1GB
+    # إشعارات الردود الفورية (SSE). عند تشغيل عدة عمليات يجب تحديد Redis لتوزيع الأحداث بينها
+    app.config['REPLY_EVENTS_REDIS_URL'] = os.environ.get('REPLY_EVENTS_REDIS_URL')
+    # كل اتصال SSE يشغل خيطاً من خيوط الخادم طوال مدته، لذلك يشغل الخادم بعمال gevent أو بخيوط
+    # (gunicorn -k gevent أو --threads) وليس بعمال sync. بعد انتهاء المدة يعيد المتصفح الاتصال
+    # تلقائياً ويستلم ما فاته بـ Last-Event-ID، فالمدة القصيرة تحرر الخيوط دون فقد أحداث
+    app.config['SSE_HEARTBEAT_SECONDS'] = 15
+    app.config['SSE_STREAM_TIMEOUT'] = int(os.environ.get('SSE_STREAM_TIMEOUT', 60))
+    # تسليم الملفات الطبية: مع nginx نحدد المسار الداخلي (internal) المرتبط بمجلد الرفع ليرسل
+    # الملف بنفسه عبر X-Accel-Redirect، ومع Apache/lighttpd نفعل X-Sendfile
+    app.config['MEDIA_ACCEL_REDIRECT_PREFIX'] = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX')
+    app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+    app.config['MEDIA_MAX_AGE'] = 365 * 24 * 3600  # الأسماء مبنية على المحتوى ولا تتغير
+    # مقاييس الأداء (/metrics بصيغة Prometheus مع Authorization: Bearer <METRICS_TOKEN>، ولا يتاح بدون METRICS_TOKEN)
+    # وتسجيل الطلبات التي تتجاوز SLOW_REQUEST_SECONDS مع تفاصيل الوقت
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    app.config['SLOW_REQUEST_SECONDS'] = float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0))
+    # أرشفة الملفات الأصلية الأقدم من ARCHIVE_AFTER_DAYS (flask archive-uploads): DICOM بصيغة نقل
+    # مضغوطة بدون فقد (rle أو jpeg2000 إذا ثبت مرمزه) و NIfTI (gzip أو zstd إذا ثبتت zstandard).
+    # الملف المؤرشف يفك عند فتحه ويبقى في مجلد الرفع حتى لا يفتح خلال ARCHIVE_HOT_TTL
+    # أو يتجاوز مجموع النسخ المفكوكة ARCHIVE_HOT_CACHE_SIZE
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+    app.config['ARCHIVE_DICOM_COMPRESSION'] = os.environ.get('ARCHIVE_DICOM_COMPRESSION', 'rle')
+    app.config['ARCHIVE_NIFTI_COMPRESSION'] = os.environ.get('ARCHIVE_NIFTI_COMPRESSION', 'gzip')
+    app.config['ARCHIVE_HOT_TTL'] = timedelta(hours=int(os.environ.get('ARCHIVE_HOT_TTL_HOURS', 24)))
+    app.config['ARCHIVE_HOT_CACHE_SIZE'] = int(os.environ.get('ARCHIVE_HOT_CACHE_SIZE', 5 * 1024 * 1024 * 1024))  # 5GB
+    
+    # إعدادات قاعدة البيانات
+    # PostgreSQL: مجموعة اتصالات بحجم محدد مع التحقق من الاتصال قبل استخدامه
+    # SQLite: مهلة انتظار عند قفل القاعدة، وباقي الإعدادات تطبق عند فتح كل اتصال (sqlite_on_connect)
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres://'):
+        # بعض مزودي الاستضافة يستخدمون الاسم القديم الذي لم يعد SQLAlchemy يدعمه
+        app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'].replace('postgres://', 'postgresql://', 1)
+    
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 30))  # ثوانٍ
+        app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # 256MB
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'connect_args': {'timeout': app.config['SQLITE_BUSY_TIMEOUT'], 'check_same_thread': False}
+        }
+    else:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+            'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+            'pool_pre_ping': True
+        }
+
+db = SQLAlchemy()
+# تغييرات الجداول والفهارس تتم عبر ملفات الترحيل في مجلد migrations (flask db upgrade)
+# جداول فهرس البحث تنشأ بأوامر خاصة بكل قاعدة بيانات في الترحيلات، فلا تقارن بالنماذج
+MIGRATIONS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+def include_in_migrations(name, type_, parent_names):
+    return not (type_ == 'table' and is_search_table(name))
+
+def init_migrations(app):
+    # flask_migrate يحمل alembic، ولا يحتاجه إلا أمر flask db و upgrade_database
+    from flask_migrate import Migrate
+    Migrate(app, db, directory=MIGRATIONS_DIRECTORY, render_as_batch=True, include_name=include_in_migrations)
+
+class RouteGroup:
+    """مسارات تسجل على التطبيق في create_app حسب ملف التشغيل
+
+    تسجل بأسماء دوالها كما هي، على عكس Blueprint الذي يضيف اسمه إلى كل مسار فتتغير
+    أسماء url_for في القوالب وتسميات المقاييس.
+    """
+    
+    def __init__(self):
+        self.routes = []
+    
+    def route(self, rule, **options):
+        def decorator(view):
+            self.routes.append((rule, view, options))
+            return view
+        return decorator
+    
+    def register(self, app):
+        for rule, view, options in self.routes:
+            app.add_url_rule(rule, view_func=view, **options)
+
+web_routes = RouteGroup()
+imaging_routes = RouteGroup()
+ROUTE_GROUPS = {'web': web_routes, 'imaging': imaging_routes}
+# أوامر flask (تضاف إلى كل ملفات التشغيل)
+cli = AppGroup('medical')
+
+@event.listens_for(Engine, 'connect')
+def sqlite_on_connect(dbapi_connection, connection_record):
+    """تفعيل WAL وإعدادات الأداء لكل اتصال SQLite جديد
+
+    WAL يسمح بالقراءة أثناء الكتابة فلا تتوقف الطلبات بسبب "database is locked"،
+    و synchronous=NORMAL آمن مع WAL ويقلل عمليات fsync.
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    
+    config = current_app.config if has_app_context() else {}
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f"PRAGMA busy_timeout={config.get('SQLITE_BUSY_TIMEOUT', 30) * 1000}")
+    cursor.execute(f"PRAGMA mmap_size={config.get('SQLITE_MMAP_SIZE', 0)}")
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.close()
+
+# مقاييس الأداء لكل مسار: المدة الكلية، عدد استعلامات SQL ومدتها، ومدة عرض القوالب
+# وتحويل الصور. تجمع في g أثناء الطلب عبر إشارات Flask وأحداث SQLAlchemy، وتسجل
+# في المدرجات عند انتهاء الطلب
+metrics_registry = metrics.MetricsRegistry()
+request_duration = metrics_registry.histogram(
+    'http_request_duration_seconds', 'Wall time per request', ('route', 'method', 'status'))
+request_sql_statements = metrics_registry.histogram(
+    'http_request_sql_statements', 'SQL statements executed per request', ('route',), metrics.COUNT_BUCKETS)
+request_sql_duration = metrics_registry.histogram(
+    'http_request_sql_duration_seconds', 'Time spent in SQL statements per request', ('route',))
+request_render_duration = metrics_registry.histogram(
+    'http_request_render_duration_seconds', 'Time spent in render_template per request that rendered', ('route',))
+request_convert_duration = metrics_registry.histogram(
+    'http_request_convert_duration_seconds', 'Time spent converting images per request that converted', ('route',))
+preview_duration = metrics_registry.histogram(
+    'preview_generation_seconds', 'Time spent in the preview worker per file (convert_to_preview and thumbnails)',
+    ('extension', 'stage'))
+
+def current_timings():
+    """مقاييس الطلب الحالي، أو None خارج الطلبات (أوامر CLI وطابور المعاينات)"""
+    if not has_request_context():
+        return None
+    return g.get('request_timings')
+
+def timed(kind):
+    timings = current_timings()
+    return timings.timer(kind) if timings is not None else nullcontext()
+
+def start_request_timings(sender, **extra):
+    if current_app.config['METRICS_ENABLED']:
+        g.request_timings = metrics.RequestTimings()
+
+def start_render_timer(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
 
-db = SQLAlchemy(app)
+def stop_render_timer(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    timings = current_timings()
+    if timings is not None and started is not None:
+        timings.add('render', time.perf_counter() - started)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def sql_started(conn, cursor, statement, parameters, context, executemany):
+    context.metrics_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def sql_finished(conn, cursor, statement, parameters, context, executemany):
+    timings = current_timings()
+    if timings is not None:
+        timings.add_sql(statement, time.perf_counter() - context.metrics_started)
+
+def record_request_timings(sender, response, **extra):
+    timings = g.pop('request_timings', None)
+    if timings is None or request.endpoint == 'metrics_endpoint':
+        return
+    
+    elapsed = timings.elapsed()
+    route = request.endpoint or 'unmatched'
+    request_duration.observe(elapsed, route, request.method, str(response.status_code))
+    request_sql_statements.observe(timings.sql_count, route)
+    request_sql_duration.observe(timings.durations['sql'], route)
+    if 'render' in timings.durations:
+        request_render_duration.observe(timings.durations['render'], route)
+    if 'convert' in timings.durations:
+        request_convert_duration.observe(timings.durations['convert'], route)
+    
+    if elapsed >= current_app.config['SLOW_REQUEST_SECONDS']:
+        current_app.logger.warning('Slow request %s %s (%s) %s in %.1fms: %s', request.method, request.path, route,
+                                   response.status_code, elapsed * 1000, timings.trace())
+
+@web_routes.route('/metrics')
+def metrics_endpoint():
+    token = current_app.config['METRICS_TOKEN']
+    if not current_app.config['METRICS_ENABLED'] or not token:
+        # بدون رمز لا ننشر المقاييس (المسارات وأزمنة الاستجابة) للعموم
+        abort(404)
+    
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'غير مصرح'}), 401
+    
+    return Response(metrics_registry.render(), content_type=metrics.CONTENT_TYPE)
 
 # إعدادات رفع الملفات
 ALLOWED_EXTENSIONS = {
@@ -27,6 +274,50 @@ ALLOWED_EXTENSIONS = {
     'jpeg': 'JPEG'
 }
 
+# تصنيفات ومستويات أهمية المنشورات
+POST_CATEGORIES = {
+    'emergency': 'حالة طارئة',
+    'medication': 'استفسار دوائي',
+    'procedure': 'إجراء طبي',
+    'symptoms': 'تفسير أعراض',
+    'equipment': 'استخدام معدات',
+    'other': 'أخرى'
+}
+URGENCY_LEVELS = ['low', 'normal', 'high', 'critical']
+# أولوية المنشور في طابور الفرز وفي توليد المعاينات: الرقم الأصغر يخدم أولاً
+URGENCY_PRIORITY = {'critical': 0, 'high': 1, 'normal': 2, 'low': 3}
+
+def urgency_priority(urgency):
+    return URGENCY_PRIORITY.get(urgency, URGENCY_PRIORITY['normal'])
+
+# عدد المنشورات في كل صفحة من لوحة تحكم الطبيب
+DASHBOARD_PAGE_SIZE = 20
+
+# عدد المنشورات التي نحتفظ باستجابة ردودها في الذاكرة
+REPLIES_CACHE_SIZE = 1024
+
+# حجم الدفعة عند قراءة الملفات المرفوعة وحساب بصمتها
+UPLOAD_CHUNK_READ_SIZE = 1024 * 1024  # 1MB
+
+# الامتدادات التي تحتاج إلى توليد معاينة PNG
+# الملفات الحجمية تحول إلى معاينة PNG، وكل الملفات تحصل على صور مصغرة في نفس المهمة
+PREVIEW_EXTENSIONS = {'dcm', 'nii', 'gz', storage.SERIES_EXTENSION, 'png', 'jpg', 'jpeg'}
+
+# سلاسل DICOM (عدة ملفات أو أرشيف zip) تخزن كحجم واحد بهذا النوع، والأرشيف نفسه لا يخزن
+SERIES_FILE_TYPE = 'DICOM_SERIES'
+SERIES_ARCHIVE_EXTENSIONS = {'zip'}
+MAX_SERIES_ARCHIVE_MEMBERS = 10000
+
+# أنواع الملفات الحجمية التي يمكن عرض شرائحها
+VOLUME_FILE_TYPES = {'DICOM', 'NIFTI', 'NIFTI_GZ', SERIES_FILE_TYPE}
+
+# حالات توليد المعاينة
+PREVIEW_PENDING = 'pending'
+PREVIEW_RETRYING = 'retrying'
+PREVIEW_READY = 'ready'
+PREVIEW_FAILED = 'failed'
+PREVIEW_NONE = 'none'  # لا تحتاج إلى معاينة (PNG/JPEG) أو لا تحتوي على بيانات صورة
+
 # النماذج
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -55,12 +346,25 @@ class MedicalImage(db.Model):
     filename = db.Column(db.String(255), nullable=False)
     original_filename = db.Column(db.String(255), nullable=False)
     file_type = db.Column(db.String(50), nullable=False)  # dicom, nii, png, jpg
-    file_size = db.Column(db.Integer, nullable=False)
+    file_size = db.Column(db.BigInteger, nullable=False)
+    sha256 = db.Column(db.String(64), index=True)  # بصمة المحتوى، الملفات المكررة تشترك في نفس الملف
     preview_filename = db.Column(db.String(255))  # اسم ملف المعاينة PNG
+    thumbnail_format = db.Column(db.String(10))  # صيغة الصور المصغرة (webp/jpeg) بعد توليدها
+    preview_status = db.Column(db.String(20), nullable=False, default=PREVIEW_NONE)
+    preview_attempts = db.Column(db.Integer, nullable=False, default=0)
+    preview_error = db.Column(db.String(500))
+    # طريقة ضغط الملف في مجلد الأرشيف (rle/jpeg2000/gzip/zstd)، و file_size يبقى حجم الأصل
+    archive_format = db.Column(db.String(10))
+    archived_size = db.Column(db.BigInteger)
+    archived_at = db.Column(db.DateTime)
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
-    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
+    # بيانات الترويسة (صف واحد صغير) تحمل مع الصورة في نفس الاستعلام
+    image_metadata = db.relationship('ImageMetadata', backref='image', uselist=False, lazy='joined',
+                                     cascade='all, delete-orphan')
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -69,9 +373,66 @@ class MedicalImage(db.Model):
             'file_type': self.file_type,
             'file_size': self.file_size,
             'upload_date': self.upload_date.strftime('%Y-%m-%d %H:%M') if self.upload_date else None,
-            'url': f'/static/uploads/medical_images/{self.filename}',
-            'preview_url': f'/static/uploads/medical_images/{self.preview_filename}' if self.preview_filename else None
+            'url': self.file_url(self.filename),
+            'preview_url': self.file_url(self.preview_filename) if self.preview_filename else None,
+            'preview_status': self.preview_status,
+            'thumbnails': self.thumbnail_urls(),
+            'metadata': self.image_metadata.to_dict() if self.image_metadata else None
         }
+    
+    def file_url(self, filename):
+        return url_for('serve_medical_file', image_id=self.id, filename=filename)
+    
+    def thumbnail_filenames(self):
+        if not self.thumbnail_format:
+            return {}
+        return {size: storage.thumbnail_filename(self.filename, size, self.thumbnail_format)
+                for size in storage.THUMBNAIL_SIZES}
+    
+    def thumbnail_urls(self):
+        """روابط الصور المصغرة حسب الحجم، أو None إذا لم يتم توليدها بعد"""
+        if not self.thumbnail_format:
+            return None
+        return {size: self.file_url(filename) for size, filename in self.thumbnail_filenames().items()}
+
+class ImageMetadata(db.Model):
+    """بيانات ترويسة الملف الطبي (DICOM/NIfTI) تستخرج مرة واحدة عند الرفع
+
+    التصفية حسب نوع الجهاز أو العضو أو التاريخ أو الأبعاد تتم بالفهارس دون فتح الملفات.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    image_id = db.Column(db.Integer, db.ForeignKey('medical_image.id'), nullable=False, unique=True)
+    modality = db.Column(db.String(16), index=True)  # CT, MR, CR...
+    body_part = db.Column(db.String(64), index=True)
+    study_date = db.Column(db.Date, index=True)
+    study_description = db.Column(db.String(255))
+    series_description = db.Column(db.String(255))
+    manufacturer = db.Column(db.String(128))
+    slice_thickness = db.Column(db.Float, index=True)  # مم
+    pixel_spacing = db.Column(db.Float)  # مم
+    rows = db.Column(db.Integer)
+    columns = db.Column(db.Integer)
+    slices = db.Column(db.Integer)
+    
+    __table_args__ = (
+        db.Index('ix_image_metadata_rows_columns', 'rows', 'columns'),
+    )
+    
+    FIELDS = ('modality', 'body_part', 'study_date', 'study_description', 'series_description',
+              'manufacturer', 'slice_thickness', 'pixel_spacing', 'rows', 'columns', 'slices')
+    
+    @classmethod
+    def from_header(cls, metadata):
+        """إنشاء الصف من ناتج imaging.read_metadata (التاريخ نص ISO)"""
+        values = {field: metadata.get(field) for field in cls.FIELDS}
+        if values['study_date']:
+            values['study_date'] = date.fromisoformat(values['study_date'])
+        return cls(**values)
+    
+    def to_dict(self):
+        values = {field: getattr(self, field) for field in self.FIELDS}
+        values['study_date'] = self.study_date.isoformat() if self.study_date else None
+        return values
 
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -79,12 +440,27 @@ class Post(db.Model):
     content = db.Column(db.Text, nullable=False)
     category = db.Column(db.String(50), nullable=False)
     urgency = db.Column(db.String(20), default='normal')  # low, normal, high, critical
+    priority = db.Column(db.SmallInteger, nullable=False, default=URGENCY_PRIORITY['normal'],
+                         server_default=str(URGENCY_PRIORITY['normal']))  # urgency_priority(urgency)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    # عدادات تحدث في نفس معاملة إضافة الرد أو الصورة بدلاً من العد عند كل عرض للوحات التحكم
+    # (flask rebuild-case-statistics يعيد حسابها)
+    reply_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    image_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    first_reply_at = db.Column(db.DateTime)
     
     # العلاقات
     replies = db.relationship('Reply', backref='post', lazy=True, cascade="all, delete-orphan")
     medical_images = db.relationship('MedicalImage', backref='post', lazy=True, cascade="all, delete-orphan")
+    
+    # فهرس مركب لترقيم لوحة التحكم بالمفتاح (created_at, id) من الأحدث، وفهرس جزئي لطابور الفرز
+    # يحتوي المنشورات غير المجابة فقط مرتبة بالأولوية ثم الأقدم
+    __table_args__ = (
+        db.Index('ix_post_created_at_id', 'created_at', 'id'),
+        db.Index('ix_post_triage', 'priority', 'created_at', 'id',
+                 sqlite_where=db.text('reply_count = 0'), postgresql_where=db.text('reply_count = 0')),
+    )
 
 class Reply(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -93,18 +469,101 @@ class Reply(db.Model):
     treatment = db.Column(db.Text)
     recommendations = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False, index=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     medical_proces=db.Column(db.String(50), nullable=False)
     medical_cate=db.Column(db.String(50), nullable=False)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'content': self.content,
+            'diagnosis': self.diagnosis,
+            'treatment': self.treatment,
+            'recommendations': self.recommendations,
+            'medical_proces': self.medical_proces,
+            'medical_cate': self.medical_cate,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M'),
+            'doctor_name': f"{self.doctor.first_name} {self.doctor.last_name}"
+        }
 
-# إنشاء الجداول
-with app.app_context():
-    db.create_all()
+class UploadSession(db.Model):
+    """جلسة رفع مجزأ قابلة للاستئناف (على غرار بروتوكول tus)"""
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    filename = db.Column(db.String(255), nullable=False)  # الاسم النهائي للملف على القرص
+    original_filename = db.Column(db.String(255), nullable=False)
+    extension = db.Column(db.String(10), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    offset = db.Column(db.BigInteger, nullable=False, default=0)  # عدد البايتات المستلمة
+    checksum = db.Column(db.String(64))  # SHA-256 المتوقع من العميل (اختياري)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    medical_image_id = db.Column(db.Integer, db.ForeignKey('medical_image.id'))
+    
+    @property
+    def part_path(self):
+        return os.path.join(UPLOAD_FOLDER, f"{self.filename}.part")
+    
+    @property
+    def is_complete(self):
+        return self.medical_image_id is not None
+    
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'offset': self.offset,
+            'total_size': self.total_size,
+            'complete': self.is_complete,
+            'image_id': self.medical_image_id,
+            'upload_url': url_for('upload_session', upload_id=self.id)
+        }
+
+class CaseStatistics(db.Model):
+    """إحصاءات الحالات المجمعة: صف لكل قيمة من التصنيف والأهمية والممرض وصف للمجموع
+
+    تزاد مع عدادات المنشور في نفس المعاملة، فقراءة الملخص لا تمر على جدول المنشورات.
+    """
+    dimension = db.Column(db.String(20), primary_key=True)  # all, category, urgency, user
+    key = db.Column(db.String(50), primary_key=True)  # فارغ لصف المجموع، ورقم المستخدم لـ user
+    post_count = db.Column(db.Integer, nullable=False, default=0)
+    answered_count = db.Column(db.Integer, nullable=False, default=0)
+    reply_count = db.Column(db.Integer, nullable=False, default=0)
+    image_count = db.Column(db.Integer, nullable=False, default=0)
+    response_seconds = db.Column(db.Float, nullable=False, default=0)  # مجموع زمن أول رد للمنشورات المجابة
+    
+    COUNTERS = ('post_count', 'answered_count', 'reply_count', 'image_count', 'response_seconds')
+    
+    def to_dict(self):
+        values = {counter: getattr(self, counter) for counter in self.COUNTERS[:-1]}
+        values['unanswered_count'] = self.post_count - self.answered_count
+        values['average_response_minutes'] = (
+            round(self.response_seconds / self.answered_count / 60, 1) if self.answered_count else None
+        )
+        return values
+
+# أول ملف ترحيل (مطابق للجداول التي كان ينشئها db.create_all())
+INITIAL_SCHEMA_REVISION = 'ff0be3548d26'
+
+def upgrade_database(app):
+    """تطبيق ملفات الترحيل على قاعدة البيانات (لا يتم عند إنشاء التطبيق، بل بهذا الأمر أو flask db upgrade)
+
+    قواعد البيانات القديمة التي أنشئت بـ db.create_all() لا تحتوي على جدول
+    alembic_version، لذلك نعلّمها بالنسخة الأولى قبل تطبيق باقي الترحيلات.
+    """
+    from flask_migrate import upgrade, stamp
+    with app.app_context():
+        tables = inspect(db.engine).get_table_names()
+        if 'post' in tables and 'alembic_version' not in tables:
+            stamp(revision=INITIAL_SCHEMA_REVISION)
+        upgrade()
 
 # دوال مساعدة لرفع الملفات
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    if '.' not in filename:
+        return False
+    extension = filename.rsplit('.', 1)[1].lower()
+    return extension in ALLOWED_EXTENSIONS or extension in SERIES_ARCHIVE_EXTENSIONS
 
 
 
@@ -114,70 +573,106 @@ def allowed_file(filename):
 
 
 
-def convert_to_preview(file_path, extension, original_filename):
-    """تحويل ملفات DICOM/NIFTI إلى PNG للعرض"""
+# طابور توليد المعاينات في الخلفية
+# يتم التحويل في عمليات منفصلة حتى لا يتوقف الطلب أثناء قراءة ملفات DICOM/NIFTI الكبيرة
+# المهام تنتظر في PriorityExecutor مرتبة بأولوية المنشور، فصور الحالات الحرجة تحول قبل
+# الحالات العادية المنتظرة مهما كان وقت رفعها (المهام التي بدأت تكمل دون مقاطعة)
+# نتائج التحويل تسجل في قاعدة البيانات في خيط خاص بها، فلا يتأخر خيط المجموعة الذي يستلم
+# نتائج باقي العمليات بسبب استعلامات التحديث وإعادة المحاولة
+_preview_executor = None
+_preview_executor_lock = threading.Lock()
+_preview_results = queue.Queue()
+# عدد المهام التي لم تسجل نتيجتها بعد (مع إعادة المحاولة)، لـ wait_for_previews
+_preview_jobs = 0
+_preview_jobs_done = threading.Condition()
+
+def get_preview_executor():
+    global _preview_executor
+    with _preview_executor_lock:
+        if _preview_executor is None:
+            workers = current_app.config['PREVIEW_WORKERS']
+            _preview_executor = PriorityExecutor(lambda: ProcessPoolExecutor(max_workers=workers), workers)
+            threading.Thread(target=_record_preview_results, name='preview-results', daemon=True).start()
+        return _preview_executor
+
+def enqueue_preview(image_id, file_path, extension, filename, priority):
+    """إضافة ملف إلى طابور توليد المعاينات بأولوية منشوره"""
+    global _preview_jobs
+    future = get_preview_executor().submit(priority, imaging.generate_previews, file_path, extension, filename)
+    with _preview_jobs_done:
+        _preview_jobs += 1
+    
+    # تسجيل النتيجة يتم في خيط preview-results خارج سياق الطلب، فنمرر التطبيق نفسه
+    app = current_app._get_current_object()
+    future.add_done_callback(
+        lambda f: _preview_results.put((f, app, image_id, file_path, extension, filename, priority))
+    )
+    return future
+
+def _record_preview_results():
+    global _preview_jobs
+    while True:
+        future, app, image_id, *job = _preview_results.get()
+        try:
+            _on_preview_done(future, app, image_id, *job)
+        except Exception:
+            app.logger.exception('Cannot record preview result for image %s', image_id)
+        finally:
+            with _preview_jobs_done:
+                _preview_jobs -= 1
+                _preview_jobs_done.notify_all()
+
+def wait_for_previews(timeout=None):
+    """انتظار انتهاء كل المعاينات المرسلة من هذه العملية وتسجيل نتائجها، تعيد False عند انتهاء المهلة"""
+    with _preview_jobs_done:
+        return _preview_jobs_done.wait_for(lambda: _preview_jobs == 0, timeout)
+
+def _on_preview_done(future, app, image_id, file_path, extension, filename, priority):
+    """تحديث حالة المعاينة بعد انتهاء التحويل مع إعادة المحاولة عند الفشل"""
+    preview_filename = thumbnail_format = None
+    error = None
     try:
-        preview_filename = f"{os.path.splitext(original_filename)[0]}_preview.png"
-        preview_path = os.path.join('static', 'uploads', 'medical_images', preview_filename)
-        
-        if extension == 'dcm':
-            # قراءة ملف DICOM
-            dicom_data = pydicom.dcmread(file_path)
-            
-            if hasattr(dicom_data, 'pixel_array'):
-                # تحويل البيانات إلى صورة
-                image_array = dicom_data.pixel_array
-                
-                # تطبيع البيانات
-                if image_array.dtype != np.uint8:
-                    image_array = image_array.astype(np.float32)
-                    image_array = (image_array - image_array.min()) / (image_array.max() - image_array.min()) * 255
-                    image_array = image_array.astype(np.uint8)
-                
-                # إذا كانت الصورة 3D، نأخذ شريحة من المنتصف
-                if len(image_array.shape) == 3:
-                    slice_idx = image_array.shape[2] // 2
-                    image_slice = image_array[:, :, slice_idx]
-                elif len(image_array.shape) == 2:
-                    image_slice = image_array
-                else:
-                    return None
-                
-                # حفظ الصورة
-                img = Image.fromarray(image_slice)
-                img.save(preview_path)
-                return preview_filename
-                
-        elif extension in ['nii', 'gz']:
-            # قراءة ملف NIFTI
-            nii_img = nib.load(file_path)
-            image_data = nii_img.get_fdata()
-            
-            # تطبيع البيانات
-            image_data = image_data.astype(np.float32)
-            image_data = (image_data - image_data.min()) / (image_data.max() - image_data.min()) * 255
-            image_data = image_data.astype(np.uint8)
-            
-            # نأخذ شريحة من المنتصف
-            if len(image_data.shape) == 3:
-                slice_idx = image_data.shape[2] // 2
-                image_slice = image_data[:, :, slice_idx]
-            elif len(image_data.shape) == 2:
-                image_slice = image_data
-            else:
-                # إذا كانت 4D، نأخذ الشريحة الأولى من البعد الرابع
-                slice_idx = image_data.shape[2] // 2
-                image_slice = image_data[:, :, slice_idx, 0]
-            
-            img = Image.fromarray(image_slice)
-            img.save(preview_path)
-            return preview_filename
-            
+        preview_filename, thumbnail_format, durations = future.result()
     except Exception as e:
-        print(f"Error converting file: {e}")
-        return None
+        error = f"{e.__class__.__name__}: {e}"[:500]
+    else:
+        for stage, seconds in durations.items():
+            preview_duration.observe(seconds, extension, stage)
     
-    return None
+    retry = False
+    with app.app_context():
+        medical_image = db.session.get(MedicalImage, image_id)
+        if medical_image is None:
+            return
+        
+        medical_image.preview_attempts = (medical_image.preview_attempts or 0) + 1
+        if error is None:
+            status = PREVIEW_READY if preview_filename or thumbnail_format else PREVIEW_NONE
+        elif medical_image.preview_attempts < current_app.config['PREVIEW_MAX_ATTEMPTS']:
+            current_app.logger.warning('Preview conversion failed for image %s (attempt %s): %s',
+                                       image_id, medical_image.preview_attempts, error)
+            status = PREVIEW_RETRYING
+            retry = True
+        else:
+            current_app.logger.error('Preview conversion failed for image %s: %s', image_id, error)
+            status = PREVIEW_FAILED
+        
+        # الملفات المكررة تشترك في نفس الملف على القرص، فنحدّث كل السجلات التي تنتظره
+        waiting_images = MedicalImage.query.filter(
+            MedicalImage.filename == filename,
+            MedicalImage.preview_status.in_([PREVIEW_PENDING, PREVIEW_RETRYING])
+        ).all()
+        for waiting_image in set(waiting_images) | {medical_image}:
+            waiting_image.preview_status = status
+            waiting_image.preview_error = error
+            if error is None:
+                waiting_image.preview_filename = preview_filename
+                waiting_image.thumbnail_format = thumbnail_format
+        
+        db.session.commit()
+        
+        if retry:
+            enqueue_preview(image_id, file_path, extension, filename, priority)
 
 
 
@@ -201,44 +696,367 @@ medical_procedures = {
 }
 
 
-def save_uploaded_file(file, post_id, user_id):
+def file_extension(extension):
+    # يحتاج nibabel إلى الامتداد الكامل .nii.gz لمعرفة نوع الملف
+    return 'nii.gz' if extension == 'gz' else extension
+
+def make_unique_filename(extension, post_id, user_id, suffix=''):
+    timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+    return f"{user_id}_{post_id}_{timestamp}{suffix}.{file_extension(extension)}"
+
+# التخزين حسب المحتوى: اسم الملف هو بصمة SHA-256 لمحتواه، فالملفات المكررة تشترك
+# في ملف واحد على القرص وفي نفس المعاينة، وعدد المراجع هو عدد سجلات MedicalImage
+def content_filename(sha256, extension):
+    return f"{sha256}.{file_extension(extension)}"
+
+def hash_stream(stream):
+    """حساب SHA-256 وحجم الملف بالقراءة على دفعات ثم إعادة المؤشر للبداية"""
+    hasher = hashlib.sha256()
+    size = 0
+    stream.seek(0)
+    for block in iter(lambda: stream.read(UPLOAD_CHUNK_READ_SIZE), b''):
+        hasher.update(block)
+        size += len(block)
+    stream.seek(0)
+    return hasher.hexdigest(), size
+
+def stored_file_exists(medical_image):
+    if os.path.exists(os.path.join(UPLOAD_FOLDER, medical_image.filename)):
+        return True
+    return bool(medical_image.archive_format) and \
+        os.path.exists(storage.archive_path(medical_image.filename, medical_image.archive_format))
+
+def original_file_path(medical_image):
+    """مسار الملف الأصلي في مجلد الرفع، مع فك ضغطه من الأرشيف إذا لم يكن مفكوكاً
+
+    النسخة المفكوكة تبقى (الطبقة الساخنة) حتى يحذفها أمر archive-uploads بعد مدة من عدم فتحها.
+    إذا تعذر فك الضغط يعاد المسار كما هو ويتعامل المستدعي مع الملف المفقود.
+    """
+    file_path = os.path.join(UPLOAD_FOLDER, medical_image.filename)
+    if not medical_image.archive_format:
+        return file_path
+    try:
+        if os.path.exists(file_path):
+            tiering.touch(file_path)
+        else:
+            with timed('restore'):
+                tiering.restore_file(file_path, medical_image.filename, medical_image.archive_format)
+    except FileNotFoundError:
+        current_app.logger.error('Archived file is missing for %s', medical_image.filename)
+    except Exception as e:
+        current_app.logger.error('Cannot restore archived file %s: %s', medical_image.filename, e)
+    return file_path
+
+def find_stored_file(sha256):
+    """أقدم صورة مخزنة بنفس المحتوى ما زال ملفها موجوداً على القرص (مفكوكاً أو في الأرشيف)"""
+    medical_image = MedicalImage.query.filter_by(sha256=sha256).order_by(MedicalImage.id).first()
+    if medical_image and stored_file_exists(medical_image):
+        return medical_image
+    return None
+
+def stored_file_info(existing, original_filename, extension):
+    """بيانات ملف مكرر تعيد استخدام الملف المخزن ومعاينته بدلاً من الكتابة والتحويل"""
+    return {
+        'filename': existing.filename,
+        'original_filename': original_filename,
+        'file_path': os.path.join(UPLOAD_FOLDER, existing.filename),
+        'extension': extension,
+        'file_type': existing.file_type,
+        'file_size': existing.file_size,
+        'sha256': existing.sha256,
+        'preview_filename': existing.preview_filename,
+        'thumbnail_format': existing.thumbnail_format,
+        'preview_status': existing.preview_status,
+        'archive_format': existing.archive_format,
+        'archived_size': existing.archived_size,
+        'archived_at': existing.archived_at,
+        # الملف قد يكون في الأرشيف، فتنسخ الترويسة من السجل بدلاً من قراءته
+        'metadata': existing.image_metadata.to_dict() if existing.image_metadata else None,
+        'reused': True
+    }
+
+def save_uploaded_file(file):
     if file.filename == '':
         return None
     
     if not allowed_file(file.filename):
         return None
     
-    # إنشاء اسم فريد للملف
-    timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-    original_filename = secure_filename(file.filename)
+    # بصمة المحتوى تحسب من الملف المؤقت الذي حفظه Werkzeug قبل أي كتابة في مجلد الرفع
+    return save_file_stream(file.stream, secure_filename(file.filename))
+
+def save_file_stream(stream, original_filename):
+    """حفظ ملف من تيار قابل لإعادة القراءة (seek) باسم بصمة محتواه"""
     extension = original_filename.rsplit('.', 1)[1].lower()
-    unique_filename = f"{user_id}_{post_id}_{timestamp}.{extension}"
     
-    # إنشاء مجلد التخزين
-    upload_folder = os.path.join('static', 'uploads', 'medical_images')
-    os.makedirs(upload_folder, exist_ok=True)
+    sha256, file_size = hash_stream(stream)
+    existing = find_stored_file(sha256)
+    if existing:
+        return stored_file_info(existing, original_filename, extension)
     
-    file_path = os.path.join(upload_folder, unique_filename)
+    # إنشاء مجلد التخزين
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     
-    # حفظ الملف
-    file.save(file_path)
+    unique_filename = content_filename(sha256, extension)
+    file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
     
-    # تحويل DICOM/NIFTI إلى PNG لعرضها
-    preview_filename = None
-    if extension in ['dcm', 'nii', 'gz']:
-        preview_filename = convert_to_preview(file_path, extension, unique_filename)
+    # حفظ الملف باسم مؤقت ثم نقله حتى لا يظهر ملف ناقص بالاسم النهائي
+    temp_path = f"{file_path}.{uuid.uuid4().hex}.part"
+    try:
+        with open(temp_path, 'wb') as f:
+            shutil.copyfileobj(stream, f, UPLOAD_CHUNK_READ_SIZE)
+        os.replace(temp_path, file_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
     
+    # تحويل DICOM/NIFTI إلى PNG يتم لاحقاً في طابور المعاينات (enqueue_preview)
     return {
         'filename': unique_filename,
         'original_filename': original_filename,
         'file_path': file_path,
+        'extension': extension,
         'file_type': ALLOWED_EXTENSIONS[extension],
+        'file_size': file_size,
+        'sha256': sha256,
+        'preview_filename': None,
+        'thumbnail_format': None,
+        'preview_status': PREVIEW_PENDING if extension in PREVIEW_EXTENSIONS else PREVIEW_NONE,
+        'reused': False
+    }
+
+def _rewound(stream):
+    stream.seek(0)
+    return stream
+
+def archive_sources(archive):
+    """ملفات أرشيف zip كمصادر لتجميع السلاسل، تقرأ مباشرة من الأرشيف دون فكه على القرص"""
+    members = [info for info in archive.infolist() if not info.is_dir()]
+    if len(members) > MAX_SERIES_ARCHIVE_MEMBERS:
+        raise ValueError('عدد الملفات في الأرشيف كبير جداً')
+    if sum(info.file_size for info in members) > current_app.config['MAX_UPLOAD_SIZE']:
+        raise ValueError('حجم الأرشيف بعد فك الضغط غير مسموح')
+    return [(secure_filename(os.path.basename(info.filename)), functools.partial(archive.open, info))
+            for info in members]
+
+def save_series(group):
+    """حفظ سلسلة DICOM كحجم .npy واحد، أو إعادة استخدام حجم مخزن لنفس السلسلة
+
+    بصمة السلسلة مبنية على SOPInstanceUID لشرائحها بالترتيب وتحفظ في عمود sha256،
+    فرفع نفس السلسلة مرة أخرى (كملفات أو كأرشيف) لا يعيد بناء الحجم.
+    """
+    label = group['headers'][0].get('SeriesDescription') or os.path.splitext(group['names'][0])[0]
+    original_filename = f"{secure_filename(str(label)) or 'series'}_{len(group['sources'])}_slices"
+    extension = storage.SERIES_EXTENSION
+    
+    key = imaging.series_key(group)
+    existing = find_stored_file(key)
+    if existing:
+        return stored_file_info(existing, original_filename, extension)
+    
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    filename = content_filename(key, extension)
+    file_path = os.path.join(UPLOAD_FOLDER, filename)
+    metadata = imaging.write_series_volume(group, file_path)
+    
+    return {
+        'filename': filename,
+        'original_filename': original_filename,
+        'file_path': file_path,
+        'extension': extension,
+        'file_type': SERIES_FILE_TYPE,
         'file_size': os.path.getsize(file_path),
-        'preview_filename': preview_filename
+        'sha256': key,
+        'preview_filename': None,
+        'thumbnail_format': None,
+        'preview_status': PREVIEW_PENDING,
+        'metadata': metadata['header'],
+        'reused': False
     }
 
+def save_dicom_file(open_file, name, dicom_data):
+    """حفظ ملف DICOM منفرد مع ترويسته المقروءة أثناء التجميع"""
+    saved_file = save_file_stream(open_file(), name)
+    saved_file['metadata'] = imaging.dicom_header_metadata(dicom_data)
+    return saved_file
+
+def dicom_save_tasks(sources, keep_unreadable=False):
+    """تجميع ملفات DICOM حسب السلسلة: السلسلة متعددة الشرائح تحفظ كحجم واحد
+    والملف المنفرد يحفظ كما هو. تعيد مهام الحفظ دون تنفيذها (انظر run_save_tasks)
+
+    الملفات التي لا يمكن قراءتها كـ DICOM تحفظ كما هي عند keep_unreadable
+    (الملفات المرفوعة مباشرة) ويتم تجاهلها داخل الأرشيف.
+    """
+    tasks = []
+    grouped = set()
+    for group in imaging.group_dicom_series(sources):
+        grouped.update(id(open_file) for open_file in group['sources'])
+        if len(group['sources']) == 1:
+            tasks.append((save_dicom_file, (group['sources'][0], group['names'][0], group['headers'][0])))
+        else:
+            tasks.append((save_series, (group,)))
+    
+    if keep_unreadable:
+        for name, open_file in sources:
+            if id(open_file) not in grouped:
+                tasks.append((save_file_stream, (open_file(), name)))
+    return tasks
+
+def save_dicom_sources(sources, keep_unreadable=False):
+    return run_save_tasks(dicom_save_tasks(sources, keep_unreadable))
+
+# حفظ ملفات الطلب بالتوازي: كل مهمة تحفظ ملفاً أو سلسلة في سياق تطبيق خاص بخيطها
+_upload_executor = None
+_upload_executor_lock = threading.Lock()
+
+def get_upload_executor():
+    global _upload_executor
+    with _upload_executor_lock:
+        if _upload_executor is None:
+            _upload_executor = ThreadPoolExecutor(max_workers=current_app.config['UPLOAD_WORKERS'],
+                                                  thread_name_prefix='upload')
+        return _upload_executor
+
+def read_image_metadata(saved_file):
+    try:
+        return imaging.read_metadata(saved_file['file_path'], saved_file['extension'])
+    except Exception as e:
+        current_app.logger.warning('Cannot read metadata for %s: %s', saved_file['filename'], e)
+        return None
+
+def _run_save_task(function, args):
+    saved_file = function(*args)
+    if saved_file and 'metadata' not in saved_file:
+        saved_file['metadata'] = read_image_metadata(saved_file)
+    return saved_file
+
+def _run_save_task_in_worker(app, function, args):
+    with app.app_context():
+        return _run_save_task(function, args)
+
+def run_save_tasks(tasks):
+    """تنفيذ مهام الحفظ بالتوازي مع الحفاظ على ترتيب النتائج
+
+    ينتظر انتهاء كل المهام، وعند فشل أي منها تحذف الملفات التي كتبتها المهام الأخرى
+    ثم يرفع أول استثناء.
+    """
+    if len(tasks) == 1:
+        function, args = tasks[0]
+        saved_files = [_run_save_task(function, args)]
+    else:
+        app = current_app._get_current_object()
+        futures = [get_upload_executor().submit(_run_save_task_in_worker, app, function, args)
+                   for function, args in tasks]
+        wait(futures)
+        saved_files = []
+        error = None
+        for future in futures:
+            try:
+                saved_files.append(future.result())
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            # لا نحذف الملفات المكتوبة: اسمها بصمة محتواها، وقد يكون طلب آخر كتب نفس الملف للتو
+            # ولم يحفظ سجله بعد. gc-uploads يحذف الملفات غير المستخدمة بعد مهلة كافية
+            raise error
+    return [saved_file for saved_file in saved_files if saved_file]
+
+def validate_uploaded_files(files):
+    """الملفات المرفوعة غير الفارغة، مع رفض الطلب كاملاً إذا كان أحدها من نوع غير مدعوم"""
+    files = [file for file in files if file and file.filename]
+    for file in files:
+        if not allowed_file(file.filename):
+            raise ValueError(f'نوع الملف غير مدعوم: {file.filename}')
+    return files
+
+def save_uploaded_files(files):
+    """حفظ مجموعة ملفات مرفوعة مع تجميع شرائح DICOM وأرشيفات zip في سلاسل
+
+    يتم التحقق من كل الملفات قبل كتابة أي منها، ثم يحفظ كل ملف أو سلسلة بالتوازي.
+    الملفات التي كتبت لطلب فشل تبقى حتى يحذفها flask gc-uploads (انظر run_save_tasks).
+    """
+    tasks = []
+    dicom_sources = []
+    archive_dicom_sources = []
+    archives = []
+    try:
+        for file in validate_uploaded_files(files):
+            original_filename = secure_filename(file.filename)
+            extension = original_filename.rsplit('.', 1)[1].lower()
+            if extension in SERIES_ARCHIVE_EXTENSIONS:
+                archive = zipfile.ZipFile(file.stream)
+                archives.append(archive)
+                archive_dicom_sources.extend(archive_sources(archive))
+            elif extension == 'dcm':
+                dicom_sources.append((original_filename, functools.partial(_rewound, file.stream)))
+            else:
+                tasks.append((save_uploaded_file, (file,)))
+        
+        tasks.extend(dicom_save_tasks(dicom_sources, keep_unreadable=True))
+        tasks.extend(dicom_save_tasks(archive_dicom_sources))
+        return run_save_tasks(tasks) if tasks else []
+    finally:
+        for archive in archives:
+            archive.close()
+
+def extract_image_metadata(saved_file):
+    """بيانات الترويسة للملف المحفوظ
+
+    ملفات DICOM تكون ترويساتها قد قرئت أثناء التجميع في سلاسل، والباقي يقرأ من الملف
+    (الترويسة فقط). فشل القراءة لا يمنع الرفع، ويمكن إعادة المحاولة بأمر backfill-image-metadata.
+    """
+    if 'metadata' in saved_file:
+        metadata = saved_file['metadata']
+    else:
+        metadata = read_image_metadata(saved_file)
+    return ImageMetadata.from_header(metadata) if metadata else None
+
+def create_medical_image(saved_file, post_id, user_id):
+    return MedicalImage(
+        filename=saved_file['filename'],
+        original_filename=saved_file['original_filename'],
+        file_type=saved_file['file_type'],
+        file_size=saved_file['file_size'],
+        preview_filename=saved_file['preview_filename'],
+        preview_status=saved_file['preview_status'],
+        thumbnail_format=saved_file['thumbnail_format'],
+        sha256=saved_file['sha256'],
+        archive_format=saved_file.get('archive_format'),
+        archived_size=saved_file.get('archived_size'),
+        archived_at=saved_file.get('archived_at'),
+        image_metadata=extract_image_metadata(saved_file),
+        post_id=post_id,
+        user_id=user_id
+    )
+
+def enqueue_saved_previews(saved_images):
+    """إرسال الصور المحفوظة إلى طابور المعاينات بعد حفظ سجلاتها في قاعدة البيانات"""
+    for medical_image, saved_file in saved_images:
+        if medical_image.preview_status not in (PREVIEW_PENDING, PREVIEW_RETRYING):
+            continue
+        
+        if saved_file.get('reused'):
+            # الملف الأصلي ما زال في الطابور وسيحدّث هذا السجل عند انتهائه، إلا إذا انتهى
+            # قبل حفظ هذا السجل فننسخ نتيجته الآن
+            finished = MedicalImage.query.filter(
+                MedicalImage.filename == medical_image.filename,
+                MedicalImage.preview_status.notin_([PREVIEW_PENDING, PREVIEW_RETRYING])
+            ).first()
+            if finished:
+                medical_image.preview_status = finished.preview_status
+                medical_image.preview_filename = finished.preview_filename
+                medical_image.thumbnail_format = finished.thumbnail_format
+                medical_image.preview_error = finished.preview_error
+                db.session.commit()
+            continue
+        
+        # صور المنشور الواحد تشترك في نفس السجل، فيحمل مرة واحدة
+        enqueue_preview(medical_image.id, saved_file['file_path'],
+                        saved_file['extension'], saved_file['filename'], medical_image.post.priority)
+
 # الصفحات الرئيسية
-@app.route('/')
+@web_routes.route('/')
 def index():
     if 'user_id' in session:
         user = User.query.get(session['user_id'])
@@ -249,7 +1067,7 @@ def index():
     return redirect(url_for('login'))
 
 # تسجيل المستخدم الجديد
-@app.route('/register', methods=['GET', 'POST'])
+@web_routes.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         # جمع البيانات من النموذج
@@ -295,7 +1113,7 @@ def register():
     return render_template('register.html')
 
 # تسجيل الدخول
-@app.route('/login', methods=['GET', 'POST'])
+@web_routes.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
@@ -319,13 +1137,13 @@ def login():
     return render_template('login.html')
 
 # تسجيل الخروج
-@app.route('/logout')
+@web_routes.route('/logout')
 def logout():
     session.clear()
     return redirect(url_for('login'))
 
 # لوحة تحكم الممرض
-@app.route('/nurse/dashboard')
+@web_routes.route('/nurse/dashboard')
 def nurse_dashboard():
     if 'user_id' not in session or session['role'] != 'nurse':
         return redirect(url_for('login'))
@@ -336,92 +1154,410 @@ def nurse_dashboard():
     
     return render_template('nurse_dashboard.html', user=user, posts=posts)
 
+# ترقيم المنشورات بالمفتاح: المؤشر هو (created_at, id) لآخر منشور في الصفحة السابقة
+# فتبقى تكلفة كل صفحة ثابتة مهما زاد عدد المنشورات بعكس OFFSET
+def encode_feed_cursor(post):
+    return f"{post.created_at.strftime('%Y%m%d%H%M%S%f')}_{post.id}"
+
+def decode_feed_cursor(cursor):
+    try:
+        timestamp, post_id = cursor.split('_', 1)
+        return datetime.strptime(timestamp, '%Y%m%d%H%M%S%f'), int(post_id)
+    except (AttributeError, ValueError):
+        return None
+
+# في طابور الفرز يضاف priority إلى المؤشر: (priority, created_at, id) بالترتيب التصاعدي
+def encode_triage_cursor(post):
+    return f"{post.priority}_{encode_feed_cursor(post)}"
+
+def decode_triage_cursor(cursor):
+    try:
+        priority, position = cursor.split('_', 1)
+        created_at, post_id = decode_feed_cursor(position)
+        return int(priority), created_at, post_id
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def query_posts_with_authors():
+    """المنشورات مع الكاتب في استعلام واحد (عدد الردود والصور أعمدة في جدول المنشورات)"""
+    return Post.query.options(joinedload(Post.author))
+
+# التصفية حسب بيانات ترويسة الصور: معامل الرابط -> (العمود، المقارنة، تحويل القيمة)
+IMAGE_METADATA_FILTERS = {
+    'modality': (ImageMetadata.modality, operator.eq, str.upper),
+    'body_part': (ImageMetadata.body_part, operator.eq, str.upper),
+    'study_date_from': (ImageMetadata.study_date, operator.ge, date.fromisoformat),
+    'study_date_to': (ImageMetadata.study_date, operator.le, date.fromisoformat),
+    'min_slice_thickness': (ImageMetadata.slice_thickness, operator.ge, float),
+    'max_slice_thickness': (ImageMetadata.slice_thickness, operator.le, float),
+    'min_rows': (ImageMetadata.rows, operator.ge, int),
+    'min_columns': (ImageMetadata.columns, operator.ge, int),
+    'min_slices': (ImageMetadata.slices, operator.ge, int),
+}
+
+def parse_image_metadata_filters(args):
+    """شروط التصفية من معاملات الرابط
+
+    تعيد (الشروط، القيم المستخدمة كما وردت) وترفع ValueError عند قيمة غير صالحة.
+    """
+    conditions = []
+    values = {}
+    for name, (column, compare, convert) in IMAGE_METADATA_FILTERS.items():
+        value = args.get(name, '').strip()
+        if not value:
+            continue
+        try:
+            conditions.append(compare(column, convert(value)))
+        except ValueError:
+            raise ValueError(f'قيمة غير صالحة لـ {name}: {value}')
+        values[name] = value
+    return conditions, values
+
+def image_metadata_options():
+    """القيم الموجودة لنوع الجهاز والعضو لقوائم التصفية (من الفهارس مباشرة)"""
+    options = {}
+    for name, column in (('modality', ImageMetadata.modality), ('body_part', ImageMetadata.body_part)):
+        rows = db.session.query(column).filter(column.isnot(None)).distinct().order_by(column).all()
+        options[name] = [value for value, in rows]
+    return options
+
+def query_post_feed(cursor=None, urgency=None, category=None, answered=None, image_conditions=None,
+                    triage=False, limit=DASHBOARD_PAGE_SIZE):
+    """صفحة من المنشورات مع كاتبها في استعلام واحد
+
+    تعيد (المنشورات، مؤشر الصفحة التالية أو None). image_conditions شروط على بيانات
+    الترويسة، ويظهر المنشور إذا طابقتها صورة واحدة منه على الأقل. مع triage تعاد المنشورات
+    غير المجابة فقط بالأولوية ثم الأقدم (فهرس ix_post_triage) بدلاً من الأحدث.
+    """
+    if triage:
+        return query_triage_queue(cursor, urgency, category, image_conditions, limit)
+    
+    query = filter_post_feed(query_posts_with_authors(), urgency, category, answered, image_conditions)
+    
+    position = decode_feed_cursor(cursor) if cursor else None
+    if position:
+        created_at, post_id = position
+        query = query.filter(or_(
+            Post.created_at < created_at,
+            and_(Post.created_at == created_at, Post.id < post_id)
+        ))
+    
+    rows = query.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit + 1).all()
+    
+    posts = rows[:limit]
+    next_cursor = encode_feed_cursor(posts[-1]) if len(rows) > limit else None
+    return posts, next_cursor
+
+def query_triage_queue(cursor=None, urgency=None, category=None, image_conditions=None, limit=DASHBOARD_PAGE_SIZE):
+    # الصفر قيمة ثابتة في الاستعلام وليس معاملاً، فتطابق شرط الفهرس الجزئي وتستخدمه قاعدة البيانات
+    query = filter_post_feed(query_posts_with_authors().filter(Post.reply_count == db.literal_column('0')),
+                             urgency, category, None, image_conditions)
+    
+    position = decode_triage_cursor(cursor) if cursor else None
+    if position:
+        priority, created_at, post_id = position
+        query = query.filter(db.tuple_(Post.priority, Post.created_at, Post.id) > (priority, created_at, post_id))
+    
+    rows = query.order_by(Post.priority, Post.created_at, Post.id).limit(limit + 1).all()
+    
+    posts = rows[:limit]
+    next_cursor = encode_triage_cursor(posts[-1]) if len(rows) > limit else None
+    return posts, next_cursor
+
+def filter_post_feed(query, urgency=None, category=None, answered=None, image_conditions=None):
+    """تطبيق عوامل تصفية لوحة الطبيب على استعلام المنشورات (صفحات المنشورات ونتائج البحث)"""
+    if urgency:
+        query = query.filter(Post.urgency == urgency)
+    if category:
+        query = query.filter(Post.category == category)
+    if answered is not None:
+        query = query.filter(Post.reply_count > 0 if answered else Post.reply_count == 0)
+    if image_conditions:
+        has_matching_image = db.select(MedicalImage.id).join(ImageMetadata) \
+            .where(MedicalImage.post_id == Post.id, *image_conditions).correlate(Post).exists()
+        query = query.filter(has_matching_image)
+    return query
+
+# البحث النصي في المنشورات والردود
+# الفهرس يحدَّث ضمن نفس المعاملة التي تحفظ المنشور أو الرد، فلا يحتاج إلى إعادة بناء دورية
+_search_index = None
+
+def get_search_index():
+    global _search_index
+    if _search_index is None:
+        _search_index = create_search_index(db.engine.dialect.name)
+    return _search_index
+
+def replies_search_text(replies):
+    return '\n'.join(
+        value for reply in replies
+        for value in (reply.content, reply.diagnosis, reply.treatment, reply.recommendations,
+                      reply.medical_proces, reply.medical_cate)
+        if value
+    )
+
+def index_post_for_search(post):
+    """تحديث صف المنشور في فهرس البحث (العنوان والنص وكل الردود)"""
+    replies = Reply.query.filter_by(post_id=post.id).all()
+    get_search_index().index_post(db.session.connection(), post.id, post.title, post.content,
+                                  replies_search_text(replies))
+
+def search_posts(query, page=1, limit=DASHBOARD_PAGE_SIZE, **filters):
+    """صفحة من نتائج البحث مرتبة حسب الصلة
+
+    تعيد (المنشورات، هل توجد صفحة تالية). لكل منشور search_rank مع عدد الردود والصور.
+    filters هي نفس عوامل تصفية filter_post_feed (urgency, category, answered, image_conditions).
+    """
+    terms = query_terms(query)
+    if not terms:
+        return [], False
+    
+    ranked = get_search_index().ranked(terms)
+    rows = filter_post_feed(
+        query_posts_with_authors().join(ranked, ranked.c.post_id == Post.id).add_columns(ranked.c.rank),
+        **filters
+    ).order_by(ranked.c.rank.desc(), Post.id.desc()).offset((page - 1) * limit).limit(limit + 1).all()
+    
+    posts = []
+    for post, rank in rows[:limit]:
+        post.search_rank = rank
+        posts.append(post)
+    return posts, len(rows) > limit
+
+@web_routes.route('/api/search')
+def search_api():
+    if 'user_id' not in session or session.get('role') != 'doctor':
+        return jsonify({'error': 'غير مصرح'}), 401
+    
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    posts, has_more = search_posts(query, page)
+    
+    return jsonify({
+        'query': query,
+        'page': page,
+        'next_page': page + 1 if has_more else None,
+        'results': [dict(feed_post_dict(post), rank=post.search_rank) for post in posts]
+    })
+
+def feed_post_dict(post):
+    return {
+        'id': post.id,
+        'title': post.title,
+        'content': post.content[:200],
+        'category': post.category,
+        'urgency': post.urgency,
+        'created_at': post.created_at.strftime('%Y-%m-%d %H:%M'),
+        'author': f"{post.author.first_name} {post.author.last_name}",
+        'reply_count': post.reply_count,
+        'image_count': post.image_count,
+        'url': url_for('get_post', post_id=post.id)
+    }
+
+@web_routes.route('/api/triage')
+def triage_api():
+    """طابور الفرز: المنشورات غير المجابة بالأولوية ثم الأقدم انتظاراً"""
+    if 'user_id' not in session or session.get('role') != 'doctor':
+        return jsonify({'error': 'غير مصرح'}), 401
+    
+    limit = min(max(request.args.get('limit', DASHBOARD_PAGE_SIZE, type=int), 1), DASHBOARD_PAGE_SIZE)
+    posts, next_cursor = query_triage_queue(
+        cursor=request.args.get('cursor'),
+        urgency=request.args.get('urgency') if request.args.get('urgency') in URGENCY_LEVELS else None,
+        category=request.args.get('category') if request.args.get('category') in POST_CATEGORIES else None,
+        limit=limit
+    )
+    now = datetime.utcnow()
+    return jsonify({
+        'next_cursor': next_cursor,
+        'results': [dict(feed_post_dict(post), priority=post.priority,
+                         waiting_minutes=int((now - post.created_at).total_seconds() // 60))
+                    for post in posts]
+    })
+
+# إحصاءات الحالات
+# عدادات المنشور وصفوف CaseStatistics تزاد بعبارات UPDATE ذرية (column = column + n) داخل معاملة
+# الإضافة نفسها، فتبقى صحيحة مع الطلبات المتزامنة ويلغيها rollback مع باقي التغييرات
+STATISTICS_UPSERTS = {'sqlite': sqlite_insert, 'postgresql': postgresql_insert}
+
+def case_statistics_keys(category, urgency, user_id):
+    return (('all', ''), ('category', category), ('urgency', urgency or 'normal'), ('user', str(user_id)))
+
+def increment_case_statistics(category, urgency, user_id, **increments):
+    """زيادة صفوف الإحصاءات الخاصة بمنشور، والصف غير الموجود بعد ينشأ بنفس القيم"""
+    table = CaseStatistics.__table__
+    insert = STATISTICS_UPSERTS[db.session.get_bind().dialect.name](table)
+    rows = [dict(dict.fromkeys(CaseStatistics.COUNTERS, 0), dimension=dimension, key=key, **increments)
+            for dimension, key in case_statistics_keys(category, urgency, user_id)]
+    db.session.execute(insert.values(rows).on_conflict_do_update(
+        index_elements=['dimension', 'key'],
+        set_={name: table.c[name] + insert.excluded[name] for name in increments}
+    ))
+
+def record_new_post(post):
+    increment_case_statistics(post.category, post.urgency, post.user_id, post_count=1, image_count=post.image_count)
+
+def record_new_images(post, count):
+    Post.query.filter_by(id=post.id).update({Post.image_count: Post.image_count + count}, synchronize_session=False)
+    increment_case_statistics(post.category, post.urgency, post.user_id, image_count=count)
+
+def response_seconds(created_at, first_reply_at):
+    return max((first_reply_at - created_at).total_seconds(), 0) if created_at else 0
+
+def record_new_reply(post_id, replied_at):
+    """زيادة عدد ردود المنشور، وتسجيل وقت أول رد وزمن الاستجابة إذا كان أول رد عليه"""
+    Post.query.filter_by(id=post_id).update({Post.reply_count: Post.reply_count + 1}, synchronize_session=False)
+    # الشرط يجعل رداً واحداً فقط يعتبر الأول حتى مع ردين متزامنين على نفس المنشور
+    first_reply = Post.query.filter(Post.id == post_id, Post.first_reply_at.is_(None)) \
+        .update({Post.first_reply_at: replied_at}, synchronize_session=False)
+    category, urgency, user_id, created_at = db.session.query(
+        Post.category, Post.urgency, Post.user_id, Post.created_at
+    ).filter_by(id=post_id).one()
+    increments = {'reply_count': 1}
+    if first_reply:
+        increments.update(answered_count=1, response_seconds=response_seconds(created_at, replied_at))
+    increment_case_statistics(category, urgency, user_id, **increments)
+
+def empty_case_statistics(dimension, key):
+    return CaseStatistics(dimension=dimension, key=key, **dict.fromkeys(CaseStatistics.COUNTERS, 0))
+
+@web_routes.route('/api/stats/summary')
+def case_statistics_summary():
+    """ملخص الحالات من جدول الإحصاءات: الطبيب يرى المجموع حسب التصنيف والأهمية، والممرض حالاته"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مصرح'}), 401
+    
+    if session.get('role') != 'doctor':
+        key = str(session['user_id'])
+        row = db.session.get(CaseStatistics, ('user', key)) or empty_case_statistics('user', key)
+        return jsonify({'total': row.to_dict()})
+    
+    rows = CaseStatistics.query.filter(CaseStatistics.dimension.in_(('all', 'category', 'urgency'))).all()
+    summary = {'total': empty_case_statistics('all', '').to_dict(), 'categories': {}, 'urgency': {}}
+    for row in rows:
+        if row.dimension == 'all':
+            summary['total'] = row.to_dict()
+        else:
+            summary['categories' if row.dimension == 'category' else 'urgency'][row.key] = row.to_dict()
+    return jsonify(summary)
+
 # لوحة تحكم الطبيب
-@app.route('/doctor/dashboard')
+@web_routes.route('/doctor/dashboard')
 def doctor_dashboard():
     if 'user_id' not in session or session['role'] != 'doctor':
         return redirect(url_for('login'))
     
-    # الحصول على جميع منشورات الممرضين
-    posts = Post.query.order_by(Post.created_at.desc()).all()
-
-
- 
+    # عوامل التصفية من الرابط
+    filters = {
+        'status': request.args.get('status', 'all'),
+        'urgency': request.args.get('urgency') if request.args.get('urgency') in URGENCY_LEVELS else None,
+        'category': request.args.get('category') if request.args.get('category') in POST_CATEGORIES else None
+    }
+    answered = {'answered': True, 'unanswered': False}.get(filters['status'])
+    try:
+        image_conditions, metadata_filters = parse_image_metadata_filters(request.args)
+    except ValueError as e:
+        flash(str(e), 'error')
+        image_conditions, metadata_filters = [], {}
+    
+    search_query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    next_cursor = next_page = None
+    if search_query:
+        # نتائج البحث مرتبة حسب الصلة مع ترقيم بالصفحات، وبنفس عوامل التصفية
+        posts, has_more = search_posts(
+            search_query, page,
+            urgency=filters['urgency'],
+            category=filters['category'],
+            answered=answered,
+            image_conditions=image_conditions
+        )
+        next_page = page + 1 if has_more else None
+    else:
+        # صفحة من منشورات الممرضين من الأحدث (وغير المجابة بالأولوية)
+        posts, next_cursor = query_post_feed(
+            cursor=request.args.get('cursor'),
+            urgency=filters['urgency'],
+            category=filters['category'],
+            answered=answered,
+            image_conditions=image_conditions,
+            # غير المجابة تعرض كطابور فرز: الحرجة أولاً ثم الأقدم انتظاراً
+            triage=answered is False
+        )
     
-    return render_template('doctor_dashboard.html', posts=posts)
+    return render_template('doctor_dashboard.html', posts=posts, next_cursor=next_cursor,
+                           search_query=search_query, next_page=next_page,
+                           filters=filters, categories=POST_CATEGORIES, urgency_levels=URGENCY_LEVELS,
+                           metadata_filters=metadata_filters, metadata_options=image_metadata_options())
 
 # إنشاء منشور جديد مع الصور
-@app.route('/create_post', methods=['POST'])
+@imaging_routes.route('/create_post', methods=['POST'])
 def create_post():
     if 'user_id' not in session or session['role'] != 'nurse':
         return jsonify({'success': False, 'error': 'غير مصرح'})
     
+    # المنشور وكل صوره تحفظ في معاملة واحدة: إما أن ينشر كاملاً أو لا ينشر، والملفات التي
+    # كتبت لطلب فشل يحذفها flask gc-uploads إذا لم يستخدمها طلب آخر
     try:
-        # إنشاء المنشور
         title = request.form['title']
         content = request.form['content']
         category = request.form['category']
         urgency = request.form.get('urgency', 'normal')
         
+        # حفظ الملفات أولاً (بالتوازي) قبل بدء الكتابة في قاعدة البيانات حتى تبقى المعاملة قصيرة
+        # شرائح DICOM من نفس السلسلة (ملفات متعددة أو أرشيف zip) تصبح صورة واحدة
+        saved_files = save_uploaded_files(request.files.getlist('medical_images[]'))
+        
         new_post = Post(
             title=title,
             content=content,
             category=category,
             urgency=urgency,
-            user_id=session['user_id']
+            user_id=session['user_id'],
+            priority=urgency_priority(urgency),
+            image_count=len(saved_files)
         )
         
         db.session.add(new_post)
-        db.session.commit()
+        db.session.flush()
+        index_post_for_search(new_post)
+        record_new_post(new_post)
         
-        # رفع الصور إذا وجدت
-        uploaded_images = []
-        if 'medical_images[]' in request.files:
-            files = request.files.getlist('medical_images[]')
-            
-            for file in files:
-                if file and file.filename != '' and allowed_file(file.filename):
-                    saved_file = save_uploaded_file(file, new_post.id, session['user_id'])
-                    
-                    if saved_file:
-                        medical_image = MedicalImage(
-                            filename=saved_file['filename'],
-                            original_filename=saved_file['original_filename'],
-                            file_type=saved_file['file_type'],
-                            file_size=saved_file['file_size'],
-                            preview_filename=saved_file['preview_filename'],
-                            post_id=new_post.id,
-                            user_id=session['user_id']
-                        )
-                        
-                        db.session.add(medical_image)
-                        uploaded_images.append(saved_file['original_filename'])
+        saved_images = []
+        for saved_file in saved_files:
+            medical_image = create_medical_image(saved_file, new_post.id, session['user_id'])
+            db.session.add(medical_image)
+            saved_images.append((medical_image, saved_file))
         
         db.session.commit()
         
-        return jsonify({
-            'success': True, 
-            'post_id': new_post.id,
-            'message': f'تم نشر الاستفسار بنجاح{" مع " + str(len(uploaded_images)) + " صور" if uploaded_images else ""}'
-        })
-        
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)})
+    
+    enqueue_saved_previews(saved_images)
+    
+    return jsonify({
+        'success': True, 
+        'post_id': new_post.id,
+        'message': f'تم نشر الاستفسار بنجاح{" مع " + str(len(saved_images)) + " صور" if saved_images else ""}'
+    })
 
 # الحصول على تفاصيل منشور
-@app.route('/post/<int:post_id>')
+@web_routes.route('/post/<int:post_id>')
 def get_post(post_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    post = Post.query.get_or_404(post_id)
+    post = Post.query.options(joinedload(Post.author)).filter_by(id=post_id).first_or_404()
+    # الردود مع بيانات الأطباء في استعلام واحد بدلاً من استعلام لكل رد
+    replies = query_post_replies(post_id).order_by(Reply.created_at.desc()).all()
     medical_categories = list(medical_procedures.keys())
-    return render_template('post_detail.html', post=post,medical_procedures=medical_procedures,
+    return render_template('post_detail.html', post=post, replies=replies, medical_procedures=medical_procedures,
                          medical_categories=medical_categories)
 
 # إضافة رد من الطبيب
-@app.route('/add_reply', methods=['POST'])
+@web_routes.route('/add_reply', methods=['POST'])
 def add_reply():
     if 'user_id' not in session or session['role'] != 'doctor':
         return jsonify({'success': False, 'error': 'غير مصرح'})
@@ -447,39 +1583,150 @@ def add_reply():
     
     try:
         db.session.add(new_reply)
+        db.session.flush()
+        record_new_reply(new_reply.post_id, new_reply.created_at)
+        index_post_for_search(new_reply.post)
         db.session.commit()
+        invalidate_replies_cache(new_reply.post_id)
+        get_reply_broker().publish(new_reply.post_id, new_reply.to_dict())
         return jsonify({'success': True, 'reply_id': new_reply.id})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)})
 
+# إشعارات الردود الجديدة عبر Server-Sent Events بدلاً من الاستعلام الدوري
+_reply_broker = None
+_reply_broker_lock = threading.Lock()
+
+def get_reply_broker():
+    global _reply_broker
+    with _reply_broker_lock:
+        if _reply_broker is None:
+            _reply_broker = create_broker(current_app.config['REPLY_EVENTS_REDIS_URL'])
+            # عند استخدام Redis تصل أحداث الردود من العمليات الأخرى أيضاً فنلغي نسختنا المخزنة،
+            # وبعد انقطاع الاتصال بـ Redis نلغي كل النسخ لأن أحداث فترة الانقطاع لم تصل
+            _reply_broker.add_listener(lambda post_id, event: invalidate_replies_cache(post_id))
+            _reply_broker.add_reconnect_listener(clear_replies_cache)
+        return _reply_broker
+
+@web_routes.route('/api/post/<int:post_id>/events')
+def post_events(post_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مصرح'}), 401
+    
+    Post.query.get_or_404(post_id)
+    
+    broker = get_reply_broker()
+    subscription = broker.subscribe(post_id)
+    
+    # عند إعادة الاتصال نرسل الردود التي فاتت المتصفح منذ آخر حدث استلمه
+    missed_replies = []
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is not None:
+        missed_replies = [
+            reply.to_dict() for reply in
+            query_post_replies(post_id).filter(Reply.id > last_event_id).order_by(Reply.id)
+        ]
+    db.session.remove()
+    
+    heartbeat = current_app.config['SSE_HEARTBEAT_SECONDS']
+    deadline = time.monotonic() + current_app.config['SSE_STREAM_TIMEOUT']
+    
+    def stream():
+        sent_ids = set()
+        try:
+            yield 'retry: 5000\n\n'
+            for reply in missed_replies:
+                sent_ids.add(reply['id'])
+                yield format_sse(reply, event='reply', event_id=reply['id'])
+            
+            while time.monotonic() < deadline:
+                try:
+                    reply = subscription.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if reply['id'] not in sent_ids:
+                    yield format_sse(reply, event='reply', event_id=reply['id'])
+        finally:
+            broker.unsubscribe(post_id, subscription)
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # منع nginx من تجميع الأحداث قبل إرسالها
+    })
+
 # API للحصول على الردود الخاصة بمنشور
-@app.route('/api/post/<int:post_id>/replies')
+# يتم الاحتفاظ بالاستجابة الجاهزة لكل منشور حتى يضاف رد جديد، ومع ETag/Last-Modified
+# يحصل المتصفح على 304 دون أي استعلام لقاعدة البيانات إذا لم تتغير الردود
+_replies_cache = OrderedDict()
+_replies_cache_lock = threading.Lock()
+# يزداد مع كل إلغاء حتى لا نخزن استجابة قرأت قبل إضافة رد وانتهت بعده
+_replies_cache_generation = 0
+
+def query_post_replies(post_id):
+    return Reply.query.options(joinedload(Reply.doctor)).filter(Reply.post_id == post_id)
+
+def invalidate_replies_cache(post_id):
+    global _replies_cache_generation
+    with _replies_cache_lock:
+        _replies_cache_generation += 1
+        _replies_cache.pop(int(post_id), None)
+
+def clear_replies_cache():
+    global _replies_cache_generation
+    with _replies_cache_lock:
+        _replies_cache_generation += 1
+        _replies_cache.clear()
+
+def get_replies_payload(post_id):
+    """إرجاع (body, etag, last_modified) لردود المنشور من الذاكرة أو من قاعدة البيانات"""
+    # الاشتراك في أحداث الردود قبل تخزين أي نسخة، حتى تلغيها الردود المضافة في العمليات الأخرى
+    get_reply_broker()
+    with _replies_cache_lock:
+        cached = _replies_cache.get(post_id)
+        if cached is not None:
+            _replies_cache.move_to_end(post_id)
+            return cached
+        generation = _replies_cache_generation
+    
+    replies = query_post_replies(post_id).order_by(Reply.created_at, Reply.id).all()
+    if replies:
+        last_modified = max(reply.created_at for reply in replies)
+    else:
+        post = db.session.get(Post, post_id)
+        if post is None:
+            return None
+        last_modified = post.created_at
+    
+    body = json.dumps([reply.to_dict() for reply in replies], ensure_ascii=False).encode('utf-8')
+    payload = (body, hashlib.sha1(body).hexdigest(), last_modified)
+    
+    with _replies_cache_lock:
+        if generation == _replies_cache_generation:
+            _replies_cache[post_id] = payload
+            while len(_replies_cache) > REPLIES_CACHE_SIZE:
+                _replies_cache.popitem(last=False)
+    return payload
+
+@web_routes.route('/api/post/<int:post_id>/replies')
 def get_post_replies(post_id):
     if 'user_id' not in session:
         return jsonify({'error': 'غير مصرح'})
     
-    post = Post.query.get_or_404(post_id)
-    replies = []
-    
-    for reply in post.replies:
-        doctor = User.query.get(reply.doctor_id)
-        replies.append({
-            'id': reply.id,
-            'content': reply.content,
-            'diagnosis': reply.diagnosis,
-            'treatment': reply.treatment,
-            'recommendations': reply.recommendations,
-            'medical_proces':reply.medical_proces,
-            'medical_cate':reply.medical_cate,
-            'created_at': reply.created_at.strftime('%Y-%m-%d %H:%M'),
-            'doctor_name': f"{doctor.first_name} {doctor.last_name}"
-        })
+    payload = get_replies_payload(post_id)
+    if payload is None:
+        abort(404)
     
-    return jsonify(replies)
+    body, etag, last_modified = payload
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 # API للحصول على الصور الخاصة بمنشور
-@app.route('/api/post/<int:post_id>/images')
+@web_routes.route('/api/post/<int:post_id>/images')
 def get_post_images(post_id):
     if 'user_id' not in session:
         return jsonify({'error': 'غير مصرح'}), 401
@@ -489,8 +1736,168 @@ def get_post_images(post_id):
     
     return jsonify(images)
 
+# البحث في الصور حسب بيانات الترويسة (نوع الجهاز، العضو، التاريخ، الأبعاد) من الأحدث
+@web_routes.route('/api/images')
+def search_images():
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مصرح'}), 401
+    
+    try:
+        conditions, metadata_filters = parse_image_metadata_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    query = MedicalImage.query.join(MedicalImage.image_metadata) \
+        .options(contains_eager(MedicalImage.image_metadata)).filter(*conditions)
+    cursor = request.args.get('cursor', type=int)
+    if cursor:
+        query = query.filter(MedicalImage.id < cursor)
+    images = query.order_by(MedicalImage.id.desc()).limit(limit + 1).all()
+    
+    return jsonify({
+        'filters': metadata_filters,
+        'images': [dict(image.to_dict(), post_id=image.post_id) for image in images[:limit]],
+        'next_cursor': images[limit - 1].id if len(images) > limit else None
+    })
+
+# API لمتابعة حالة توليد المعاينة
+@web_routes.route('/api/image/<int:image_id>/status')
+def get_image_status(image_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مصرح'}), 401
+    
+    medical_image = MedicalImage.query.get_or_404(image_id)
+    image_data = medical_image.to_dict()
+    
+    return jsonify({
+        'id': medical_image.id,
+        'preview_status': medical_image.preview_status,
+        'preview_url': image_data['preview_url'],
+        'thumbnails': image_data['thumbnails'],
+        'url': image_data['url'],
+        'attempts': medical_image.preview_attempts,
+        'error': medical_image.preview_error if medical_image.preview_status == PREVIEW_FAILED else None
+    })
+
+# API لعرض شرائح الملفات الحجمية (DICOM/NIFTI)
+_slice_cache = None
+_slice_cache_lock = threading.Lock()
+
+def get_slice_cache():
+    global _slice_cache
+    with _slice_cache_lock:
+        if _slice_cache is None:
+            _slice_cache = imaging.SliceCache(current_app.config['SLICE_CACHE_DIR'],
+                                              current_app.config['SLICE_CACHE_MEMORY'],
+                                              current_app.config['SLICE_CACHE_DISK'])
+        return _slice_cache
+
+def get_volume_image_or_404(image_id):
+    medical_image = MedicalImage.query.get_or_404(image_id)
+    if medical_image.file_type not in VOLUME_FILE_TYPES:
+        abort(400, description='الملف ليس صورة حجمية')
+    
+    file_path = original_file_path(medical_image)
+    extension = medical_image.filename.rsplit('.', 1)[1].lower()
+    return medical_image, file_path, extension
+
+def _float_arg(name):
+    value = request.args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        abort(400, description=f'قيمة غير صالحة للمعامل {name}')
+
+@imaging_routes.route('/api/image/<int:image_id>/slices')
+def get_image_slices(image_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مصرح'}), 401
+    
+    medical_image, file_path, extension = get_volume_image_or_404(image_id)
+    
+    try:
+        axes = imaging.volume_axes(file_path, extension)
+        center, width = imaging.default_window(file_path, extension)
+    except Exception as e:
+        current_app.logger.warning('Cannot read volume for image %s: %s', image_id, e)
+        return jsonify({'error': 'تعذر قراءة الملف'}), 422
+    
+    metadata = {
+        'نوع الملف': medical_image.file_type,
+        'الأبعاد': ' × '.join(str(axes[axis]) for axis in imaging.SLICE_AXES if axis in axes)
+    }
+    if extension == storage.SERIES_EXTENSION:
+        series = imaging.load_series(file_path)[1]
+        metadata['نوع الفحص'] = series['modality']
+        metadata['وصف السلسلة'] = series['series_description']
+        if series['pixel_spacing']:
+            metadata['أبعاد البكسل (مم)'] = ' × '.join(f"{value:g}" for value in series['pixel_spacing'])
+        if series['slice_spacing']:
+            metadata['المسافة بين الشرائح (مم)'] = f"{series['slice_spacing']:g}"
+    
+    return jsonify({
+        'id': medical_image.id,
+        'axes': axes,
+        'window': {'center': center, 'width': width},
+        'presets': {name: {'center': preset_center, 'width': preset_width}
+                    for name, (preset_center, preset_width) in normalization.WINDOW_PRESETS.items()},
+        # مسار الشرائح هو مسار هذه الاستجابة متبوعاً بـ <axis>/<index> (انظر get_image_slice)
+        'slice_url': url_for('get_image_slices', image_id=medical_image.id) + '/',
+        'metadata': metadata
+    })
+
+@imaging_routes.route('/api/image/<int:image_id>/slices/<axis>/<int:index>')
+def get_image_slice(image_id, axis, index):
+    """شريحة PNG مع النافذة (wc/ww أو preset) والحجم (size) المطلوبين"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مصرح'}), 401
+    
+    if axis not in imaging.SLICE_AXES:
+        abort(404)
+    
+    medical_image, file_path, extension = get_volume_image_or_404(image_id)
+    center = _float_arg('wc')
+    width = _float_arg('ww')
+    size = request.args.get('size', type=int)
+    if size:
+        # نفس حدود render_slice، حتى لا ينشئ كل حجم خارجها مدخلاً مستقلاً في الذاكرة المؤقتة
+        size = max(imaging.MIN_SLICE_SIZE, min(size, imaging.MAX_SLICE_SIZE))
+    if width is not None and width <= 0:
+        abort(400, description='عرض النافذة يجب أن يكون موجباً')
+    
+    preset = request.args.get('preset')
+    if preset:
+        # النافذة الجاهزة (رئة، عظم، دماغ...) ما لم يحدد المركز أو العرض صراحة
+        try:
+            preset_center, preset_width = normalization.preset_window(preset)
+        except KeyError:
+            abort(400, description=f'نافذة غير معروفة: {preset}')
+        center = preset_center if center is None else center
+        width = preset_width if width is None else width
+    
+    cache = get_slice_cache()
+    key = imaging.SliceCache.make_key(medical_image.filename, axis, index, center, width, size)
+    data = cache.get(key)
+    if data is None:
+        try:
+            with timed('convert'):
+                data = imaging.render_slice(file_path, extension, axis, index, center, width, size)
+        except IndexError:
+            abort(404)
+        cache.set(key, data)
+    
+    response = make_response(data)
+    response.headers['Content-Type'] = 'image/png'
+    # الملفات المرفوعة لا تتغير، لذلك يمكن للمتصفح الاحتفاظ بالشريحة
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    response.set_etag(key)
+    return response.make_conditional(request)
+
 # رفع صور إضافية لمنشور موجود
-@app.route('/upload_image', methods=['POST'])
+@imaging_routes.route('/upload_image', methods=['POST'])
 def upload_image():
     if 'user_id' not in session or session.get('role') != 'nurse':
         return jsonify({'success': False, 'error': 'غير مصرح'})
@@ -501,38 +1908,618 @@ def upload_image():
     if 'medical_image' not in request.files:
         return jsonify({'success': False, 'error': 'لم يتم اختيار صورة'})
     
-    file = request.files['medical_image']
-    post_id = request.form['post_id']
+    files = request.files.getlist('medical_image')
+    try:
+        post_id = int(request.form['post_id'])
+    except ValueError:
+        return jsonify({'success': False, 'error': 'رقم المنشور غير صالح'}), 400
     
-    if file and file.filename != '' and allowed_file(file.filename):
-        saved_file = save_uploaded_file(file, post_id, session['user_id'])
-        
-        if saved_file:
-            medical_image = MedicalImage(
-                filename=saved_file['filename'],
-                original_filename=saved_file['original_filename'],
-                file_type=saved_file['file_type'],
-                file_size=saved_file['file_size'],
-                preview_filename=saved_file['preview_filename'],
-                post_id=post_id,
-                user_id=session['user_id']
-            )
-            
-            db.session.add(medical_image)
+    post = db.session.get(Post, post_id)
+    if post is None:
+        return jsonify({'success': False, 'error': 'المنشور غير موجود'}), 404
+    if post.user_id != session['user_id']:
+        # لا يضيف الممرض صوراً إلا إلى منشوراته
+        return jsonify({'success': False, 'error': 'غير مصرح'}), 403
+    
+    try:
+        saved_files = save_uploaded_files(files)
+    except zipfile.BadZipFile as e:
+        return jsonify({'success': False, 'error': f'فشل في قراءة الأرشيف: {e}'})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)})
+    
+    if saved_files:
+        saved_images = []
+        try:
+            for saved_file in saved_files:
+                medical_image = create_medical_image(saved_file, post_id, session['user_id'])
+                db.session.add(medical_image)
+                saved_images.append((medical_image, saved_file))
+            record_new_images(post, len(saved_images))
             db.session.commit()
-            
-            return jsonify({
-                'success': True,
-                'image_id': medical_image.id,
-                'filename': medical_image.original_filename,
-                'url': f"/static/uploads/medical_images/{saved_file['filename']}",
-                'preview_url': f"/static/uploads/medical_images/{saved_file['preview_filename']}" if saved_file['preview_filename'] else None
-            })
+        except Exception:
+            db.session.rollback()
+            raise
+        enqueue_saved_previews(saved_images)
+        
+        medical_image, saved_file = saved_images[0]
+        return jsonify({
+            'success': True,
+            'image_id': medical_image.id,
+            'image_ids': [image.id for image, _ in saved_images],
+            'filename': medical_image.original_filename,
+            'url': medical_image.file_url(medical_image.filename),
+            'preview_url': None,
+            'preview_status': medical_image.preview_status,
+            'status_url': url_for('get_image_status', image_id=medical_image.id)
+        })
     
     return jsonify({'success': False, 'error': 'فشل في رفع الملف'})
 
+# الرفع المجزأ القابل للاستئناف
+# يتم كتابة كل جزء مباشرة على القرص مع حساب SHA-256 تدريجياً، فيبقى استهلاك الذاكرة ثابتاً
+# مهما كان حجم الدراسة، ولا يتم إنشاء سجل MedicalImage إلا بعد اكتمال الرفع
+# حالة حساب البصمة لكل جلسة رفع في هذه العملية: upload_id -> (offset, hasher)
+_upload_hashers = {}
+_upload_locks = {}
+_upload_locks_guard = threading.Lock()
+
+def _get_upload_lock(upload_id):
+    with _upload_locks_guard:
+        return _upload_locks.setdefault(upload_id, threading.Lock())
+
+def _get_upload_hasher(upload):
+    """إرجاع كائن SHA-256 متزامن مع ما تم حفظه على القرص
+
+    إذا بدأت الجلسة في عملية أخرى أو أعيد تشغيل الخادم نعيد حساب البصمة
+    من الجزء المحفوظ على دفعات صغيرة.
+    """
+    cached = _upload_hashers.get(upload.id)
+    if cached and cached[0] == upload.offset:
+        return cached[1]
+    
+    hasher = hashlib.sha256()
+    remaining = upload.offset
+    with open(upload.part_path, 'rb') as f:
+        while remaining > 0:
+            block = f.read(min(UPLOAD_CHUNK_READ_SIZE, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+def _discard_upload(upload):
+    _upload_hashers.pop(upload.id, None)
+    if os.path.exists(upload.part_path):
+        os.remove(upload.part_path)
+    db.session.delete(upload)
+
+def _finalize_upload(upload, hasher):
+    """نقل الملف المكتمل إلى اسمه النهائي وإنشاء سجل الصورة الطبية"""
+    digest = hasher.hexdigest()
+    if upload.checksum and upload.checksum.lower() != digest:
+        _discard_upload(upload)
+        db.session.commit()
+        return None, 'بصمة الملف لا تطابق البيانات المرفوعة'
+    
+    if upload.extension in SERIES_ARCHIVE_EXTENSIONS:
+        # أرشيف سلاسل DICOM: نبني حجماً لكل سلسلة ثم نحذف الأرشيف
+        try:
+            with zipfile.ZipFile(upload.part_path) as archive:
+                saved_files = save_dicom_sources(archive_sources(archive))
+        except (zipfile.BadZipFile, ValueError) as e:
+            _discard_upload(upload)
+            db.session.commit()
+            return None, f'فشل في قراءة الأرشيف: {e}'
+        os.remove(upload.part_path)
+        if not saved_files:
+            db.session.delete(upload)
+            db.session.commit()
+            return None, 'لا يحتوي الأرشيف على صور DICOM'
+        return _create_upload_images(upload, saved_files)
+    
+    # إذا كان المحتوى مخزناً مسبقاً نحذف الجزء المرفوع ونعيد استخدام الملف ومعاينته
+    existing = find_stored_file(digest)
+    if existing:
+        os.remove(upload.part_path)
+        saved_file = stored_file_info(existing, upload.original_filename, upload.extension)
+    else:
+        filename = content_filename(digest, upload.extension)
+        os.replace(upload.part_path, os.path.join(UPLOAD_FOLDER, filename))
+        saved_file = {
+            'filename': filename,
+            'file_path': os.path.join(UPLOAD_FOLDER, filename),
+            'extension': upload.extension,
+            'file_type': ALLOWED_EXTENSIONS[upload.extension],
+            'file_size': upload.total_size,
+            'sha256': digest,
+            'preview_filename': None,
+            'thumbnail_format': None,
+            'preview_status': PREVIEW_PENDING if upload.extension in PREVIEW_EXTENSIONS else PREVIEW_NONE,
+            'reused': False
+        }
+    saved_file['original_filename'] = upload.original_filename
+    return _create_upload_images(upload, [saved_file])
+
+def _create_upload_images(upload, saved_files):
+    saved_images = []
+    for saved_file in saved_files:
+        medical_image = create_medical_image(saved_file, upload.post_id, upload.user_id)
+        db.session.add(medical_image)
+        saved_images.append((medical_image, saved_file))
+    record_new_images(db.session.get(Post, upload.post_id), len(saved_images))
+    db.session.flush()
+    upload.medical_image_id = saved_images[0][0].id
+    db.session.commit()
+    _upload_hashers.pop(upload.id, None)
+    
+    enqueue_saved_previews(saved_images)
+    return saved_images[0][0], None
+
+@imaging_routes.route('/api/uploads', methods=['POST'])
+def create_upload_session():
+    if 'user_id' not in session or session.get('role') != 'nurse':
+        return jsonify({'success': False, 'error': 'غير مصرح'}), 401
+    
+    data = request.get_json(silent=True) or request.form
+    original_filename = secure_filename(data.get('filename', ''))
+    
+    if not original_filename or not allowed_file(original_filename):
+        return jsonify({'success': False, 'error': 'نوع الملف غير مدعوم'}), 400
+    
+    try:
+        total_size = int(data.get('size', 0))
+        post_id = int(data.get('post_id', 0))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'بيانات الرفع غير صالحة'}), 400
+    
+    if total_size <= 0 or total_size > current_app.config['MAX_UPLOAD_SIZE']:
+        return jsonify({'success': False, 'error': 'حجم الملف غير مسموح'}), 413
+    
+    post = db.session.get(Post, post_id)
+    if post is None:
+        return jsonify({'success': False, 'error': 'المنشور غير موجود'}), 404
+    if post.user_id != session['user_id']:
+        # لا يضيف الممرض صوراً إلا إلى منشوراته
+        return jsonify({'success': False, 'error': 'غير مصرح'}), 403
+    
+    extension = original_filename.rsplit('.', 1)[1].lower()
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        original_filename=original_filename,
+        extension=extension,
+        total_size=total_size,
+        checksum=data.get('checksum') or None,
+        post_id=post_id,
+        user_id=session['user_id']
+    )
+    # نضيف جزءاً من معرّف الجلسة لتجنب تطابق أسماء الملفات المرفوعة في نفس الثانية
+    upload.filename = make_unique_filename(extension, post_id, session['user_id'],
+                                           suffix=f"_{upload.id[:8]}")
+    
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    open(upload.part_path, 'wb').close()
+    
+    db.session.add(upload)
+    db.session.commit()
+    
+    response = jsonify({'success': True, **upload.to_dict()})
+    response.status_code = 201
+    response.headers['Location'] = upload.to_dict()['upload_url']
+    return response
+
+@imaging_routes.route('/api/uploads/<upload_id>', methods=['HEAD', 'GET', 'PATCH', 'DELETE'])
+def upload_session(upload_id):
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'غير مصرح'}), 401
+    
+    upload = db.session.get(UploadSession, upload_id)
+    if upload is None or upload.user_id != session['user_id']:
+        return jsonify({'success': False, 'error': 'جلسة الرفع غير موجودة'}), 404
+    
+    if request.method in ('HEAD', 'GET'):
+        # يستخدمها العميل لمعرفة نقطة الاستئناف
+        response = jsonify({'success': True, **upload.to_dict()})
+        response.headers['Upload-Offset'] = str(upload.offset)
+        response.headers['Upload-Length'] = str(upload.total_size)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    
+    if request.method == 'DELETE':
+        if upload.is_complete:
+            return jsonify({'success': False, 'error': 'اكتمل الرفع بالفعل'}), 409
+        _discard_upload(upload)
+        db.session.commit()
+        return jsonify({'success': True})
+    
+    with _get_upload_lock(upload.id):
+        db.session.refresh(upload)
+        if upload.is_complete:
+            return jsonify({'success': False, 'error': 'اكتمل الرفع بالفعل', **upload.to_dict()}), 409
+        
+        try:
+            client_offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Upload-Offset مطلوب'}), 400
+        
+        if client_offset != upload.offset:
+            # العميل غير متزامن مع الخادم، عليه الاستعلام عن الموضع الحالي والمتابعة منه
+            return jsonify({'success': False, 'error': 'موضع الجزء غير صحيح', **upload.to_dict()}), 409
+        
+        hasher = _get_upload_hasher(upload)
+        remaining = upload.total_size - upload.offset
+        written = 0
+        try:
+            with open(upload.part_path, 'r+b') as f:
+                f.seek(upload.offset)
+                while remaining > 0:
+                    block = request.stream.read(min(UPLOAD_CHUNK_READ_SIZE, remaining))
+                    if not block:
+                        break
+                    f.write(block)
+                    hasher.update(block)
+                    written += len(block)
+                    remaining -= len(block)
+        finally:
+            # نحفظ ما تم استلامه حتى لو انقطع الاتصال في منتصف الجزء
+            upload.offset += written
+            _upload_hashers[upload.id] = (upload.offset, hasher)
+            db.session.commit()
+        
+        if upload.offset < upload.total_size:
+            response = jsonify({'success': True, **upload.to_dict()})
+            response.headers['Upload-Offset'] = str(upload.offset)
+            return response
+        
+        try:
+            medical_image, error = _finalize_upload(upload, hasher)
+        except Exception:
+            db.session.rollback()
+            raise
+        if error:
+            return jsonify({'success': False, 'error': error}), 422
+        
+        response = jsonify({
+            'success': True,
+            **upload.to_dict(),
+            'filename': medical_image.original_filename,
+            'url': medical_image.file_url(medical_image.filename),
+            'preview_status': medical_image.preview_status,
+            'status_url': url_for('get_image_status', image_id=medical_image.id)
+        })
+        response.headers['Upload-Offset'] = str(upload.offset)
+        return response
+
+@cli.command('cleanup-uploads')
+def cleanup_uploads():
+    """حذف جلسات الرفع غير المكتملة التي انتهت صلاحيتها"""
+    expired_before = datetime.utcnow() - current_app.config['UPLOAD_SESSION_TTL']
+    expired = UploadSession.query.filter(
+        UploadSession.medical_image_id.is_(None),
+        UploadSession.created_at < expired_before
+    ).all()
+    for upload in expired:
+        _discard_upload(upload)
+    db.session.commit()
+    print(f"تم حذف {len(expired)} جلسة رفع منتهية")
+
+@cli.command('requeue-previews')
+def requeue_previews():
+    """إعادة إرسال الصور العالقة في pending أو retrying إلى طابور المعاينات
+
+    الطابور في ذاكرة عمليات الخادم، فالمهام التي لم تنته عند إعادة تشغيله أو توقفه
+    تبقى بهذه الحالة. الأمر ينتظر حتى تنتهي كل المعاينات ويسجل نتائجها.
+    """
+    stuck = MedicalImage.query.options(joinedload(MedicalImage.post)).filter(
+        MedicalImage.preview_status.in_([PREVIEW_PENDING, PREVIEW_RETRYING])
+    ).order_by(MedicalImage.id).all()
+    
+    # الملفات المكررة تحول مرة واحدة بأعلى أولوية بين منشوراتها، وتحدث كل سجلاتها عند الانتهاء
+    by_filename = {}
+    for medical_image in stuck:
+        by_filename.setdefault(medical_image.filename, []).append(medical_image)
+    for filename, medical_images in by_filename.items():
+        medical_image = min(medical_images, key=lambda medical_image: medical_image.post.priority)
+        enqueue_preview(medical_image.id, os.path.join(UPLOAD_FOLDER, filename),
+                        filename.rsplit('.', 1)[-1].lower(), filename, medical_image.post.priority)
+    db.session.remove()
+    
+    wait_for_previews()
+    failed = MedicalImage.query.filter(
+        MedicalImage.id.in_([medical_image.id for medical_image in stuck]),
+        MedicalImage.preview_status == PREVIEW_FAILED
+    ).count()
+    get_preview_executor().shutdown()
+    print(f"تمت إعادة توليد المعاينات لـ {len(by_filename)} ملف ({failed} صورة فشل تحويلها)")
+
+@cli.command('generate-thumbnails')
+def generate_thumbnails():
+    """توليد الصور المصغرة للصور المرفوعة قبل إضافتها"""
+    missing = MedicalImage.query.filter(
+        MedicalImage.thumbnail_format.is_(None),
+        MedicalImage.preview_status.in_([PREVIEW_READY, PREVIEW_NONE])
+    ).all()
+    
+    generated = 0
+    by_filename = {}
+    for medical_image in missing:
+        by_filename.setdefault(medical_image.filename, []).append(medical_image)
+    for filename, medical_images in by_filename.items():
+        # الملفات الحجمية نصغر معاينتها، والصور النقطية نصغر الملف نفسه
+        source = medical_images[0].preview_filename or filename
+        if medical_images[0].file_type in VOLUME_FILE_TYPES and not medical_images[0].preview_filename:
+            continue
+        try:
+            thumbnail_format = imaging.build_thumbnails(os.path.join(UPLOAD_FOLDER, source), filename)
+        except Exception as e:
+            current_app.logger.warning('Cannot build thumbnails for %s: %s', filename, e)
+            continue
+        for medical_image in medical_images:
+            medical_image.thumbnail_format = thumbnail_format
+            if medical_image.preview_status == PREVIEW_NONE:
+                medical_image.preview_status = PREVIEW_READY
+        generated += 1
+    db.session.commit()
+    print(f"تم توليد الصور المصغرة لـ {generated} ملف")
+
+@cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """إعادة بناء فهرس البحث لكل المنشورات (بعد تغيير قواعد التطبيع مثلاً)"""
+    index = get_search_index()
+    connection = db.session.connection()
+    index.drop(connection)
+    index.create(connection)
+    
+    count = 0
+    for post in Post.query.options(db.selectinload(Post.replies)).yield_per(500):
+        index.index_post(connection, post.id, post.title, post.content, replies_search_text(post.replies))
+        count += 1
+    db.session.commit()
+    print(f"تمت فهرسة {count} منشور")
+
+@cli.command('rebuild-case-statistics')
+@click.option('--check', is_flag=True, help='عرض الفروق دون تصحيحها (رمز الخروج 1 عند وجودها)')
+def rebuild_case_statistics(check):
+    """إعادة حساب عدادات المنشورات وجدول الإحصاءات من الردود والصور ومقارنتها بالمخزنة"""
+    reply_stats = db.select(
+        Reply.post_id, func.count(Reply.id).label('replies'), func.min(Reply.created_at).label('first_reply_at')
+    ).group_by(Reply.post_id).subquery()
+    image_stats = db.select(MedicalImage.post_id, func.count(MedicalImage.id).label('images')) \
+        .group_by(MedicalImage.post_id).subquery()
+    rows = db.session.query(
+        Post.id, Post.category, Post.urgency, Post.user_id, Post.created_at,
+        Post.reply_count, Post.image_count, Post.first_reply_at,
+        func.coalesce(reply_stats.c.replies, 0), reply_stats.c.first_reply_at,
+        func.coalesce(image_stats.c.images, 0)
+    ).outerjoin(reply_stats, reply_stats.c.post_id == Post.id) \
+        .outerjoin(image_stats, image_stats.c.post_id == Post.id).order_by(Post.id)
+    
+    post_fixes = []
+    expected = {}
+    for (post_id, category, urgency, user_id, created_at, reply_count, image_count, first_reply_at,
+         replies, first_reply, images) in rows.yield_per(1000):
+        if (reply_count, image_count, first_reply_at) != (replies, images, first_reply):
+            post_fixes.append({'id': post_id, 'reply_count': replies, 'image_count': images,
+                               'first_reply_at': first_reply})
+        for statistics_key in case_statistics_keys(category, urgency, user_id):
+            counters = expected.setdefault(statistics_key, dict.fromkeys(CaseStatistics.COUNTERS, 0))
+            counters['post_count'] += 1
+            counters['reply_count'] += replies
+            counters['image_count'] += images
+            if first_reply:
+                counters['answered_count'] += 1
+                counters['response_seconds'] += response_seconds(created_at, first_reply)
+    
+    stored = {(row.dimension, row.key): row for row in CaseStatistics.query.all()}
+    # مجموع الثواني عدد عشري يتراكم بترتيب مختلف، فيقارن بفارق ثانية
+    stale_keys = [
+        statistics_key for statistics_key in expected.keys() | stored.keys()
+        if statistics_key not in expected or statistics_key not in stored
+        or any(abs(getattr(stored[statistics_key], name) - value) > (1 if name == 'response_seconds' else 0)
+               for name, value in expected[statistics_key].items())
+    ]
+    print(f"عدادات غير مطابقة: {len(post_fixes)} منشور و {len(stale_keys)} صف إحصاءات")
+    if check:
+        if post_fixes or stale_keys:
+            raise SystemExit(1)
+        return
+    
+    if post_fixes:
+        db.session.execute(db.update(Post), post_fixes)
+    CaseStatistics.query.delete()
+    db.session.add_all(CaseStatistics(dimension=dimension, key=key, **counters)
+                       for (dimension, key), counters in expected.items())
+    db.session.commit()
+    total = expected.get(('all', ''), {}).get('post_count', 0)
+    print(f"تمت إعادة حساب الإحصاءات لـ {total} منشور")
+
+@cli.command('backfill-image-metadata')
+def backfill_image_metadata():
+    """استخراج بيانات الترويسة للصور المرفوعة قبل إضافة جدول البيانات"""
+    missing = MedicalImage.query.outerjoin(MedicalImage.image_metadata) \
+        .filter(ImageMetadata.id.is_(None)).order_by(MedicalImage.id).all()
+    
+    # الملفات المكررة تشترك في نفس الملف، فتقرأ الترويسة مرة واحدة لكل ملف
+    headers = {}
+    count = failed = 0
+    for medical_image in missing:
+        if medical_image.filename not in headers:
+            extension = medical_image.filename.rsplit('.', 1)[-1].lower()
+            try:
+                headers[medical_image.filename] = imaging.read_metadata(
+                    original_file_path(medical_image), extension)
+            except Exception as e:
+                current_app.logger.warning('Cannot read metadata for %s: %s', medical_image.filename, e)
+                headers[medical_image.filename] = None
+                failed += 1
+        
+        if headers[medical_image.filename]:
+            medical_image.image_metadata = ImageMetadata.from_header(headers[medical_image.filename])
+            count += 1
+            if count % 100 == 0:
+                db.session.commit()
+    
+    db.session.commit()
+    print(f"تم استخراج بيانات {count} صورة، وتعذرت قراءة {failed} ملف")
+
+@cli.command('gc-uploads')
+def gc_uploads():
+    """حذف الملفات المخزنة حسب المحتوى التي لم يعد أي سجل MedicalImage يشير إليها"""
+    references = dict(db.session.query(MedicalImage.filename, func.count(MedicalImage.id))
+                      .group_by(MedicalImage.filename).all())
+    previews = {name for (name,) in db.session.query(MedicalImage.preview_filename).distinct() if name}
+    # ملف بيانات السلسلة (.json) يتبع ملف الحجم (.npy) الذي بنفس الاسم
+    previews.update(os.path.basename(storage.series_metadata_path(name))
+                    for name in references if name.endswith(f".{storage.SERIES_EXTENSION}"))
+    for name, thumbnail_format in db.session.query(MedicalImage.filename, MedicalImage.thumbnail_format).distinct():
+        if thumbnail_format:
+            previews.update(storage.thumbnail_filename(name, size, thumbnail_format)
+                            for size in storage.THUMBNAIL_SIZES)
+    
+    # نتجاهل الملفات الحديثة جداً لأنها قد تكون في منتصف عملية رفع لم تحفظ بعد
+    recent = time.time() - 3600
+    removed = 0
+    for entry in os.scandir(UPLOAD_FOLDER):
+        name = entry.name
+        if not entry.is_file() or len(name) < 64 or not all(c in '0123456789abcdef' for c in name[:64]):
+            continue
+        if name.endswith('.part') or entry.stat().st_mtime > recent:
+            continue
+        if references.get(name, 0) == 0 and name not in previews:
+            os.remove(entry.path)
+            removed += 1
+    
+    # الملفات المؤرشفة التي لم يعد سجل يشير إليها بنفس طريقة الضغط
+    archived = {os.path.basename(storage.archive_path(name, archive_format))
+                for name, archive_format in db.session.query(MedicalImage.filename, MedicalImage.archive_format)
+                .filter(MedicalImage.archive_format.isnot(None)).distinct()}
+    if os.path.isdir(storage.ARCHIVE_FOLDER):
+        for entry in os.scandir(storage.ARCHIVE_FOLDER):
+            if entry.is_file() and entry.name not in archived and entry.stat().st_mtime <= recent:
+                os.remove(entry.path)
+                removed += 1
+    print(f"تم حذف {removed} ملف غير مستخدم")
+
+@cli.command('archive-uploads')
+def archive_uploads():
+    """ضغط الملفات الأصلية القديمة في مجلد الأرشيف وحذف النسخ المفكوكة غير المستخدمة
+
+    يشغل دورياً (cron). الملف المشترك بين عدة سجلات يؤرشف عندما يصبح أحدث رفع له أقدم
+    من ARCHIVE_AFTER_DAYS، ولا يحذف من مجلد الرفع إلا بعد حفظ السجلات.
+    """
+    methods = {'dcm': current_app.config['ARCHIVE_DICOM_COMPRESSION'], 'nii': current_app.config['ARCHIVE_NIFTI_COMPRESSION']}
+    for extension, method in methods.items():
+        if method not in tiering.ARCHIVE_EXTENSIONS[extension]:
+            raise click.UsageError(f"Unknown archive compression for .{extension}: {method}")
+        if not tiering.method_available(method):
+            raise click.UsageError(f"Archive compression {method} is not installed")
+    
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['ARCHIVE_AFTER_DAYS'])
+    # الملفات التي ما زالت في طابور المعاينات تبقى حتى ينتهي تحويلها
+    pending = db.session.query(MedicalImage.filename).filter(
+        MedicalImage.preview_status.in_([PREVIEW_PENDING, PREVIEW_RETRYING]))
+    candidates = db.session.query(MedicalImage.filename).filter(
+        MedicalImage.archive_format.is_(None),
+        MedicalImage.filename.notin_(pending)
+    ).group_by(MedicalImage.filename).having(func.max(MedicalImage.upload_date) < cutoff).all()
+    
+    archived = skipped = 0
+    saved_bytes = 0
+    for (filename,) in candidates:
+        method = tiering.archive_method(filename.rsplit('.', 1)[-1].lower(),
+                                        methods['dcm'], methods['nii'])
+        file_path = os.path.join(UPLOAD_FOLDER, filename)
+        if method is None or not os.path.exists(file_path):
+            continue
+        try:
+            archived_size = tiering.archive_file(file_path, filename, method)
+        except Exception as e:
+            current_app.logger.warning('Cannot archive %s: %s', filename, e)
+            archived_size = None
+        if archived_size is None:
+            skipped += 1
+            continue
+        
+        values = {'archive_format': method, 'archived_size': archived_size, 'archived_at': datetime.utcnow()}
+        MedicalImage.query.filter_by(filename=filename).update(values, synchronize_session=False)
+        db.session.commit()
+        saved_bytes += os.path.getsize(file_path) - archived_size
+        os.remove(file_path)
+        # رفع مكرر لنفس الملف بين الحفظ والحذف يكون قد نسخ بيانات الملف قبل أرشفته
+        MedicalImage.query.filter_by(filename=filename, archive_format=None).update(values, synchronize_session=False)
+        db.session.commit()
+        archived += 1
+    
+    # النسخ المفكوكة من الأرشيف في مجلد الرفع (الطبقة الساخنة)
+    hot_files = [os.path.join(UPLOAD_FOLDER, filename) for (filename,) in
+                 db.session.query(MedicalImage.filename).filter(MedicalImage.archive_format.isnot(None)).distinct()]
+    evicted, freed = tiering.evict_hot_copies(hot_files,
+                                              current_app.config['ARCHIVE_HOT_TTL'].total_seconds(),
+                                              current_app.config['ARCHIVE_HOT_CACHE_SIZE'])
+    print(f"تمت أرشفة {archived} ملف (توفير {saved_bytes / 1024 / 1024:.1f} MB) وتجاوز {skipped} ملف، "
+          f"وحذف {evicted} نسخة مفكوكة ({freed / 1024 / 1024:.1f} MB)")
+
+# تسليم الملفات الطبية (الأصل والمعاينة والصور المصغرة) بعد التحقق من تسجيل الدخول
+# مجلد الرفع داخل static، فنمنع الوصول المباشر إليه حتى لا يكفي معرفة الرابط
+def block_direct_upload_access():
+    if request.endpoint == 'static':
+        filename = os.path.normpath((request.view_args or {}).get('filename', '')).replace(os.sep, '/')
+        if filename.lstrip('/').startswith('uploads/'):
+            abort(404)
+
+@web_routes.route('/media/<int:image_id>/<filename>')
+def serve_medical_file(image_id, filename):
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مصرح'}), 401
+    
+    medical_image = MedicalImage.query.get_or_404(image_id)
+    
+    # لا يسمح إلا بالملفات التابعة لهذه الصورة
+    if filename == medical_image.filename:
+        # بصمة المحتوى تصلح كـ ETag قوي للملف الأصلي. ملف DICOM المستعاد من الأرشيف يطابق
+        # الأصل في البكسلات لا في البايتات (يعاد بصيغة نقل غير مضغوطة)، فيتغير الـ ETag
+        # حتى لا تخلط طلبات Range بين النسختين
+        etag = medical_image.sha256 or filename
+        if medical_image.archive_format in storage.DICOM_ARCHIVE_METHODS:
+            etag = f"{etag}-{medical_image.archive_format}"
+        download_name = medical_image.original_filename
+        file_path = original_file_path(medical_image)
+    elif filename == medical_image.preview_filename or filename in medical_image.thumbnail_filenames().values():
+        etag = filename
+        download_name = None
+        file_path = os.path.join(UPLOAD_FOLDER, filename)
+    else:
+        abort(404)
+    
+    if not os.path.isfile(file_path):
+        abort(404)
+    
+    accel_prefix = current_app.config['MEDIA_ACCEL_REDIRECT_PREFIX']
+    offload = bool(accel_prefix or current_app.config['USE_X_SENDFILE'])
+    # عند التحويل للخادم الأمامي يرسل هو البايتات ويتولى طلبات Range، ونكتفي هنا بالترويسات و 304،
+    # وإلا يدعم send_file طلبات Range (206) و If-None-Match/If-Range بالـ ETag
+    response = send_file(os.path.abspath(file_path), request.environ, download_name=download_name,
+                         etag=etag, conditional=not offload, use_x_sendfile=offload,
+                         response_class=current_app.response_class)
+    if accel_prefix:
+        del response.headers['X-Sendfile']
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{filename}"
+    else:
+        response.accept_ranges = 'bytes'
+    
+    # الملف مرتبط بمستخدم مسجل، فلا تحتفظ به الخوادم الوسيطة المشتركة
+    response.cache_control.public = False
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['MEDIA_MAX_AGE']
+    response.cache_control.immutable = True
+    if offload:
+        response = response.make_conditional(request)
+    return response
+
 # عرض صورة طبية
-@app.route('/view_medical_image/<int:image_id>')
+@web_routes.route('/view_medical_image/<int:image_id>')
 def view_medical_image(image_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -546,6 +2533,40 @@ def view_medical_image(image_id):
     
     return render_template('view_image.html', image=medical_image)
 
+def create_app(profile=None, config=None):
+    """إنشاء التطبيق حسب ملف التشغيل (APP_PROFILE: full أو web)
+
+    لا يتصل بقاعدة البيانات ولا يحمل مكتبات الصور، فتشغيل العملية سريع. عمليات الويب
+    الخفيفة تشغل بـ gunicorn "app:create_app('web')"، و flask يستخدم create_app() تلقائياً.
+    """
+    profile = profile or os.environ.get('APP_PROFILE', 'full')
+    if profile not in APP_PROFILES:
+        raise ValueError(f"Unknown app profile: {profile}")
+    
+    app = Flask(__name__)
+    configure_app(app)
+    app.config['APP_PROFILE'] = profile
+    app.config.update(config or {})
+    
+    db.init_app(app)
+    # عمليات web لا تشغل أوامر flask db، فلا تحمل alembic
+    if profile == 'full':
+        init_migrations(app)
+    
+    request_started.connect(start_request_timings, app)
+    before_render_template.connect(start_render_timer, app)
+    template_rendered.connect(stop_render_timer, app)
+    request_finished.connect(record_request_timings, app)
+    
+    app.before_request(block_direct_upload_access)
+    for group in APP_PROFILES[profile]:
+        ROUTE_GROUPS[group].register(app)
+    for command in cli.commands.values():
+        app.cli.add_command(command)
+    return app
+
 if __name__ == '__main__':
+    app = create_app()
+    upgrade_database(app)
     app.run(host="0.0.0.0", port=5000,debug=True)
 
@@ -0,0 +1,659 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+from http.cookiejar import CookieJar
+from datetime import datetime
+import urllib.request
+import urllib.error
+import argparse
+import platform
+import subprocess
+import tempfile
+import threading
+import shutil
+import gzip
+import json
+import time
+import uuid
+import sys
+import io
+import os
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# قياس أداء المسارات الأكثر استخداماً: إنشاء المنشورات، رفع الصور، توليد المعاينات،
+# لوحة تحكم الطبيب وردود المنشور، ووقت تشغيل عملية جديدة وذاكرتها لكل ملف تشغيل (full/web)
+# كل مسار يقاس مرتين: عبر Flask test client بالتتابع (مع عدد استعلامات SQL لكل طلب)،
+# وعبر HTTP بعدة اتصالات متزامنة على خادم werkzeug محلي
+# التطبيق يعمل على قاعدة بيانات ومجلد رفع مؤقتين، لذلك تضبط البيئة قبل استيراد app
+# ويشغل الملف مباشرة وليس كأمر flask:
+#   python benchmark.py --iterations 50 --concurrency 8 --baseline benchmarks/<نتيجة سابقة>.json
+# الأرقام مخصصة للمقارنة بين الإصدارات على نفس الجهاز، وليست أداء خادم الإنتاج
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = 'benchmark'
+
+# UID بطول ثابت يستبدل جزؤه الأخير برقم التكرار في كل نسخة من ملف DICOM
+UID_ROOT = '1.2.826.0.1.3680043.8.498.'
+UID_PLACEHOLDER = UID_ROOT + '9' * 16
+
+# يشغل في عملية Python جديدة لكل قياس: استيراد app وإنشاء التطبيق ثم أول طلب (صفحة الدخول)
+# الذاكرة من VmHWM لأن ru_maxrss في Linux يبقى من العملية الأم بعد exec
+STARTUP_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+application = app.create_app(sys.argv[1])
+created = time.perf_counter() - started
+status = application.test_client().get('/login').status_code
+first_request = time.perf_counter() - started
+rss_mb = None
+try:
+    with open('/proc/self/status') as f:
+        rss_mb = next(int(line.split()[1]) / 1024 for line in f if line.startswith('VmHWM:'))
+except OSError:
+    pass
+print(json.dumps({
+    'create_app': created, 'first_request': first_request, 'status': status, 'rss_mb': rss_mb,
+    'imaging_modules': [name for name in ('numpy', 'PIL', 'pydicom', 'nibabel') if name in sys.modules]
+}))
+'''
+STARTUP_PROFILES = ('full', 'web')
+
+BenchRequest = namedtuple('BenchRequest', 'method path data files')
+Scenario = namedtuple('Scenario', 'name role build')
+
+
+# بيانات اصطناعية
+def synthetic_volume(shape, seed=0):
+    """حجم CT اصطناعي بوحدات HU (هواء، أنسجة رخوة، عظم) مع ضجيج، بالشكل (شرائح، صفوف، أعمدة)"""
+    rng = np.random.default_rng(seed)
+    slices, rows, columns = shape
+    volume = np.empty(shape, dtype=np.int16)
+    y, x = np.ogrid[-1:1:rows * 1j, -1:1:columns * 1j]
+    for index in range(slices):
+        z = 2 * index / max(slices - 1, 1) - 1 if slices > 1 else 0
+        radius = np.sqrt(x ** 2 + y ** 2 + z ** 2)
+        image_slice = np.where(radius < 0.75, 40, -1000)
+        image_slice[(radius >= 0.75) & (radius < 0.85)] = 700
+        volume[index] = image_slice + rng.normal(0, 20, (rows, columns))
+    return volume
+
+
+def synthetic_dicom(shape, seed=0):
+    """ملف DICOM اصطناعي (متعدد الإطارات إذا كان عدد الشرائح أكثر من 1)
+
+    تعيد دالة variant(index) تنتج نسخة بـ SOPInstanceUID مختلف لكل تكرار، حتى لا
+    يعيد التخزين بحسب المحتوى استخدام ملف سابق، دون إعادة توليد البيانات.
+    """
+    import pydicom
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+    volume = synthetic_volume(shape, seed)
+    slices, rows, columns = shape
+
+    meta = FileMetaDataset()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    meta.MediaStorageSOPClassUID = pydicom.uid.CTImageStorage
+    meta.MediaStorageSOPInstanceUID = UID_PLACEHOLDER
+
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = UID_PLACEHOLDER
+    ds.StudyInstanceUID = generate_uid()
+    ds.SeriesInstanceUID = generate_uid()
+    ds.Modality = 'CT'
+    ds.PatientName = 'Benchmark^Phantom'
+    ds.Rows, ds.Columns = rows, columns
+    if slices > 1:
+        ds.NumberOfFrames = slices
+    ds.PixelSpacing = [0.7, 0.7]
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.BitsAllocated = 16
+    ds.BitsStored = 12
+    ds.HighBit = 11
+    ds.PixelRepresentation = 0
+    # القيم المخزنة موجبة والتحويل إلى HU عبر RescaleIntercept كما في أغلب أجهزة CT
+    ds.RescaleIntercept = -1024
+    ds.RescaleSlope = 1
+    ds.WindowCenter = 40
+    ds.WindowWidth = 400
+    ds.PixelData = np.clip(volume.astype(np.int32) + 1024, 0, 4095).astype(np.uint16).tobytes()
+
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+    data = buffer.getvalue()
+
+    def variant(index):
+        return data.replace(UID_PLACEHOLDER.encode(), f"{UID_ROOT}{index:016d}".encode())
+    return variant
+
+
+def synthetic_nifti(shape, seed=0):
+    """ملف NIfTI مضغوط (nii.gz) اصطناعي
+
+    تعيد دالة variant(index). كل نسخة تضيف عضو gzip صغيراً في نهاية الملف، فيتغير
+    المحتوى دون إعادة الضغط، ويتجاهل nibabel البايتات بعد نهاية بيانات الصورة.
+    """
+    import nibabel as nib
+
+    # nibabel يرتب المحاور (x, y, z)
+    volume = synthetic_volume(shape, seed).transpose(2, 1, 0)
+    image = nib.Nifti1Image(volume, np.diag([0.7, 0.7, 1.0, 1.0]))
+    data = gzip.compress(image.to_bytes(), compresslevel=6)
+
+    def variant(index):
+        return data + gzip.compress(f"{index:016d}".encode())
+    return variant
+
+
+def parse_shape(value):
+    """'64x256x256' -> (64, 256, 256)، والصيغة '512x512' تعني شريحة واحدة"""
+    shape = tuple(int(part) for part in value.lower().split('x'))
+    if len(shape) == 2:
+        shape = (1,) + shape
+    if len(shape) != 3 or min(shape) < 1:
+        raise argparse.ArgumentTypeError(f"invalid shape: {value}")
+    return shape
+
+
+# القياس
+def peak_rss_mb():
+    """أعلى استهلاك للذاكرة في العملية الحالية حتى الآن (None إذا لم يكن متاحاً)"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss بالكيلوبايت في Linux وبالبايت في macOS
+    return round(usage / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def summarize(latencies, elapsed, errors):
+    latencies = np.asarray(latencies, dtype=np.float64) * 1000
+    if not latencies.size:
+        return {'requests': 0, 'errors': errors}
+    p50, p95, p99 = np.percentile(latencies, (50, 95, 99))
+    return {
+        'requests': int(latencies.size),
+        'errors': errors,
+        'throughput': round(latencies.size / elapsed, 2) if elapsed else None,
+        'mean_ms': round(float(latencies.mean()), 2),
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+        'max_ms': round(float(latencies.max()), 2)
+    }
+
+
+def is_failure(status, content_type, body):
+    """أغلب المسارات تعيد 200 مع success=false عند الفشل"""
+    if status >= 400:
+        return True
+    if content_type == 'application/json':
+        try:
+            return json.loads(body).get('success') is False
+        except (ValueError, AttributeError):
+            return False
+    return False
+
+
+class QueryCounter:
+    """عدد الاستعلامات المرسلة إلى قاعدة البيانات من خيط القياس فقط
+
+    استعلامات خيوط أخرى (تحديث حالة المعاينة بعد انتهاء التحويل) لا تحسب على الطلب.
+    """
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        self._event = event
+        self._engine = engine
+        self._thread = threading.get_ident()
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        if threading.get_ident() == self._thread:
+            self.count += 1
+
+    def close(self):
+        self._event.remove(self._engine, 'before_cursor_execute', self._on_execute)
+
+
+def encode_multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                   'Content-Type: application/octet-stream\r\n\r\n'.encode())
+        body.write(content)
+        body.write(b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+class HttpSession:
+    """عميل HTTP بسيط بجلسة مستقلة (cookies) لكل خيط من خيوط الحمل"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self._opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def send(self, bench_request):
+        body, headers = None, {}
+        if bench_request.method == 'POST':
+            body, headers['Content-Type'] = encode_multipart(bench_request.data, bench_request.files)
+        request = urllib.request.Request(self.base_url + bench_request.path, data=body, headers=headers,
+                                         method=bench_request.method)
+        try:
+            with self._opener.open(request, timeout=120) as response:
+                return response.status, response.headers.get_content_type(), response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get_content_type(), e.read()
+
+    def login(self, username):
+        self.send(BenchRequest('POST', '/login', {'username': username, 'password': PASSWORD}, {}))
+
+
+class Benchmark:
+    def __init__(self, application, app, options):
+        self.application = application
+        self.app = app
+        self.db = application.db
+        self.options = options
+        with self.app.app_context():
+            self.engine = self.db.engine
+        self.post_ids = []
+        self.usernames = {'nurse': 'bench_nurse', 'doctor': 'bench_doctor'}
+
+        self.dicom = synthetic_dicom(options.dicom_shape)
+        self.nifti = synthetic_nifti(options.nifti_shape)
+        self.scenarios = [
+            Scenario('create_post', 'nurse', self.create_post_request),
+            Scenario('upload_image[dcm]', 'nurse', self.upload_request('bench.dcm', self.dicom)),
+            Scenario('upload_image[nii.gz]', 'nurse', self.upload_request('bench.nii.gz', self.nifti)),
+            Scenario('doctor_dashboard', 'doctor', lambda index: BenchRequest('GET', '/doctor/dashboard', {}, {})),
+            Scenario('post_replies', 'doctor', self.replies_request),
+            Scenario('triage_queue', 'doctor',
+                     lambda index: BenchRequest('GET', '/doctor/dashboard?status=unanswered', {}, {})),
+            Scenario('stats_summary', 'doctor', lambda index: BenchRequest('GET', '/api/stats/summary', {}, {})),
+        ]
+
+    # الطلبات
+    def create_post_request(self, index):
+        categories = list(self.application.POST_CATEGORIES)
+        urgency_levels = self.application.URGENCY_LEVELS
+        return BenchRequest('POST', '/create_post', {
+            'title': f'استفسار قياس الأداء {index}',
+            'content': 'مريض يعاني من صداع مستمر بعد إصابة في الرأس، هل تلزم أشعة مقطعية؟',
+            'category': categories[index % len(categories)],
+            'urgency': urgency_levels[index % len(urgency_levels)]
+        }, {})
+
+    def upload_request(self, filename, payload):
+        def build(index):
+            post_id = self.post_ids[index % len(self.post_ids)]
+            return BenchRequest('POST', '/upload_image', {'post_id': post_id},
+                                {'medical_image': (filename, payload(index))})
+        return build
+
+    def wait_for_previews(self, timeout=600):
+        """انتظار انتهاء طابور المعاينات، تعيد المدة بالثواني
+
+        يتم الانتظار بعد كل مسار رفع حتى لا ينافس التحويل في الخلفية المسارات التالية.
+        """
+        application = self.application
+        waiting = [application.PREVIEW_PENDING, application.PREVIEW_RETRYING]
+        started = time.perf_counter()
+        with self.app.app_context():
+            while time.perf_counter() - started < timeout:
+                pending = application.MedicalImage.query.filter(
+                    application.MedicalImage.preview_status.in_(waiting)
+                ).count()
+                if not pending:
+                    break
+                time.sleep(0.05)
+        return round(time.perf_counter() - started, 2)
+
+    def replies_request(self, index):
+        post_id = self.post_ids[index % len(self.post_ids)]
+        return BenchRequest('GET', f'/api/post/{post_id}/replies', {}, {})
+
+    # البيانات الأولية
+    def seed(self):
+        """إنشاء المستخدمين ومنشورات مع ردود حتى تعكس لوحة التحكم حجماً واقعياً"""
+        application = self.application
+        with self.app.app_context():
+            users = {}
+            for role, username in self.usernames.items():
+                user = application.User(username=username, first_name='Bench', last_name=role,
+                                        email=f'{username}@benchmark.local', phone='0000000000',
+                                        gender='male', role=role)
+                user.set_password(PASSWORD)
+                self.db.session.add(user)
+                users[role] = user
+            self.db.session.flush()
+
+            categories = list(application.POST_CATEGORIES)
+            for index in range(self.options.posts):
+                urgency = application.URGENCY_LEVELS[index % len(application.URGENCY_LEVELS)]
+                post = application.Post(
+                    title=f'حالة {index}: ألم في الصدر وضيق في التنفس',
+                    content='صورة الأشعة السينية تظهر كثافة في الفص السفلي من الرئة اليمنى',
+                    category=categories[index % len(categories)],
+                    urgency=urgency,
+                    priority=application.urgency_priority(urgency),
+                    user_id=users['nurse'].id
+                )
+                self.db.session.add(post)
+                self.db.session.flush()
+                # نفس تحديث العدادات والإحصاءات الذي تقوم به create_post و add_reply
+                application.record_new_post(post)
+                # ثلث المنشورات بدون ردود حتى يحتوي طابور الفرز على حالات من كل مستوى
+                replies = self.options.replies if index % 3 else 0
+                for reply_index in range(replies):
+                    reply = application.Reply(
+                        content='يفضل إجراء أشعة مقطعية للصدر مع الصبغة', diagnosis='التهاب رئوي',
+                        treatment='مضاد حيوي', recommendations='متابعة بعد أسبوعين',
+                        medical_proces='CT', medical_cate='chest',
+                        post_id=post.id, doctor_id=users['doctor'].id
+                    )
+                    self.db.session.add(reply)
+                    self.db.session.flush()
+                    application.record_new_reply(post.id, reply.created_at)
+                application.index_post_for_search(post)
+                self.post_ids.append(post.id)
+            self.db.session.commit()
+
+    # المراحل
+    def run_test_client(self):
+        results = {}
+        clients = {}
+        for role, username in self.usernames.items():
+            clients[role] = self.app.test_client()
+            clients[role].post('/login', data={'username': username, 'password': PASSWORD})
+
+        for scenario in self.scenarios:
+            client = clients[scenario.role]
+            counter = QueryCounter(self.engine)
+            latencies, queries, errors = [], [], 0
+            try:
+                for index in range(self.options.iterations):
+                    bench_request = scenario.build(index)
+                    data = dict(bench_request.data)
+                    for name, (filename, content) in bench_request.files.items():
+                        data[name] = (io.BytesIO(content), filename)
+
+                    counter.count = 0
+                    started = time.perf_counter()
+                    response = client.open(bench_request.path, method=bench_request.method, data=data)
+                    latencies.append(time.perf_counter() - started)
+                    queries.append(counter.count)
+                    errors += is_failure(response.status_code, response.mimetype, response.get_data())
+            finally:
+                counter.close()
+
+            stats = summarize(latencies, sum(latencies), errors)
+            stats['queries_per_request'] = round(float(np.mean(queries)), 1) if queries else None
+            stats['max_queries'] = max(queries) if queries else None
+            stats['peak_rss_mb'] = peak_rss_mb()
+            if bench_request.path == '/upload_image':
+                stats['preview_drain_s'] = self.wait_for_previews()
+            results[scenario.name] = stats
+            self.report(scenario.name, stats)
+        return results
+
+    def run_http(self):
+        from werkzeug.serving import make_server, WSGIRequestHandler
+
+        class QuietRequestHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        server = make_server('127.0.0.1', 0, self.app, threaded=True, request_handler=QuietRequestHandler)
+        server_thread = threading.Thread(target=server.serve_forever, name='benchmark-server', daemon=True)
+        server_thread.start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        results = {}
+        try:
+            sessions = {}
+            for role, username in self.usernames.items():
+                sessions[role] = [HttpSession(base_url) for _ in range(self.options.concurrency)]
+                for session in sessions[role]:
+                    session.login(username)
+
+            for scenario in self.scenarios:
+                stats = self.load(scenario, sessions[scenario.role])
+                stats['concurrency'] = self.options.concurrency
+                stats['peak_rss_mb'] = peak_rss_mb()
+                if scenario.build(0).path == '/upload_image':
+                    stats['preview_drain_s'] = self.wait_for_previews()
+                results[scenario.name] = stats
+                self.report(scenario.name, stats)
+        finally:
+            server.shutdown()
+        return results
+
+    def load(self, scenario, sessions):
+        """إرسال requests طلباً موزعة على الجلسات بالتوازي"""
+        # أرقام التكرار بعد مرحلة test client حتى تبقى الملفات المرفوعة جديدة
+        indexes = iter(range(self.options.iterations, self.options.iterations + self.options.requests))
+        lock = threading.Lock()
+        latencies, failures = [], []
+
+        def worker(session):
+            while True:
+                with lock:
+                    index = next(indexes, None)
+                if index is None:
+                    return
+                bench_request = scenario.build(index)
+                started = time.perf_counter()
+                try:
+                    failed = is_failure(*session.send(bench_request))
+                except OSError:
+                    failed = True
+                latency = time.perf_counter() - started
+                with lock:
+                    latencies.append(latency)
+                    failures.append(failed)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+            list(pool.map(worker, sessions))
+        return summarize(latencies, time.perf_counter() - started, sum(failures))
+
+    def run_conversion(self):
+        """توليد المعاينة مباشرة (convert_to_preview) لكل نوع ملف، داخل العملية الحالية"""
+        imaging = self.application.imaging
+        os.makedirs(imaging.UPLOAD_FOLDER, exist_ok=True)
+
+        results = {}
+        for name, extension, suffix, payload in (('convert_to_preview[dcm]', 'dcm', 'dcm', self.dicom),
+                                                 ('convert_to_preview[nii.gz]', 'gz', 'nii.gz', self.nifti)):
+            latencies = []
+            for index in range(self.options.conversions):
+                filename = f"bench_{uuid.uuid4().hex}.{suffix}"
+                file_path = os.path.join(imaging.UPLOAD_FOLDER, filename)
+                with open(file_path, 'wb') as f:
+                    f.write(payload(index))
+
+                started = time.perf_counter()
+                imaging.convert_to_preview(file_path, extension, filename)
+                latencies.append(time.perf_counter() - started)
+
+            stats = summarize(latencies, sum(latencies), 0)
+            stats['peak_rss_mb'] = peak_rss_mb()
+            results[name] = stats
+            self.report(name, stats)
+        return results
+
+    def run_startup(self):
+        """وقت تشغيل عملية جديدة حتى أول استجابة، وذاكرتها، لكل ملف تشغيل"""
+        env = dict(os.environ, PYTHONPATH=APP_DIR)
+        results = {}
+        for profile in STARTUP_PROFILES:
+            latencies, created, rss, modules, errors = [], [], [], set(), 0
+            for _ in range(self.options.startups):
+                completed = subprocess.run([sys.executable, '-c', STARTUP_PROBE, profile], env=env,
+                                           capture_output=True, text=True)
+                if completed.returncode:
+                    errors += 1
+                    print(f"  {profile} failed to start: {completed.stderr.strip()[-300:]}")
+                    continue
+                probe = json.loads(completed.stdout.strip().splitlines()[-1])
+                errors += probe['status'] != 200
+                latencies.append(probe['first_request'])
+                created.append(probe['create_app'])
+                if probe['rss_mb'] is not None:
+                    rss.append(probe['rss_mb'])
+                modules.update(probe['imaging_modules'])
+
+            name = f"cold_start[{profile}]"
+            stats = summarize(latencies, sum(latencies), errors)
+            if created:
+                stats['create_app_ms'] = round(float(np.median(created)) * 1000, 1)
+            if rss:
+                stats['peak_rss_mb'] = round(float(np.median(rss)), 1)
+            # مكتبات الصور المحملة قبل أول طلب يعالج صوراً، والمتوقع ألا يحمل أي منها
+            stats['imaging_modules'] = sorted(modules)
+            results[name] = stats
+            self.report(name, stats)
+        return results
+
+    def report(self, name, stats):
+        print(f"  {name:<28} {stats.get('throughput') or 0:>9.1f}/s"
+              f"  p50 {stats.get('p50_ms', 0):>8.1f}ms  p95 {stats.get('p95_ms', 0):>8.1f}ms"
+              f"  p99 {stats.get('p99_ms', 0):>8.1f}ms  errors {stats['errors']}"
+              + (f"  queries {stats['queries_per_request']}" if 'queries_per_request' in stats else '')
+              + (f"  rss {stats['peak_rss_mb']}MB" if stats.get('peak_rss_mb') else '')
+              + (f"  previews {stats['preview_drain_s']}s" if 'preview_drain_s' in stats else ''))
+
+    def run(self):
+        phases = {}
+        if self.options.startups:
+            print('startup:')
+            phases['startup'] = self.run_startup()
+        print('test client:')
+        phases['test_client'] = self.run_test_client()
+        if self.options.requests:
+            print(f'http (concurrency {self.options.concurrency}):')
+            phases['http'] = self.run_http()
+        if self.options.conversions:
+            print('conversion:')
+            phases['conversion'] = self.run_conversion()
+        return phases
+
+
+def compare(results, baseline, threshold):
+    """المسارات التي زاد فيها p95 أو نقص معدل الطلبات بأكثر من threshold مقارنة بالنتيجة السابقة"""
+    regressions = []
+    for phase, endpoints in results['results'].items():
+        for name, stats in endpoints.items():
+            previous = baseline.get('results', {}).get(phase, {}).get(name)
+            if not previous:
+                continue
+            for metric, worse in (('p95_ms', 1), ('throughput', -1)):
+                old, new = previous.get(metric), stats.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                if change * worse > threshold:
+                    regressions.append(f"{phase}/{name} {metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the upload, preview and feed hot paths.')
+    parser.add_argument('--iterations', type=int, default=30, help='sequential test client requests per endpoint')
+    parser.add_argument('--requests', type=int, default=100, help='HTTP requests per endpoint (0 to skip)')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent HTTP clients')
+    parser.add_argument('--conversions', type=int, default=5, help='convert_to_preview runs per file type (0 to skip)')
+    parser.add_argument('--startups', type=int, default=5, help='fresh processes started per app profile (0 to skip)')
+    parser.add_argument('--posts', type=int, default=500, help='posts created before measuring')
+    parser.add_argument('--replies', type=int, default=3, help='replies per seeded post')
+    parser.add_argument('--dicom-shape', type=parse_shape, default=(1, 512, 512), help='frames x rows x columns')
+    parser.add_argument('--nifti-shape', type=parse_shape, default=(64, 256, 256), help='slices x rows x columns')
+    parser.add_argument('--output', help='results file (default: benchmarks/<timestamp>.json)')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed regression against the baseline')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary database and uploads')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    created_at = datetime.now()
+    output = os.path.abspath(options.output or os.path.join('benchmarks', f"{created_at:%Y%m%d-%H%M%S}.json"))
+    baseline = None
+    if options.baseline:
+        with open(options.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    # قاعدة بيانات ومجلدات مؤقتة، ومجلد الرفع نسبي لمجلد العمل الحالي
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='medical-benchmark-')
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(workdir, 'benchmark.db')}")
+    os.environ['SLICE_CACHE_DIR'] = os.path.join(workdir, 'slice_cache')
+    sys.path.insert(0, APP_DIR)
+    os.chdir(workdir)
+
+    try:
+        import app as application
+
+        app = application.create_app('full')
+        application.upgrade_database(app)
+        benchmark = Benchmark(application, app, options)
+        benchmark.seed()
+        phases = benchmark.run()
+    finally:
+        executor = application._preview_executor if 'application' in locals() else None
+        if executor is not None:
+            # إيقاف التحويلات المتبقية قبل حذف المجلد المؤقت
+            executor.shutdown(wait=True, cancel_futures=True)
+        os.chdir(cwd)
+        if options.keep:
+            print(f"temporary files kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'created_at': created_at.isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'database': benchmark.engine.dialect.name,
+        'options': {key: list(value) if isinstance(value, tuple) else value
+                    for key, value in vars(options).items()},
+        'results': phases
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"results saved to {output}")
+
+    if baseline is not None:
+        ignored = ('output', 'baseline', 'threshold', 'keep')
+        changed = [key for key, value in results['options'].items()
+                   if key not in ignored and baseline.get('options', {}).get(key) != value]
+        if changed:
+            print(f"warning: baseline was recorded with different options: {', '.join(changed)}")
+        regressions = compare(results, baseline, options.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"no regressions against {options.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+from collections import defaultdict
+import threading
+import logging
+import queue
+import json
+import time
+
+logger = logging.getLogger(__name__)
+
+# توزيع أحداث الردود الجديدة على المشتركين (صفحات المنشورات المفتوحة)
+# هذه الوحدة لا تعتمد على Flask حتى يمكن استبدال طريقة النشر دون تعديل المسارات
+
+
+class ReplyEventBroker:
+    """توزيع الأحداث داخل العملية الحالية فقط
+
+    كل مشترك يحصل على طابور خاص به، ولا يتم إرسال أي استعلام إلى قاعدة البيانات
+    عند النشر. مناسب عند تشغيل عملية واحدة للخادم.
+    """
+
+    # الحد الأقصى للأحداث المنتظرة لكل مشترك، المشترك البطيء يفقد الأحداث الزائدة
+    QUEUE_SIZE = 100
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._listeners = []
+        self._reconnect_listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """استدعاء callback(post_id, event) مع كل حدث يصل إلى هذه العملية"""
+        self._listeners.append(callback)
+
+    def add_reconnect_listener(self, callback):
+        """استدعاء callback() بعد استعادة اتصال انقطع، فقد تكون بعض الأحداث لم تصل"""
+        self._reconnect_listeners.append(callback)
+
+    def subscribe(self, post_id):
+        subscription = queue.Queue(maxsize=self.QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[post_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, post_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(post_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[post_id]
+
+    def subscriber_count(self, post_id):
+        with self._lock:
+            return len(self._subscribers.get(post_id, ()))
+
+    def publish(self, post_id, event):
+        self._deliver(post_id, event)
+
+    def _deliver(self, post_id, event):
+        for callback in self._listeners:
+            callback(post_id, event)
+        with self._lock:
+            subscribers = list(self._subscribers.get(post_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                pass
+
+
+class RedisReplyEventBroker(ReplyEventBroker):
+    """نشر الأحداث عبر Redis pub/sub عند تشغيل عدة عمليات للخادم
+
+    كل عملية تستمع إلى القناة وتوزع الأحداث على مشتركيها المحليين.
+    """
+
+    CHANNEL_PREFIX = 'post_replies:'
+
+    # الانتظار قبل إعادة الاتصال بعد انقطاعه، يتضاعف حتى الحد الأقصى (ثوانٍ)
+    RECONNECT_DELAY = 0.5
+    RECONNECT_MAX_DELAY = 30
+
+    def __init__(self, url):
+        import redis  # اعتماد اختياري، مطلوب فقط عند استخدام هذا النوع
+
+        super().__init__()
+        self._connection_errors = (redis.ConnectionError, redis.TimeoutError)
+        self._redis = redis.Redis.from_url(url)
+        self._pubsub = self._subscribe()
+        self._listener = threading.Thread(target=self._listen, name='reply-events', daemon=True)
+        self._listener.start()
+
+    def publish(self, post_id, event):
+        self._redis.publish(f"{self.CHANNEL_PREFIX}{post_id}", json.dumps(event))
+
+    def _subscribe(self):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.psubscribe(f"{self.CHANNEL_PREFIX}*")
+        except Exception:
+            pubsub.close()
+            raise
+        return pubsub
+
+    def _listen(self):
+        """توزيع الأحداث الواردة، وعند انقطاع الاتصال إعادة الاشتراك مع تزايد مدة الانتظار"""
+        delay = self.RECONNECT_DELAY
+        while True:
+            try:
+                if self._pubsub is None:
+                    self._pubsub = self._subscribe()
+                    delay = self.RECONNECT_DELAY
+                    for callback in self._reconnect_listeners:
+                        callback()
+                for message in self._pubsub.listen():
+                    try:
+                        self._receive(message)
+                    except Exception:
+                        logger.exception('Cannot deliver reply event %r', message)
+            except self._connection_errors as e:
+                logger.warning('Reply events connection lost, reconnecting in %.1fs: %s', delay, e)
+            if self._pubsub is not None:
+                try:
+                    self._pubsub.close()
+                except Exception:
+                    pass
+                self._pubsub = None
+            time.sleep(delay)
+            delay = min(delay * 2, self.RECONNECT_MAX_DELAY)
+
+    def _receive(self, message):
+        channel = message['channel']
+        if isinstance(channel, bytes):
+            channel = channel.decode('utf-8')
+        post_id = int(channel[len(self.CHANNEL_PREFIX):])
+        self._deliver(post_id, json.loads(message['data']))
+
+
+def create_broker(redis_url=None):
+    if redis_url:
+        return RedisReplyEventBroker(redis_url)
+    return ReplyEventBroker()
+
+
+def format_sse(data, event=None, event_id=None):
+    """تنسيق حدث بصيغة Server-Sent Events"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,709 @@
+from collections import OrderedDict
+from functools import lru_cache
+from PIL import Image, features
+from storage import UPLOAD_FOLDER, SERIES_EXTENSION, THUMBNAIL_SIZES, series_metadata_path, thumbnail_filename
+import pydicom
+import nibabel as nib
+import numpy as np
+import normalization
+import threading
+import uuid
+import hashlib
+import json
+import time
+import io
+import os
+
+# هذه الوحدة لا تعتمد على Flask أو قاعدة البيانات حتى يمكن تشغيل دوالها
+# داخل عمليات منفصلة (ProcessPoolExecutor) دون تحميل التطبيق بالكامل
+
+
+def nifti_slice(nii_img, slice_idx=None, axis=2, frame=0):
+    """قراءة شريحة واحدة من ملف NIFTI عبر dataobj
+
+    dataobj هو وكيل (ArrayProxy) مرتبط بالملف عبر memory-map، لذلك لا يقرأ إلا
+    بايتات الشريحة المطلوبة بدلاً من تحميل الحجم كاملاً كما تفعل get_fdata().
+    """
+    shape = nii_img.shape
+    if len(shape) == 2:
+        return np.asanyarray(nii_img.dataobj)
+
+    if slice_idx is None:
+        slice_idx = shape[axis] // 2
+
+    # الأبعاد الإضافية (الزمن في ملفات 4D) نأخذ منها إطاراً واحداً
+    index = [slice(None)] * 3 + [frame] + [0] * (len(shape) - 4)
+    index[axis] = slice_idx
+    return np.asanyarray(nii_img.dataobj[tuple(index[:len(shape)])])
+
+
+@lru_cache(maxsize=128)
+def _intensity_range(file_path, extension, mtime):
+    if extension in ('nii', 'gz'):
+        # إبقاء الملف مفتوحاً يجعل قراءة الشرائح المتتالية من ملفات .nii.gz تتقدم في
+        # نفس تيار فك الضغط بدلاً من إعادة فك الضغط من البداية لكل شريحة
+        nii_img = nib.load(file_path, keep_file_open=True)
+        if len(nii_img.shape) == 2:
+            sample = normalization.sample_slices(lambda index: nifti_slice(nii_img), 1)
+        else:
+            sample = normalization.sample_slices(lambda index: nifti_slice(nii_img, index), nii_img.shape[2])
+    else:
+        count = volume_axes(file_path, extension)['axial']
+        sample = normalization.sample_slices(lambda index: read_slice(file_path, extension, 'axial', index), count)
+    return normalization.robust_range(sample)
+
+
+def intensity_range(file_path, extension):
+    """مدى الشدة للحجم بعد قص القيم الشاذة، مقدراً من عينة من الشرائح ومخزناً مؤقتاً لكل ملف"""
+    return _intensity_range(file_path, extension, os.path.getmtime(file_path))
+
+
+# عرض الشرائح حسب الطلب (محوري/إكليلي/سهمي)
+SLICE_AXES = ('axial', 'coronal', 'sagittal')
+MIN_SLICE_SIZE = 16
+MAX_SLICE_SIZE = 2048
+
+
+# الحد الأقصى لبكسلات DICOM المفكوكة المحتفظ بها في الذاكرة (بالبايت)
+DICOM_PIXEL_CACHE_LIMIT = 256 * 1024 * 1024
+
+
+class PixelCache:
+    """ذاكرة مؤقتة LRU للأحجام المفكوكة، محدودة بعدد بايتات كما في SliceCache"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._arrays = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            pixels = self._arrays.get(key)
+            if pixels is not None:
+                self._arrays.move_to_end(key)
+            return pixels
+
+    def set(self, key, pixels):
+        if pixels.nbytes > self.limit:
+            # حجم أكبر من الحد كاملاً لا نخزنه حتى لا يطرد كل ما سواه
+            return
+        with self._lock:
+            if key in self._arrays:
+                return
+            self._arrays[key] = pixels
+            self._size += pixels.nbytes
+            while self._size > self.limit:
+                _, evicted = self._arrays.popitem(last=False)
+                self._size -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._arrays.clear()
+            self._size = 0
+
+
+# فك ضغط بيانات DICOM مكلف، لذلك نحتفظ بآخر الأحجام المفتوحة في الذاكرة
+_dicom_pixel_cache = PixelCache(DICOM_PIXEL_CACHE_LIMIT)
+
+
+def _decode_dicom(file_path):
+    dicom_data = pydicom.dcmread(file_path)
+    pixels = dicom_data.pixel_array
+    if getattr(dicom_data, 'SamplesPerPixel', 1) > 1:
+        # الصور الملونة نحولها إلى تدرج رمادي حتى يمكن تطبيق النافذة عليها
+        # (float32 يكفي للعرض بنصف ذاكرة float64)
+        pixels = pixels.mean(axis=-1, dtype=np.float32)
+    if pixels.ndim == 2:
+        pixels = pixels[np.newaxis]
+    pixels.flags.writeable = False
+    return pixels  # (frames, rows, columns)
+
+
+def dicom_pixels(file_path):
+    key = (file_path, os.path.getmtime(file_path))
+    pixels = _dicom_pixel_cache.get(key)
+    if pixels is None:
+        pixels = _decode_dicom(file_path)
+        _dicom_pixel_cache.set(key, pixels)
+    return pixels
+
+
+@lru_cache(maxsize=128)
+def _dicom_shape(file_path, mtime):
+    dicom_data = pydicom.dcmread(file_path, stop_before_pixels=True)
+    return int(dicom_data.get('NumberOfFrames') or 1), int(dicom_data.Rows), int(dicom_data.Columns)
+
+
+def dicom_shape(file_path):
+    """أبعاد الحجم (frames, rows, columns) من الترويسة دون فك ضغط البكسلات"""
+    return _dicom_shape(file_path, os.path.getmtime(file_path))
+
+
+def _dicom_attribute(dicom_data, sequence, keyword):
+    # ملفات Enhanced متعددة الإطارات تضع القيم المشتركة في SharedFunctionalGroupsSequence
+    value = dicom_data.get(keyword)
+    if value is None and 'SharedFunctionalGroupsSequence' in dicom_data:
+        group = dicom_data.SharedFunctionalGroupsSequence[0]
+        if sequence in group:
+            value = group[sequence].value[0].get(keyword)
+    return value
+
+
+def dicom_display_params(dicom_data):
+    """معاملات العرض من ترويسة DICOM: LUT الجهاز ونافذة العرض (أو VOI LUT) وعكس الألوان"""
+    slope = _float_or_none(_dicom_attribute(dicom_data, 'PixelValueTransformationSequence', 'RescaleSlope'))
+    intercept = _float_or_none(_dicom_attribute(dicom_data, 'PixelValueTransformationSequence', 'RescaleIntercept'))
+    params = {
+        'slope': 1.0 if slope is None else slope,
+        'intercept': 0.0 if intercept is None else intercept,
+        'window_center': _float_or_none(_dicom_attribute(dicom_data, 'FrameVOILUTSequence', 'WindowCenter')),
+        'window_width': _float_or_none(_dicom_attribute(dicom_data, 'FrameVOILUTSequence', 'WindowWidth')),
+        'voi_lut': None,
+        'invert': dicom_data.get('PhotometricInterpretation') == 'MONOCHROME1',
+    }
+    if getattr(dicom_data, 'SamplesPerPixel', 1) > 1:
+        # الصور الملونة لا تحتوي على قيم فيزيائية
+        params['slope'], params['intercept'] = 1.0, 0.0
+
+    voi_sequence = dicom_data.get('VOILUTSequence')
+    if voi_sequence:
+        item = voi_sequence[0]
+        entries, first_mapped, bits = (int(value) for value in item.LUTDescriptor)
+        lut = item.LUTData
+        if isinstance(lut, bytes):
+            lut = np.frombuffer(lut, dtype=np.uint16 if bits > 8 else np.uint8)
+        params['voi_lut'] = (first_mapped, np.asarray(lut)[:entries or 65536], bits)
+    return params
+
+
+@lru_cache(maxsize=128)
+def _dicom_display(file_path, mtime):
+    return dicom_display_params(pydicom.dcmread(file_path, stop_before_pixels=True))
+
+
+def display_params(file_path, extension):
+    """معاملات العرض لأي نوع ملف حجمي"""
+    if extension == 'dcm':
+        return _dicom_display(file_path, os.path.getmtime(file_path))
+    if extension == SERIES_EXTENSION:
+        metadata = load_series(file_path)[1]
+        return {'window_center': metadata['window_center'], 'window_width': metadata['window_width'],
+                'voi_lut': None, 'invert': metadata.get('invert', False)}
+    return {'window_center': None, 'window_width': None, 'voi_lut': None, 'invert': False}
+
+
+# سلاسل DICOM متعددة الملفات (ملف لكل شريحة) تجمع في حجم واحد بصيغة .npy (SERIES_EXTENSION)
+# يمكن فتحه عبر memory-map وقراءة أي شريحة منه دون تحميل الحجم كاملاً
+
+
+def _dicom_position(dicom_data):
+    # موضع الشريحة على المحور العمودي على مستواها، ثم رقم الصورة كبديل
+    position = dicom_data.get('ImagePositionPatient')
+    orientation = dicom_data.get('ImageOrientationPatient')
+    instance = dicom_data.get('InstanceNumber')
+    instance = int(instance) if instance not in (None, '') else 0
+    if position is not None and orientation is not None and len(orientation) == 6:
+        row_cosines = np.array(orientation[:3], dtype=np.float64)
+        column_cosines = np.array(orientation[3:], dtype=np.float64)
+        normal = np.cross(row_cosines, column_cosines)
+        return float(np.dot(normal, np.array(position, dtype=np.float64))), instance
+    return 0.0, instance
+
+
+def group_dicom_series(sources):
+    """تجميع ملفات DICOM حسب SeriesInstanceUID وترتيب شرائح كل سلسلة
+
+    sources قائمة من (name, open_file) حيث open_file تعيد كائن ملف جديداً للقراءة.
+    تقرأ الترويسات فقط (stop_before_pixels)، ويتم تجاهل الملفات التي ليست DICOM
+    أو لا تحتوي على بيانات صورة. تعيد قائمة من القواميس لكل سلسلة.
+    """
+    series = OrderedDict()
+    for name, open_file in sources:
+        try:
+            dicom_data = pydicom.dcmread(open_file(), stop_before_pixels=True)
+        except (pydicom.errors.InvalidDicomError, EOFError, OSError):
+            continue
+        if 'Rows' not in dicom_data or 'Columns' not in dicom_data:
+            continue
+        uid = str(dicom_data.get('SeriesInstanceUID', ''))
+        series.setdefault(uid, []).append((_dicom_position(dicom_data), name, open_file, dicom_data))
+
+    groups = []
+    for uid, slices in series.items():
+        slices.sort(key=lambda item: item[0])
+        groups.append({
+            'series_instance_uid': uid,
+            'names': [name for _, name, _, _ in slices],
+            'sources': [open_file for _, _, open_file, _ in slices],
+            'headers': [dicom_data for _, _, _, dicom_data in slices],
+        })
+    return groups
+
+
+def series_key(group):
+    """معرف ثابت لمحتوى السلسلة مبني على SOPInstanceUID لكل شريحة بالترتيب"""
+    digest = hashlib.sha256(group['series_instance_uid'].encode('utf-8'))
+    for dicom_data, name in zip(group['headers'], group['names']):
+        digest.update(b'\0')
+        digest.update(str(dicom_data.get('SOPInstanceUID', name)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _first_value(value):
+    if isinstance(value, pydicom.multival.MultiValue):
+        return value[0] if len(value) else None
+    return value
+
+
+def _float_or_none(value):
+    value = _first_value(value)
+    return None if value in (None, '') else float(value)
+
+
+def _text_or_none(value, length):
+    value = _first_value(value)
+    value = str(value).strip() if value is not None else ''
+    return value[:length] or None
+
+
+def _dicom_date(dicom_data, *keywords):
+    # أول تاريخ صالح بصيغة DA (YYYYMMDD) كنص ISO
+    for keyword in keywords:
+        value = str(dicom_data.get(keyword, '') or '').strip()
+        if len(value) >= 8 and value[:8].isdigit():
+            return f"{value[:4]}-{value[4:6]}-{value[6:8]}"
+    return None
+
+
+def dicom_header_metadata(dicom_data):
+    """بيانات الفهرسة من ترويسة DICOM (بدون بيانات المريض)
+
+    القيم قابلة للتحويل إلى JSON، والتاريخ نص ISO. الأطوال مطابقة لأعمدة جدول البيانات.
+    """
+    pixel_spacing = _dicom_attribute(dicom_data, 'PixelMeasuresSequence', 'PixelSpacing')
+    slice_thickness = _dicom_attribute(dicom_data, 'PixelMeasuresSequence', 'SliceThickness')
+    modality = _text_or_none(dicom_data.get('Modality'), 16)
+    body_part = _text_or_none(dicom_data.get('BodyPartExamined'), 64)
+    return {
+        'modality': modality.upper() if modality else None,
+        'body_part': body_part.upper() if body_part else None,
+        'study_date': _dicom_date(dicom_data, 'StudyDate', 'SeriesDate', 'AcquisitionDate'),
+        'study_description': _text_or_none(dicom_data.get('StudyDescription'), 255),
+        'series_description': _text_or_none(dicom_data.get('SeriesDescription'), 255),
+        'manufacturer': _text_or_none(dicom_data.get('Manufacturer'), 128),
+        'slice_thickness': _float_or_none(slice_thickness),
+        'pixel_spacing': _float_or_none(pixel_spacing),
+        'rows': int(dicom_data.Rows) if 'Rows' in dicom_data else None,
+        'columns': int(dicom_data.Columns) if 'Columns' in dicom_data else None,
+        'slices': int(dicom_data.get('NumberOfFrames') or 1),
+    }
+
+
+def nifti_header_metadata(header):
+    """بيانات الفهرسة من ترويسة NIfTI: الأبعاد والمسافات، ولا تحتوي على نوع الجهاز أو التاريخ"""
+    shape = header.get_data_shape()
+    zooms = header.get_zooms()
+    description = header['descrip'].item()
+    if isinstance(description, bytes):
+        description = description.decode('latin-1')
+    return {
+        'modality': None,
+        'body_part': None,
+        'study_date': None,
+        'study_description': None,
+        'series_description': description.strip('\0 ')[:255] or None,
+        'manufacturer': None,
+        # nibabel يرتب المحاور (x, y, z): الأعمدة ثم الصفوف ثم الشرائح
+        'slice_thickness': float(zooms[2]) if len(zooms) > 2 else None,
+        'pixel_spacing': float(zooms[0]) if zooms else None,
+        'rows': int(shape[1]) if len(shape) > 1 else None,
+        'columns': int(shape[0]) if shape else None,
+        'slices': int(shape[2]) if len(shape) > 2 else 1,
+    }
+
+
+def read_metadata(file_path, extension):
+    """بيانات الفهرسة من ترويسة الملف دون قراءة بيانات الصورة، و None للصور العادية"""
+    if extension == 'dcm':
+        return dicom_header_metadata(pydicom.dcmread(file_path, stop_before_pixels=True))
+    if extension in ('nii', 'gz'):
+        # nib.load يقرأ الترويسة فقط، والبيانات لا تقرأ إلا عند طلبها
+        return nifti_header_metadata(nib.load(file_path).header)
+    if extension == SERIES_EXTENSION:
+        metadata = _series_metadata(file_path, os.path.getmtime(file_path))
+        if metadata.get('header'):
+            return metadata['header']
+        # أحجام حفظت قبل إضافة الترويسة: ما هو متاح من بيانات الحجم
+        return {
+            'modality': metadata['modality'].upper() or None,
+            'series_description': metadata['series_description'] or None,
+            'slice_thickness': metadata['slice_spacing'],
+            'pixel_spacing': (metadata['pixel_spacing'] or [None])[0],
+            'rows': metadata['rows'],
+            'columns': metadata['columns'],
+            'slices': metadata['slices'],
+        }
+    return None
+
+
+def series_metadata(group):
+    """بيانات الحجم التي تحفظ بجانب ملف .npy"""
+    headers = group['headers']
+    first = headers[len(headers) // 2]
+    display = dicom_display_params(first)
+    slopes = [_float_or_none(h.get('RescaleSlope')) or 1.0 for h in headers]
+    intercepts = [_float_or_none(h.get('RescaleIntercept')) or 0.0 for h in headers]
+
+    positions = [_dicom_position(h)[0] for h in headers]
+    gaps = np.diff(positions) if len(positions) > 1 else []
+    spacing = float(np.median(np.abs(gaps))) if len(gaps) else _float_or_none(first.get('SliceThickness'))
+
+    metadata = {
+        'series_instance_uid': group['series_instance_uid'],
+        'modality': str(first.get('Modality', '')),
+        'series_description': str(first.get('SeriesDescription', '')),
+        'slices': len(headers),
+        'rows': int(first.Rows),
+        'columns': int(first.Columns),
+        'pixel_spacing': [float(v) for v in first.get('PixelSpacing', [])] or None,
+        'slice_spacing': spacing,
+        'window_center': display['window_center'],
+        'window_width': display['window_width'],
+        'invert': display['invert'],
+        'header': dict(dicom_header_metadata(first), slices=len(headers)),
+    }
+    if len(set(slopes)) == 1 and len(set(intercepts)) == 1:
+        metadata['rescale_slope'], metadata['rescale_intercept'] = slopes[0], intercepts[0]
+    else:
+        metadata['rescale_slope'], metadata['rescale_intercept'] = slopes, intercepts
+    return metadata
+
+
+def write_series_volume(group, file_path):
+    """كتابة شرائح السلسلة في ملف .npy واحد بالترتيب (slices, rows, columns)
+
+    يتم فك ضغط شريحة واحدة في كل مرة وكتابتها مباشرة في الملف عبر memory-map،
+    لذلك لا تتجاوز الذاكرة المستخدمة حجم شريحة واحدة مهما كان عدد الشرائح.
+    """
+    metadata = series_metadata(group)
+    shape = (metadata['slices'], metadata['rows'], metadata['columns'])
+    temp_path = f"{file_path}.{uuid.uuid4().hex}.part"
+
+    volume = None
+    try:
+        for index, open_file in enumerate(group['sources']):
+            dicom_data = pydicom.dcmread(open_file())
+            pixels = dicom_data.pixel_array
+            if getattr(dicom_data, 'SamplesPerPixel', 1) > 1:
+                pixels = pixels.mean(axis=-1)
+            if pixels.shape != shape[1:]:
+                raise ValueError(f"Slice {group['names'][index]} has shape {pixels.shape}, expected {shape[1:]}")
+            if volume is None:
+                volume = np.lib.format.open_memmap(temp_path, mode='w+', dtype=pixels.dtype, shape=shape)
+            volume[index] = pixels
+        volume.flush()
+        del volume
+        os.replace(temp_path, file_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    with open(series_metadata_path(file_path), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f)
+    return metadata
+
+
+@lru_cache(maxsize=32)
+def _series_metadata(file_path, mtime):
+    with open(series_metadata_path(file_path), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_series(file_path):
+    """فتح حجم السلسلة عبر memory-map مع بياناته"""
+    metadata = _series_metadata(file_path, os.path.getmtime(file_path))
+    return np.load(file_path, mmap_mode='r'), metadata
+
+
+def _series_rescale(metadata, axis, index):
+    # RescaleSlope/Intercept للشريحة المقروءة
+    slope, intercept = metadata['rescale_slope'], metadata['rescale_intercept']
+    if isinstance(slope, list):
+        # الميل مختلف بين الشرائح: في الاتجاهين الآخرين يكون المحور الأول هو رقم الشريحة
+        if axis == 'axial':
+            return slope[index], intercept[index]
+        return (np.array(slope, dtype=np.float32)[:, np.newaxis],
+                np.array(intercept, dtype=np.float32)[:, np.newaxis])
+    return slope, intercept
+
+
+def volume_axes(file_path, extension):
+    """عدد الشرائح المتاحة في كل اتجاه"""
+    if extension in ('dcm', SERIES_EXTENSION):
+        if extension == 'dcm':
+            frames, rows, columns = dicom_shape(file_path)
+        else:
+            frames, rows, columns = load_series(file_path)[0].shape
+        if frames == 1:
+            return {'axial': 1}
+        return {'axial': frames, 'coronal': rows, 'sagittal': columns}
+
+    shape = nib.load(file_path).shape
+    if len(shape) == 2:
+        return {'axial': 1}
+    return {'axial': shape[2], 'coronal': shape[1], 'sagittal': shape[0]}
+
+
+def read_slice(file_path, extension, axis='axial', index=None):
+    """قراءة شريحة واحدة باتجاه العرض (الصفوف من الأعلى إلى الأسفل)"""
+    if axis not in SLICE_AXES:
+        raise ValueError(f"Unknown axis: {axis}")
+
+    # القيم المعادة بالوحدات الفيزيائية (LUT الجهاز مطبق على الشريحة فقط)
+    if extension == 'dcm':
+        display = display_params(file_path, extension)
+        image_slice = _stack_slice(dicom_pixels(file_path), axis, index)[0]
+        return normalization.modality_lut(image_slice, display['slope'], display['intercept'])
+
+    if extension == SERIES_EXTENSION:
+        volume, metadata = load_series(file_path)
+        image_slice, index = _stack_slice(volume, axis, index)
+        image_slice = normalization.modality_lut(image_slice, *_series_rescale(metadata, axis, index))
+        if axis != 'axial':
+            # الشرائح مرتبة تصاعدياً على المحور العمودي، فنقلب الصورة ليظهر الأعلى في الأعلى
+            image_slice = image_slice[::-1]
+        return image_slice
+
+    nii_img = nib.load(file_path)
+    if len(nii_img.shape) == 2:
+        if axis != 'axial' or index not in (None, 0):
+            raise IndexError('2D image has a single slice')
+        return np.rot90(nifti_slice(nii_img))
+
+    axis_number = {'axial': 2, 'coronal': 1, 'sagittal': 0}[axis]
+    count = nii_img.shape[axis_number]
+    index = count // 2 if index is None else index
+    if not 0 <= index < count:
+        raise IndexError(f"Slice {index} out of range")
+    # تدوير الشريحة بحيث يظهر الاتجاه الأمامي/العلوي في أعلى الصورة
+    return np.rot90(nifti_slice(nii_img, index, axis=axis_number))
+
+
+def _stack_slice(pixels, axis, index):
+    # pixels بالترتيب (slices, rows, columns)
+    if pixels.shape[0] == 1 and axis != 'axial':
+        raise IndexError('2D image has no coronal/sagittal slices')
+    count = {'axial': pixels.shape[0], 'coronal': pixels.shape[1], 'sagittal': pixels.shape[2]}[axis]
+    index = count // 2 if index is None else index
+    if not 0 <= index < count:
+        raise IndexError(f"Slice {index} out of range")
+    if axis == 'axial':
+        return pixels[index], index
+    if axis == 'coronal':
+        return pixels[:, index, :], index
+    return pixels[:, :, index], index
+
+
+def default_window(file_path, extension):
+    """مركز وعرض النافذة الافتراضيين للحجم: من ترويسة DICOM إن وجدت، وإلا من المدى
+    المقدر بعد قص القيم الشاذة"""
+    display = display_params(file_path, extension)
+    if display['window_center'] is not None and display['window_width'] is not None:
+        return display['window_center'], display['window_width']
+    return normalization.window_from_range(*intensity_range(file_path, extension))
+
+
+def slice_to_uint8(file_path, extension, axis='axial', index=None, center=None, width=None):
+    """شريحة جاهزة للعرض (0-255) بعد LUT الجهاز ونافذة العرض
+
+    إذا لم تحدد النافذة ويحتوي الملف على VOI LUT غير خطي يتم تطبيقه بدلاً من النافذة الخطية.
+    """
+    image_slice = read_slice(file_path, extension, axis, index)
+    display = display_params(file_path, extension)
+
+    if center is None and width is None and display['voi_lut'] is not None:
+        return normalization.lut_to_uint8(image_slice, *display['voi_lut'], invert=display['invert'])
+
+    if center is None or width is None:
+        default_center, default_width = default_window(file_path, extension)
+        center = default_center if center is None else center
+        width = default_width if width is None else width
+    return normalization.window_to_uint8(image_slice, center, width, invert=display['invert'])
+
+
+def render_slice(file_path, extension, axis='axial', index=None, center=None, width=None, size=None):
+    """تحويل شريحة إلى PNG مع تطبيق النافذة (window/level) والحجم المطلوب"""
+    img = Image.fromarray(slice_to_uint8(file_path, extension, axis, index, center, width))
+
+    if size:
+        # نحافظ على نسبة الأبعاد بحيث يكون أطول ضلع مساوياً للحجم المطلوب
+        size = max(MIN_SLICE_SIZE, min(int(size), MAX_SLICE_SIZE))
+        scale = size / max(img.size)
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                         Image.BILINEAR)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class SliceCache:
+    """ذاكرة مؤقتة LRU ذات مستويين (ذاكرة ثم قرص) للشرائح المعروضة
+
+    الحجم في كل مستوى محدود بعدد بايتات، ويتم حذف الأقدم استخداماً عند تجاوزه.
+    """
+
+    def __init__(self, directory, memory_limit, disk_limit):
+        self.directory = directory
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._disk_size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # تحديث وقت الاستخدام لترتيب الحذف
+        except FileNotFoundError:
+            return None
+
+        self._remember(key, data)
+        return data
+
+    def set(self, key, data):
+        self._remember(key, data)
+
+        path = self._path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._disk_size += len(data)
+            if self._disk_size > self.disk_limit:
+                self._evict_disk()
+
+    def _remember(self, key, data):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.memory_limit and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    def _evict_disk(self):
+        # نحذف الأقدم استخداماً حتى ننزل إلى 90% من الحد لتجنب الحذف مع كل كتابة
+        entries = sorted((entry for entry in os.scandir(self.directory) if entry.is_file()),
+                         key=lambda entry: entry.stat().st_mtime)
+        self._disk_size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self._disk_size <= self.disk_limit * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._disk_size -= size
+            except FileNotFoundError:
+                pass
+
+
+def convert_to_preview(file_path, extension, original_filename):
+    """تحويل ملفات DICOM/NIFTI إلى PNG للعرض
+
+    ترفع الاستثناء عند فشل القراءة أو التحويل حتى يتمكن طابور المعالجة من
+    إعادة المحاولة أو تسجيل الفشل، وتعيد None إذا لم يكن الملف قابلاً للمعاينة.
+    """
+    preview_filename = f"{os.path.splitext(original_filename)[0]}_preview.png"
+    preview_path = os.path.join(UPLOAD_FOLDER, preview_filename)
+
+    if extension not in ('dcm', 'nii', 'gz', SERIES_EXTENSION):
+        return None
+
+    if extension == 'dcm' and 'PixelData' not in pydicom.dcmread(file_path, specific_tags=['PixelData']):
+        return None
+
+    # الشريحة الوسطى (الإطار الأوسط في DICOM، وفي NIFTI 4D من الإطار الأول) بنفس
+    # اتجاه ونافذة عارض الشرائح
+    try:
+        img = Image.fromarray(slice_to_uint8(file_path, extension))
+    finally:
+        # لا نحتفظ ببيانات الحجم في ذاكرة عمليات المعالجة بعد الانتهاء
+        _dicom_pixel_cache.clear()
+
+    img.save(preview_path)
+    return preview_filename
+
+
+# هرم الصور المصغرة: لكل صورة مرفوعة عدة نسخ صغيرة بأحجام ثابتة (أطول ضلع بالبكسل)
+# حتى لا يحمل المعرض الملف الأصلي لعرض مربع صغير (الأحجام في THUMBNAIL_SIZES)
+THUMBNAIL_FORMAT = 'webp' if features.check('webp') else 'jpeg'
+THUMBNAIL_QUALITY = 80
+
+
+def build_thumbnails(source_path, filename):
+    """توليد الصور المصغرة من صورة نقطية (الملف الأصلي أو معاينة الملف الحجمي)
+
+    يتم التصغير من الأكبر إلى الأصغر على نفس الصورة، وعند قراءة JPEG يستخدم
+    Pillow فك الضغط المصغر (draft) فلا يتم فك الصورة الأصلية بكامل دقتها.
+    """
+    with Image.open(source_path) as img:
+        img.thumbnail((THUMBNAIL_SIZES[-1], THUMBNAIL_SIZES[-1]), Image.LANCZOS)
+        if img.mode in ('I', 'I;16', 'F'):
+            # صور PNG ذات 16 بت تطبع إلى 8 بت
+            data = np.asarray(img)
+            img = Image.fromarray(normalization.to_uint8(data, float(data.min()), float(data.max())))
+        elif img.mode not in ('L', 'RGB'):
+            img = img.convert('RGB')
+
+        for size in sorted(THUMBNAIL_SIZES, reverse=True):
+            img.thumbnail((size, size), Image.LANCZOS)
+            img.save(os.path.join(UPLOAD_FOLDER, thumbnail_filename(filename, size, THUMBNAIL_FORMAT)),
+                     format=THUMBNAIL_FORMAT.upper(), quality=THUMBNAIL_QUALITY)
+    return THUMBNAIL_FORMAT
+
+
+def generate_previews(file_path, extension, filename):
+    """مهمة طابور المعالجة: المعاينة PNG للملفات الحجمية ثم الصور المصغرة
+
+    تعيد (preview_filename, thumbnail_format, durations)، والاسمان None إذا لم يكن الملف
+    قابلاً للعرض. durations مدة كل مرحلة بالثواني ('convert' و 'thumbnails') لمقاييس الأداء.
+    """
+    preview_filename = None
+    source_path = file_path
+    durations = {}
+    if extension in ('dcm', 'nii', 'gz', SERIES_EXTENSION):
+        started = time.perf_counter()
+        preview_filename = convert_to_preview(file_path, extension, filename)
+        durations['convert'] = time.perf_counter() - started
+        if preview_filename is None:
+            return None, None, durations
+        source_path = os.path.join(UPLOAD_FOLDER, preview_filename)
+
+    started = time.perf_counter()
+    thumbnail_format = build_thumbnails(source_path, filename)
+    durations['thumbnails'] = time.perf_counter() - started
+    return preview_filename, thumbnail_format, durations
@@ -0,0 +1,122 @@
+from contextlib import contextmanager
+from collections import defaultdict
+import threading
+import bisect
+import time
+
+# مقاييس الأداء بصيغة Prometheus النصية دون الاعتماد على prometheus_client
+# كل عملية تحتفظ بمقاييسها في الذاكرة، فعند تشغيل عدة عمليات للخادم يظهر في كل
+# قراءة ما سجلته العملية التي استقبلت الطلب فقط
+# هذه الوحدة لا تعتمد على Flask، وربطها بإشارات الطلبات وأحداث SQLAlchemy يتم في app.py
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# حدود الفئات بالثواني، وحدود عدد الاستعلامات في الطلب الواحد
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# عدد أبطأ الاستعلامات المحفوظة لكل طلب لسجل الطلبات البطيئة
+SLOW_STATEMENTS = 5
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Histogram:
+    """توزيع القيم على فئات ثابتة، لكل مجموعة قيم من التسميات (labels) سلسلة مستقلة"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # تسميات -> [عدد كل فئة ... عدد ما فوق آخر فئة، المجموع]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labelvalues, list(values)) for labelvalues, values in self._series.items())
+        for labelvalues, values in series:
+            labels = list(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {values[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return '\n'.join(lines)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+class RequestTimings:
+    """الوقت المستغرق داخل طلب واحد حسب النوع (sql، render، convert) مع عدد الاستعلامات"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.durations = defaultdict(float)
+        self.slow_statements = []
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def add(self, kind, seconds):
+        self.durations[kind] += seconds
+
+    def add_sql(self, statement, seconds):
+        self.sql_count += 1
+        self.durations['sql'] += seconds
+        self.slow_statements.append((seconds, statement))
+        if len(self.slow_statements) > SLOW_STATEMENTS:
+            self.slow_statements.sort(key=lambda item: item[0], reverse=True)
+            del self.slow_statements[SLOW_STATEMENTS:]
+
+    @contextmanager
+    def timer(self, kind):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(kind, time.perf_counter() - started)
+
+    def trace(self):
+        """ملخص الطلب لسجل الطلبات البطيئة"""
+        parts = [f"sql={self.sql_count}/{self.durations['sql'] * 1000:.1f}ms"]
+        parts.extend(f"{kind}={seconds * 1000:.1f}ms" for kind, seconds in sorted(self.durations.items())
+                     if kind != 'sql')
+        lines = [' '.join(parts)]
+        for seconds, statement in sorted(self.slow_statements, key=lambda item: item[0], reverse=True):
+            lines.append(f"  {seconds * 1000:.1f}ms {' '.join(statement.split())[:300]}")
+        return '\n'.join(lines)
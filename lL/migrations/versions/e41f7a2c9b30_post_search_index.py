@@ -0,0 +1,41 @@
+"""post search index
+
+Revision ID: e41f7a2c9b30
+Revises: cd528e0e5437
+Create Date: 2026-10-18 01:12:05.418223
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from search import create_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41f7a2c9b30'
+down_revision = 'cd528e0e5437'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # جدول البحث يختلف حسب قاعدة البيانات (FTS5 أو tsvector) فلا يتم توليده تلقائياً
+    bind = op.get_bind()
+    index = create_search_index(bind.dialect.name)
+    index.create(bind)
+
+    # فهرسة المنشورات الموجودة
+    replies = {}
+    for row in bind.execute(sa.text(
+        "SELECT post_id, content, diagnosis, treatment, recommendations, medical_proces, medical_cate "
+        "FROM reply ORDER BY id"
+    )):
+        replies.setdefault(row[0], []).extend(value for value in row[1:] if value)
+
+    for post_id, title, content in bind.execute(sa.text("SELECT id, title, content FROM post")).all():
+        index.index_post(bind, post_id, title, content, '\n'.join(replies.get(post_id, ())))
+
+
+def downgrade():
+    bind = op.get_bind()
+    create_search_index(bind.dialect.name).drop(bind)
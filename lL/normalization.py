@@ -0,0 +1,125 @@
+import numpy as np
+
+# تطبيع شدة الصور الطبية للعرض: LUT الجهاز (RescaleSlope/Intercept) ثم نافذة العرض
+# (VOI) ثم التحويل إلى 0-255. كل دالة تعمل على شريحة واحدة وتنشئ نسخة واحدة على الأكثر
+# بحجمها، وتعدل هذه النسخة في مكانها بدلاً من إنشاء مصفوفات وسيطة
+# هذه الوحدة لا تعتمد على pydicom أو nibabel، والقراءة من الملفات تتم في imaging.py
+
+# نوافذ العرض الشائعة لصور CT بوحدات Hounsfield: (المركز، العرض)
+WINDOW_PRESETS = {
+    'brain': (40, 80),
+    'subdural': (75, 215),
+    'stroke': (32, 8),
+    'lung': (-600, 1500),
+    'mediastinum': (50, 350),
+    'abdomen': (40, 400),
+    'liver': (60, 160),
+    'bone': (400, 1800),
+}
+
+# النسب المئوية التي تقص القيم الشاذة (المعادن، الضجيج) عند حساب النافذة التلقائية
+DEFAULT_PERCENTILES = (0.5, 99.5)
+
+# حجم العينة: عدد الشرائح من الحجم، وأقصى عدد قيم من كل شريحة
+SAMPLE_SLICES = 16
+SAMPLE_VALUES_PER_SLICE = 64 * 1024
+
+
+def sample_slices(read_slice, count, max_slices=SAMPLE_SLICES, max_values=SAMPLE_VALUES_PER_SLICE):
+    """عينة منتظمة من قيم الحجم دون قراءته كاملاً
+
+    read_slice(index) تعيد شريحة واحدة، ويؤخذ من كل شريحة شبكة منتظمة من البكسلات
+    بحيث لا يتجاوز حجم العينة max_slices × max_values قيمة مهما كان حجم الملف.
+    """
+    step = max(1, count // max_slices)
+    values = []
+    for index in range(0, count, step):
+        image_slice = read_slice(index)
+        stride = max(1, int(np.ceil(np.sqrt(image_slice.size / max_values))))
+        values.append(np.asarray(image_slice[::stride, ::stride], dtype=np.float32).ravel())
+    return np.concatenate(values) if values else np.empty(0, dtype=np.float32)
+
+
+def robust_range(sample, percentiles=DEFAULT_PERCENTILES):
+    """مدى الشدة بعد قص الأطراف بالنسب المئوية، مع تجاهل NaN و Inf"""
+    sample = sample[np.isfinite(sample)]
+    if not sample.size:
+        return 0.0, 0.0
+    low, high = np.percentile(sample, percentiles)
+    if high <= low:
+        # صور ذات قيم قليلة (أقنعة مثلاً) قد يتساوى فيها الحدان، فنرجع إلى القيم القصوى
+        low, high = sample.min(), sample.max()
+    return float(low), float(high)
+
+
+def window_from_range(low, high):
+    """تحويل المدى إلى (المركز، العرض)"""
+    return (low + high) / 2, max(high - low, 1.0)
+
+
+def preset_window(name):
+    """نافذة عرض جاهزة بالاسم، ترفع KeyError إذا لم تكن معروفة"""
+    center, width = WINDOW_PRESETS[name]
+    return float(center), float(width)
+
+
+def modality_lut(pixels, slope=1.0, intercept=0.0):
+    """تحويل القيم المخزنة إلى وحدات فيزيائية (HU في CT): slope × x + intercept
+
+    لا يتم النسخ إذا كان التحويل محايداً، والإزاحة الصحيحة على بيانات صحيحة تبقى
+    في int32 بدلاً من float. slope و intercept قد تكون مصفوفات قابلة للبث (broadcast)
+    عندما يختلف الميل بين الشرائح.
+    """
+    scalar = np.ndim(slope) == 0 and np.ndim(intercept) == 0
+    if scalar and slope == 1 and intercept == 0:
+        return pixels
+
+    if scalar and slope == 1 and float(intercept).is_integer() and pixels.dtype.kind in 'iu':
+        data = pixels.astype(np.int32)
+        data += int(intercept)
+        return data
+
+    data = pixels.astype(np.float32)
+    data *= slope
+    data += intercept
+    return data
+
+
+def window_to_uint8(pixels, center, width, invert=False):
+    """تطبيق نافذة العرض الخطية (VOI) وتحويل الشريحة إلى 0-255
+
+    نسخة float32 واحدة بحجم الشريحة يتم تعديلها في مكانها، والعرض الصفري أو السالب
+    يعامل كعرض 1 بدلاً من القسمة على صفر.
+    """
+    width = max(float(width), 1.0)
+    data = np.subtract(pixels, center - width / 2, dtype=np.float32)
+    data *= 255.0 / width
+    np.nan_to_num(data, copy=False, nan=0.0)
+    np.clip(data, 0, 255, out=data)
+    if invert:
+        # MONOCHROME1: القيم الأعلى تعرض أغمق
+        np.subtract(255, data, out=data)
+    return data.astype(np.uint8)
+
+
+def lut_to_uint8(pixels, first_mapped, lut, bits, invert=False):
+    """تطبيق جدول VOI LUT غير خطي (VOILUTSequence) وتحويل النتيجة إلى 0-255
+
+    الجدول صغير (بضعة آلاف من القيم)، فيحول إلى uint8 مرة واحدة ثم يفهرس بالشريحة.
+    """
+    table = np.asarray(lut, dtype=np.float32)
+    table *= 255.0 / max(2 ** bits - 1, 1)
+    np.clip(table, 0, 255, out=table)
+    table = table.astype(np.uint8)
+    if invert:
+        table = 255 - table
+
+    index = np.subtract(pixels, first_mapped, dtype=np.int64)
+    np.clip(index, 0, len(table) - 1, out=index)
+    return table[index]
+
+
+def to_uint8(image_slice, low, high):
+    """تطبيع شريحة من المدى [low, high] إلى 0-255"""
+    center, width = window_from_range(low, high)
+    return window_to_uint8(image_slice, center, width)
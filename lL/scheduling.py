@@ -0,0 +1,97 @@
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+import itertools
+import threading
+import heapq
+
+# ترتيب المهام حسب الأولوية أمام مجموعة عمليات أو خيوط
+# ProcessPoolExecutor ينفذ المهام بترتيب وصولها، فلا نرسل إليه إلا عدد ما يستطيع تنفيذه الآن
+# وينتظر الباقي هنا مرتباً حسب الأولوية ثم وقت الإضافة
+# هذه الوحدة لا تعتمد على Flask، وتحديد أولوية كل مهمة يتم في app.py
+
+
+class PriorityExecutor:
+    """تنفيذ المهام بالأولوية (الرقم الأصغر أولاً) مع الحفاظ على ترتيب الوصول لنفس الأولوية
+
+    create_executor تنشئ المجموعة الفعلية عند أول مهمة، وتعاد إنشاؤها إذا توقفت إحدى
+    عملياتها بشكل مفاجئ (BrokenProcessPool).
+    """
+
+    def __init__(self, create_executor, max_workers):
+        self._create_executor = create_executor
+        self._max_workers = max_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # (الأولوية، الترتيب، Future، الدالة، المعاملات)
+        self._queue = []
+        self._sequence = itertools.count()
+        self._running = 0
+        self._shutdown = False
+        self._lock = threading.Lock()
+
+    def submit(self, priority, function, *args):
+        future = futures.Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+            heapq.heappush(self._queue, (priority, next(self._sequence), future, function, args))
+        self._dispatch()
+        return future
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                if self._running >= self._max_workers or not self._queue:
+                    return
+                _, _, future, function, args = heapq.heappop(self._queue)
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._running += 1
+            try:
+                inner = self._submit(function, args)
+            except Exception as e:
+                with self._lock:
+                    self._running -= 1
+                future.set_exception(e)
+                continue
+            inner.add_done_callback(lambda inner, future=future: self._finished(inner, future))
+
+    def _submit(self, function, args):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+            try:
+                return self._executor.submit(function, *args)
+            except BrokenProcessPool:
+                # توقفت إحدى العمليات بشكل مفاجئ (نفاد الذاكرة مثلاً)، نعيد إنشاء المجموعة
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._create_executor()
+                return self._executor.submit(function, *args)
+
+    def _finished(self, inner, future):
+        with self._lock:
+            self._running -= 1
+        try:
+            result = inner.result()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        self._dispatch()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """إيقاف المجموعة مثل Executor.shutdown، والمهام المنتظرة تلغى مع cancel_futures"""
+        with self._lock:
+            self._shutdown = True
+            queued = [future for _, _, future, _, _ in self._queue]
+            if cancel_futures:
+                self._queue = []
+        if cancel_futures:
+            for future in queued:
+                future.cancel()
+        elif wait:
+            futures.wait(queued)
+        with self._executor_lock:
+            executor = self._executor
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=cancel_futures)
@@ -0,0 +1,140 @@
+from sqlalchemy import text, column, Integer, Float
+import unicodedata
+import re
+
+# البحث النصي في المنشورات وردود الأطباء
+# النص يطبع هنا قبل الفهرسة وقبل البحث (حذف التشكيل، توحيد أشكال الحروف، حذف أداة
+# التعريف) حتى تتطابق الكلمات العربية بنفس الطريقة في SQLite FTS5 و PostgreSQL
+# هذه الوحدة لا تعتمد على Flask، وتستقبل اتصال قاعدة البيانات من المعاملة الحالية
+
+SEARCH_TABLE = 'post_search'
+MAX_QUERY_TERMS = 8
+
+# التشكيل وعلامات القرآن والتطويل
+_ARABIC_MARKS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_ARABIC_LETTERS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و', 'ة': 'ه',
+})
+# أداة التعريف مع حروف الجر والعطف الملتصقة بها، الأطول أولاً
+_ARABIC_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+_TOKEN = re.compile(r'[^\W_]+')
+
+
+def _normalize_token(token):
+    for prefix in _ARABIC_PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+            return token[len(prefix):]
+    return token
+
+
+def normalize_text(value):
+    """تطبيع النص للفهرسة والبحث، تعيد الكلمات مفصولة بمسافة"""
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKC', value).lower()
+    value = _ARABIC_MARKS.sub('', value).translate(_ARABIC_LETTERS)
+    return ' '.join(_normalize_token(token) for token in _TOKEN.findall(value))
+
+
+def query_terms(query):
+    """كلمات البحث بعد التطبيع (كل كلمة مطلوبة، وتطابق بدايات الكلمات)"""
+    return normalize_text(query).split()[:MAX_QUERY_TERMS]
+
+
+def _ranked_subquery(statement, **params):
+    """المنشورات المطابقة كاستعلام فرعي (post_id, rank)، الأعلى rank أكثر صلة
+
+    يربط بجدول المنشورات في app.py فتطبق عليه نفس شروط التصفية والترقيم.
+    """
+    return text(statement).bindparams(**params) \
+        .columns(column('post_id', Integer), column('rank', Float)).subquery('search_rank')
+
+
+class SqliteSearchIndex:
+    """فهرس FTS5، كل منشور صف واحد بمعرّفه (rowid) ويرتب بـ bm25"""
+
+    # أوزان الأعمدة في الترتيب: العنوان، نص المنشور، الردود
+    WEIGHTS = (5.0, 1.0, 2.0)
+
+    def create(self, connection):
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+            "USING fts5(title, content, replies, tokenize='unicode61 remove_diacritics 2')"
+        ))
+
+    def drop(self, connection):
+        connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+    def index_post(self, connection, post_id, title, content, replies):
+        connection.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :post_id"), {'post_id': post_id})
+        connection.execute(
+            text(f"INSERT INTO {SEARCH_TABLE} (rowid, title, content, replies) "
+                 "VALUES (:post_id, :title, :content, :replies)"),
+            {'post_id': post_id, 'title': normalize_text(title),
+             'content': normalize_text(content), 'replies': normalize_text(replies)}
+        )
+
+    def ranked(self, terms):
+        # كل كلمة بين علامتي تنصيص حتى لا تفسر كصيغة FTS، و * لمطابقة البادئة
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(weight) for weight in self.WEIGHTS)
+        # bm25 يعيد قيماً سالبة (الأصغر أفضل) فنعكس إشارتها
+        return _ranked_subquery(
+            f"SELECT rowid AS post_id, -bm25({SEARCH_TABLE}, {weights}) AS rank FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH :match",
+            match=match
+        )
+
+
+class PostgresSearchIndex:
+    """جدول tsvector مع فهرس GIN، ويرتب بـ ts_rank_cd
+
+    يستخدم الإعداد simple لأن التطبيع العربي يتم قبل الفهرسة.
+    """
+
+    def create(self, connection):
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+            "post_id INTEGER PRIMARY KEY REFERENCES post (id) ON DELETE CASCADE, "
+            "document TSVECTOR NOT NULL)"
+        ))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)"
+        ))
+
+    def drop(self, connection):
+        connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+    def index_post(self, connection, post_id, title, content, replies):
+        connection.execute(
+            text(f"INSERT INTO {SEARCH_TABLE} (post_id, document) VALUES (:post_id, "
+                 "setweight(to_tsvector('simple', :title), 'A') || "
+                 "setweight(to_tsvector('simple', :replies), 'B') || "
+                 "setweight(to_tsvector('simple', :content), 'C')) "
+                 "ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document"),
+            {'post_id': post_id, 'title': normalize_text(title),
+             'content': normalize_text(content), 'replies': normalize_text(replies)}
+        )
+
+    def ranked(self, terms):
+        # الكلمات بعد التطبيع حروف وأرقام فقط، فيمكن تركيب tsquery منها مباشرة
+        query = ' & '.join(f"{term}:*" for term in terms)
+        return _ranked_subquery(
+            f"SELECT post_id, ts_rank_cd(document, query) AS rank "
+            f"FROM {SEARCH_TABLE}, to_tsquery('simple', :query) AS query WHERE document @@ query",
+            query=query
+        )
+
+
+def create_search_index(dialect_name):
+    if dialect_name == 'sqlite':
+        return SqliteSearchIndex()
+    if dialect_name == 'postgresql':
+        return PostgresSearchIndex()
+    raise ValueError(f"Full-text search is not supported on {dialect_name}")
+
+
+def is_search_table(name):
+    """جداول الفهرس (وجداول FTS5 الداخلية) لا تدار عبر نماذج SQLAlchemy"""
+    return name == SEARCH_TABLE or name.startswith(f"{SEARCH_TABLE}_")
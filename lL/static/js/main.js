@@ -288,8 +288,8 @@ function initFileUpload() {
     });
     
     function handleFiles(files) {
-        const maxSize = 50 * 1024 * 1024; // 50MB
-        const allowedTypes = ['dcm', 'nii', 'gz', 'png', 'jpg', 'jpeg'];
+        const maxSize = 2 * 1024 * 1024 * 1024; // 2GB (الملفات الكبيرة ترفع على أجزاء)
+        const allowedTypes = ['dcm', 'nii', 'gz', 'zip', 'png', 'jpg', 'jpeg'];
         
         for (let file of files) {
             // التحقق من النوع
@@ -301,7 +301,7 @@ function initFileUpload() {
             
             // التحقق من الحجم
             if (file.size > maxSize) {
-                showToast(`الملف كبير جداً: ${file.name} (الحد الأقصى 50MB)`, 'error');
+                showToast(`الملف كبير جداً: ${file.name} (الحد الأقصى 2GB)`, 'error');
                 continue;
             }
             
@@ -386,6 +386,68 @@ async function uploadFilesWithPost(formData, postId = null) {
     }
 }
 
+// الرفع المجزأ القابل للاستئناف للملفات الكبيرة
+const UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024; // 5MB
+const CHUNKED_UPLOAD_THRESHOLD = 20 * 1024 * 1024; // الملفات الأكبر من 20MB ترفع على أجزاء
+// مجموع الملفات المرسلة مع النموذج نفسه، أقل من MAX_CONTENT_LENGTH في الخادم (50MB)
+// ليبقى مكان لحقول النموذج وترويسات multipart
+const FORM_UPLOAD_LIMIT = 45 * 1024 * 1024;
+
+async function uploadFileInChunks(file, postId, onProgress = null) {
+    const createResponse = await fetch('/api/uploads', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size, post_id: postId })
+    });
+    let upload = await createResponse.json();
+    if (!upload.success) {
+        return upload;
+    }
+    
+    let offset = upload.offset;
+    let retries = 0;
+    
+    while (offset < file.size) {
+        try {
+            const response = await fetch(upload.upload_url, {
+                method: 'PATCH',
+                headers: {
+                    'Upload-Offset': String(offset),
+                    'Content-Type': 'application/offset+octet-stream'
+                },
+                body: file.slice(offset, offset + UPLOAD_CHUNK_SIZE)
+            });
+            const result = await response.json();
+            
+            if (response.status === 409 && !result.complete) {
+                // الخادم في موضع مختلف، نتابع من موضعه
+                offset = result.offset;
+                continue;
+            }
+            if (!result.success) {
+                return result;
+            }
+            
+            upload = result;
+            offset = result.offset;
+            retries = 0;
+            if (onProgress) onProgress(offset, file.size);
+        } catch (error) {
+            // انقطاع الشبكة: ننتظر ثم نستعلم عن آخر موضع محفوظ ونستأنف منه
+            if (++retries > 5) {
+                return { success: false, error: 'خطأ في الاتصال بالخادم' };
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            const status = await fetch(upload.upload_url).then(r => r.json()).catch(() => null);
+            if (status && status.success) {
+                offset = status.offset;
+            }
+        }
+    }
+    
+    return upload;
+}
+
 // تفعيل أزرار عرض الصور
 function initImageGalleryButtons() {
     document.querySelectorAll('.view-images-btn').forEach(button => {
@@ -444,14 +506,16 @@ function showImageGalleryModal(images) {
     // إنشاء محتوى المعرض
     let imagesHTML = '';
     images.forEach((img, index) => {
-        const imageUrl = img.preview_url || img.url;
-        const isMedicalImage = img.file_type && ['DICOM', 'NIFTI', 'NIFTI_GZ'].includes(img.file_type);
+        const isMedicalImage = img.file_type && ['DICOM', 'NIFTI', 'NIFTI_GZ', 'DICOM_SERIES'].includes(img.file_type);
+        const isPreviewPending = isPreviewInProgress(img.preview_status);
+        const imageUrl = isPreviewPending ? '' : thumbnailUrl(img, 280);
         
         imagesHTML += `
             <div class="gallery-item" style="margin: 15px; text-align: center; position: relative;">
                 <div style="position: relative; display: inline-block;">
                     <img src="${imageUrl}" 
-                         alt="${img.original_filename}"
+                         alt="${isPreviewPending ? 'جاري تجهيز المعاينة...' : img.original_filename}"
+                         ${isPreviewPending ? `data-preview-pending="${img.id}" data-thumbnail-width="280"` : ''}
                          style="max-width: 280px; max-height: 220px; object-fit: contain; border-radius: 8px; cursor: pointer; border: 2px solid #2a9d8f;"
                          onclick="openImageInViewer(${img.id})">
                     ${isMedicalImage ? `
@@ -502,6 +566,11 @@ function showImageGalleryModal(images) {
     document.body.appendChild(galleryModal);
     document.body.style.overflow = 'hidden'; // منع التمرير في الخلفية
     
+    // متابعة المعاينات التي ما زالت قيد التوليد
+    galleryModal.querySelectorAll('img[data-preview-pending]').forEach(imgElement => {
+        watchPreviewStatus(imgElement.dataset.previewPending, imgElement);
+    });
+    
     // إغلاق بالنقر خارج المحتوى
     galleryModal.addEventListener('click', function(e) {
         if (e.target === this) {
@@ -528,6 +597,52 @@ function showImageGalleryModal(images) {
     document.addEventListener('keydown', closeOnEsc);
 }
 
+// هل ما زالت المعاينة قيد التوليد في الخلفية
+function isPreviewInProgress(status) {
+    return status === 'pending' || status === 'retrying';
+}
+
+// أصغر صورة مصغرة تغطي العرض المطلوب على هذه الشاشة، وإلا المعاينة أو الملف الأصلي
+function thumbnailUrl(image, width) {
+    if (image.thumbnails) {
+        const sizes = Object.keys(image.thumbnails).map(Number).sort((a, b) => a - b);
+        const target = width * (window.devicePixelRatio || 1);
+        const size = sizes.find(s => s >= target) || sizes[sizes.length - 1];
+        return image.thumbnails[size];
+    }
+    return image.preview_url || image.url;
+}
+
+// متابعة حالة توليد المعاينة وتحديث الصورة عند جاهزيتها
+function watchPreviewStatus(imageId, imgElement, interval = 2000) {
+    const timer = setInterval(async () => {
+        // إيقاف المتابعة إذا تم إغلاق المعرض
+        if (!document.body.contains(imgElement)) {
+            clearInterval(timer);
+            return;
+        }
+        
+        try {
+            const response = await fetch(`/api/image/${imageId}/status`);
+            const status = await response.json();
+            
+            if (status.preview_status === 'ready') {
+                clearInterval(timer);
+                imgElement.src = thumbnailUrl(status, Number(imgElement.dataset.thumbnailWidth) || 280);
+                imgElement.removeAttribute('data-preview-pending');
+            } else if (!isPreviewInProgress(status.preview_status)) {
+                clearInterval(timer);
+                imgElement.alt = 'تعذر إنشاء المعاينة';
+            }
+        } catch (error) {
+            clearInterval(timer);
+            console.error('Error checking preview status:', error);
+        }
+    }, interval);
+    
+    return timer;
+}
+
 // فتح الصورة في عارض منفصل
 function openImageInViewer(imageId) {
     window.open(`/view_medical_image/${imageId}`, '_blank');
@@ -553,8 +668,8 @@ function formatFileSize(bytes) {
 
 // دالة للتحقق من صحة ملفات الصور الطبية
 function validateMedicalFile(file) {
-    const allowedExtensions = ['dcm', 'nii', 'gz', 'png', 'jpg', 'jpeg'];
-    const maxSize = 50 * 1024 * 1024; // 50MB
+    const allowedExtensions = ['dcm', 'nii', 'gz', 'zip', 'png', 'jpg', 'jpeg'];
+    const maxSize = 2 * 1024 * 1024 * 1024; // 2GB (الملفات الكبيرة ترفع على أجزاء)
     
     const extension = file.name.split('.').pop().toLowerCase();
     
@@ -568,7 +683,7 @@ function validateMedicalFile(file) {
     if (file.size > maxSize) {
         return {
             valid: false,
-            error: `الملف كبير جداً: ${file.name}. الحد الأقصى: 50MB`
+            error: `الملف كبير جداً: ${file.name}. الحد الأقصى: 2GB`
         };
     }
     
@@ -728,7 +843,10 @@ if (typeof module !== 'undefined' && module.exports) {
         showToast,
         initFileUpload,
         uploadFilesWithPost,
+        uploadFileInChunks,
         openImageGallery,
+        watchPreviewStatus,
+        thumbnailUrl,
         showConfirmDialog
     };
 }
\ No newline at end of file
@@ -0,0 +1,29 @@
+import os
+
+# أسماء الملفات ومساراتها في مجلد الرفع ومجلد الأرشيف
+# هذه الوحدة لا تعتمد إلا على المكتبة القياسية، فيستخدمها التطبيق لبناء الروابط وتنظيف
+# الملفات دون تحميل مكتبات الصور (imaging و tiering تعيد تصدير ما تحتاجه منها)
+
+UPLOAD_FOLDER = os.path.join('static', 'uploads', 'medical_images')
+ARCHIVE_FOLDER = os.path.join('static', 'uploads', 'archive')
+
+# سلاسل DICOM تخزن كحجم .npy مع ملف بيانات .json بنفس الاسم
+SERIES_EXTENSION = 'npy'
+
+THUMBNAIL_SIZES = (160, 320, 640)
+
+# طرق ضغط الأرشيف: DICOM يبقى ملف DICOM بصيغة نقل مضغوطة، والباقي يضغط كملف كامل
+DICOM_ARCHIVE_METHODS = ('rle', 'jpeg2000')
+STREAM_ARCHIVE_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def series_metadata_path(file_path):
+    return f"{os.path.splitext(file_path)[0]}.json"
+
+
+def thumbnail_filename(filename, size, thumbnail_format):
+    return f"{filename.split('.', 1)[0]}_thumb{size}.{thumbnail_format}"
+
+
+def archive_path(filename, method):
+    return os.path.join(ARCHIVE_FOLDER, filename + STREAM_ARCHIVE_SUFFIXES.get(method, ''))
@@ -0,0 +1,83 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as medical_app  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # مجلد الرفع نسبي لمجلد العمل، فكل اختبار يعمل في مجلد مؤقت بقاعدة بيانات خاصة به
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('SLICE_CACHE_DIR', str(tmp_path / 'slice_cache'))
+    os.makedirs(medical_app.UPLOAD_FOLDER)
+
+    application = medical_app.create_app(config={'TESTING': True, 'PREVIEW_WORKERS': 1})
+    medical_app.upgrade_database(application)
+    yield application
+
+    # حالة العملية (طابور المعاينات والذاكرة المؤقتة) مشتركة بين التطبيقات، فنعيدها بين الاختبارات
+    medical_app.wait_for_previews(timeout=60)
+    if medical_app._preview_executor is not None:
+        medical_app._preview_executor.shutdown()
+        medical_app._preview_executor = None
+    medical_app._slice_cache = None
+    medical_app._search_index = None
+    medical_app._reply_broker = None
+    medical_app._replies_cache.clear()
+    medical_app._upload_hashers.clear()
+    with application.app_context():
+        medical_app.db.engine.dispose()
+
+
+@pytest.fixture
+def login(app):
+    """إنشاء مستخدم بالدور المطلوب وإرجاع عميل مسجل الدخول به"""
+    def login(username, role='nurse'):
+        with app.app_context():
+            user = medical_app.User(username=username, first_name=username, last_name='test',
+                                    email=f'{username}@example.com', phone='0100', gender='male', role=role)
+            user.set_password('secret')
+            medical_app.db.session.add(user)
+            medical_app.db.session.commit()
+        client = app.test_client()
+        client.post('/login', data={'username': username, 'password': 'secret'})
+        return client
+    return login
+
+
+@pytest.fixture
+def nurse(login):
+    return login('nurse1')
+
+
+@pytest.fixture
+def doctor(login):
+    return login('doctor1', role='doctor')
+
+
+def create_post(client, files=(), **fields):
+    data = {'title': 'صداع', 'content': 'صداع مستمر', 'category': 'symptoms', 'urgency': 'normal', **fields}
+    data['medical_images[]'] = [(io.BytesIO(content), filename) for filename, content in files]
+    response = client.post('/create_post', data=data, content_type='multipart/form-data')
+    assert response.get_json()['success'], response.get_json()
+    return response.get_json()['post_id']
+
+
+def add_reply(client, post_id, content='راحة وسوائل'):
+    response = client.post('/add_reply', data={'post_id': post_id, 'content': content,
+                                                'protocol': 'Head axial', 'examination': 'head'})
+    assert response.get_json()['success'], response.get_json()
+    return response.get_json()['reply_id']
+
+
+def nifti_bytes(shape=(16, 16, 8)):
+    import nibabel as nib
+    pixels = np.arange(np.prod(shape), dtype=np.float32).reshape(shape)
+    return nib.Nifti1Image(pixels, np.eye(4)).to_bytes()
@@ -0,0 +1,47 @@
+import json
+
+import app as medical_app
+from conftest import add_reply, create_post
+
+
+def parse_events(chunks):
+    events = []
+    for chunk in chunks:
+        fields = dict(line.split(': ', 1) for line in chunk.strip().splitlines() if not line.startswith(':'))
+        if fields.get('event') == 'reply':
+            events.append((int(fields['id']), json.loads(fields['data'])))
+    return events
+
+
+def test_events_stream_pushes_new_replies(app, nurse, doctor):
+    app.config.update(SSE_HEARTBEAT_SECONDS=0.1, SSE_STREAM_TIMEOUT=10)
+    post_id = create_post(nurse)
+    response = nurse.get(f'/api/post/{post_id}/events', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    stream = (chunk.decode('utf-8') for chunk in response.response)
+    assert next(stream).startswith('retry:')
+    assert medical_app.get_reply_broker().subscriber_count(post_id) == 1
+
+    reply_id = add_reply(doctor, post_id)
+    chunk = next(chunk for chunk in stream if not chunk.startswith(':'))
+    [(event_id, reply)] = parse_events([chunk])
+    assert event_id == reply_id and reply['content'] == 'راحة وسوائل'
+
+    # إغلاق الاتصال يلغي الاشتراك
+    response.close()
+    assert medical_app.get_reply_broker().subscriber_count(post_id) == 0
+
+
+def test_events_stream_replays_missed_replies(app, nurse, doctor):
+    app.config['SSE_STREAM_TIMEOUT'] = 0
+    post_id = create_post(nurse)
+    first, second, third = (add_reply(doctor, post_id, content) for content in ('أ', 'ب', 'ج'))
+
+    response = nurse.get(f'/api/post/{post_id}/events', headers={'Last-Event-ID': str(first)})
+    events = parse_events(response.get_data(as_text=True).split('\n\n'))
+    assert [event_id for event_id, _ in events] == [second, third]
+
+
+def test_events_require_login_and_existing_post(app, nurse):
+    assert app.test_client().get('/api/post/1/events').status_code == 401
+    assert nurse.get('/api/post/999/events').status_code == 404
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import app as medical_app
+from conftest import create_post
+
+
+def make_posts(app, nurse, count):
+    for index in range(count):
+        create_post(nurse, title=f'منشور {index}')
+    with app.app_context():
+        # نصف المنشورات بنفس وقت الإنشاء حتى يفصل المؤشر بينها بالرقم
+        start = datetime(2026, 1, 1)
+        for post in medical_app.Post.query.all():
+            post.created_at = start + timedelta(minutes=post.id // 2)
+        medical_app.db.session.commit()
+
+
+def walk_feed(app, limit, **filters):
+    pages = []
+    cursor = None
+    with app.app_context():
+        while True:
+            posts, cursor = medical_app.query_post_feed(cursor=cursor, limit=limit, **filters)
+            pages.append([post.id for post in posts])
+            if cursor is None:
+                return pages
+
+
+def test_keyset_pages_cover_every_post_once(app, nurse):
+    make_posts(app, nurse, 7)
+    with app.app_context():
+        expected = [post.id for post in medical_app.Post.query.order_by(
+            medical_app.Post.created_at.desc(), medical_app.Post.id.desc())]
+
+    pages = walk_feed(app, limit=2)
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+    assert [post_id for page in pages for post_id in page] == expected
+
+
+def test_feed_cursor_round_trip_and_invalid_cursor(app, nurse):
+    make_posts(app, nurse, 3)
+    with app.app_context():
+        post = medical_app.Post.query.first()
+        assert medical_app.decode_feed_cursor(medical_app.encode_feed_cursor(post)) == (post.created_at, post.id)
+        assert medical_app.decode_feed_cursor('garbage') is None
+        # المؤشر غير الصالح يعيد الصفحة الأولى
+        first_page, _ = medical_app.query_post_feed(limit=2)
+        assert medical_app.query_post_feed(cursor='garbage', limit=2)[0] == first_page
+
+
+def test_feed_filters_apply_to_every_page(app, nurse):
+    make_posts(app, nurse, 4)
+    create_post(nurse, urgency='critical')
+    create_post(nurse, urgency='critical')
+    pages = walk_feed(app, limit=1, urgency='critical')
+    assert [len(page) for page in pages] == [1, 1]
+
+
+def test_dashboard_links_next_page(app, nurse, doctor):
+    make_posts(app, nurse, medical_app.DASHBOARD_PAGE_SIZE + 1)
+    with app.app_context():
+        posts, cursor = medical_app.query_post_feed()
+    assert cursor
+
+    first = doctor.get('/doctor/dashboard')
+    assert first.status_code == 200
+    assert f'cursor={cursor}'.encode() in first.data
+    second = doctor.get('/doctor/dashboard', query_string={'cursor': cursor})
+    assert second.status_code == 200
+    assert second.data.count(b'post-item') == 1
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from conftest import create_post
+
+
+@pytest.fixture
+def stored_image(app, nurse):
+    data = b'\x89PNG' + os.urandom(256)
+    post_id = create_post(nurse, files=[('photo.png', data)])
+    image = nurse.get(f'/api/post/{post_id}/images').get_json()[0]
+    return image, data
+
+
+def test_media_requires_login(app, stored_image):
+    image, _ = stored_image
+    assert app.test_client().get(image['url']).status_code == 401
+
+
+def test_upload_folder_is_not_served_statically(nurse, stored_image):
+    image, _ = stored_image
+    assert nurse.get(f"/static/uploads/medical_images/{image['filename']}").status_code == 404
+    assert nurse.get(f"/static/css/../uploads/medical_images/{image['filename']}").status_code == 404
+
+
+def test_media_only_serves_files_of_the_image(nurse, stored_image):
+    image, _ = stored_image
+    assert nurse.get(f"/media/{image['id']}/other.png").status_code == 404
+    assert nurse.get(f"/media/999/{image['filename']}").status_code == 404
+
+
+def test_media_supports_ranges_and_revalidation(nurse, stored_image):
+    image, data = stored_image
+    response = nurse.get(image['url'])
+    assert response.status_code == 200
+    assert response.data == data
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert 'private' in response.headers['Cache-Control'] and 'immutable' in response.headers['Cache-Control']
+    assert 'photo.png' in response.headers['Content-Disposition']
+
+    partial = nurse.get(image['url'], headers={'Range': 'bytes=0-9'})
+    assert partial.status_code == 206
+    assert partial.data == data[:10]
+
+    revalidated = nurse.get(image['url'], headers={'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+
+
+def test_media_offloads_to_front_server(app, nurse, stored_image):
+    image, _ = stored_image
+    app.config['MEDIA_ACCEL_REDIRECT_PREFIX'] = '/protected/'
+    response = nurse.get(image['url'])
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == f"/protected/{image['filename']}"
+    assert 'X-Sendfile' not in response.headers
+    assert response.data == b''
@@ -0,0 +1,46 @@
+import app as medical_app
+from conftest import create_post, nifti_bytes
+
+
+def image_status(client, image_id):
+    return client.get(f'/api/image/{image_id}/status').get_json()
+
+
+def test_preview_generated_in_background(app, nurse):
+    post_id = create_post(nurse, files=[('scan.nii', nifti_bytes())])
+    image = nurse.get(f'/api/post/{post_id}/images').get_json()[0]
+    assert image['preview_status'] in ('pending', 'ready')
+
+    assert medical_app.wait_for_previews(timeout=60)
+    status = image_status(nurse, image['id'])
+    assert status['preview_status'] == 'ready'
+    assert status['preview_url'] and status['error'] is None
+
+
+def test_failed_conversion_is_retried_then_reported(app, nurse):
+    post_id = create_post(nurse, files=[('broken.dcm', b'not a dicom file')])
+    image = nurse.get(f'/api/post/{post_id}/images').get_json()[0]
+
+    assert medical_app.wait_for_previews(timeout=60)
+    status = image_status(nurse, image['id'])
+    assert status['preview_status'] == 'failed'
+    assert status['attempts'] == app.config['PREVIEW_MAX_ATTEMPTS']
+    assert status['error']
+
+
+def test_requeue_previews_converts_stuck_images(app, nurse):
+    post_id = create_post(nurse, files=[('scan.nii', nifti_bytes())])
+    assert medical_app.wait_for_previews(timeout=60)
+    with app.app_context():
+        # صورة بقيت pending بعد توقف الخادم قبل انتهاء تحويلها
+        medical_app.MedicalImage.query.filter_by(post_id=post_id).update(
+            {'preview_status': 'pending', 'preview_filename': None})
+        medical_app.db.session.commit()
+
+    result = app.test_cli_runner().invoke(medical_app.requeue_previews)
+    assert result.exit_code == 0, result.output
+
+    with app.app_context():
+        image = medical_app.MedicalImage.query.filter_by(post_id=post_id).one()
+        assert image.preview_status == 'ready'
+        assert image.preview_filename
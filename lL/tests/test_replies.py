@@ -0,0 +1,69 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+import app as medical_app
+from conftest import add_reply, create_post
+
+
+@contextmanager
+def count_queries(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    with app.app_context():
+        engine = medical_app.db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_unchanged_replies_return_304_without_sql(app, nurse, doctor):
+    post_id = create_post(nurse)
+    add_reply(doctor, post_id)
+    url = f'/api/post/{post_id}/replies'
+
+    response = nurse.get(url)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    assert response.last_modified is not None
+    etag = response.headers['ETag']
+
+    with count_queries(app) as statements:
+        revalidated = nurse.get(url, headers={'If-None-Match': etag})
+        cached = nurse.get(url)
+    assert revalidated.status_code == 304
+    assert cached.data == response.data
+    # الجلسة تحمل من ملف تعريف الارتباط، فلا استعلامات للمستخدم أو للردود
+    assert statements == []
+
+
+def test_new_reply_invalidates_cached_replies(app, nurse, doctor):
+    post_id = create_post(nurse)
+    add_reply(doctor, post_id, 'الرد الأول')
+    url = f'/api/post/{post_id}/replies'
+    etag = nurse.get(url).headers['ETag']
+
+    add_reply(doctor, post_id, 'الرد الثاني')
+    response = nurse.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert [reply['content'] for reply in response.get_json()] == ['الرد الأول', 'الرد الثاني']
+    assert response.headers['ETag'] != etag
+
+
+def test_replies_load_doctors_in_one_query(app, nurse, doctor, login):
+    post_id = create_post(nurse)
+    for index in range(3):
+        add_reply(login(f'doctor{index + 2}', role='doctor'), post_id)
+
+    with count_queries(app) as statements:
+        replies = nurse.get(f'/api/post/{post_id}/replies').get_json()
+    assert len({reply['doctor_name'] for reply in replies}) == 3
+    assert len([statement for statement in statements if statement.lstrip().upper().startswith('SELECT')]) == 1
+
+
+def test_unknown_post_replies_return_404(app, nurse):
+    assert nurse.get('/api/post/999/replies').status_code == 404
@@ -0,0 +1,53 @@
+from search import normalize_text, query_terms
+from conftest import add_reply, create_post
+
+
+def search(client, query, **params):
+    response = client.get('/api/search', query_string={'q': query, **params})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_arabic_normalization_matches_word_forms():
+    assert normalize_text('الأشعّة المقطعيّة') == normalize_text('اشعه مقطعيه')
+    assert query_terms('  ') == []
+
+
+def test_search_matches_titles_content_and_replies(app, nurse, doctor):
+    chest = create_post(nurse, title='ألم في الصدر', content='ضيق تنفس منذ يومين')
+    fever = create_post(nurse, title='حمى', content='حرارة مرتفعة')
+    add_reply(doctor, fever, 'يوصى بعمل تحليل دم وخافض للحرارة')
+
+    assert [result['id'] for result in search(doctor, 'صدر')['results']] == [chest]
+    assert [result['id'] for result in search(doctor, 'تنفس')['results']] == [chest]
+    # كلمات الردود تفهرس مع المنشور عند إضافة الرد
+    result, = search(doctor, 'تحليل')['results']
+    assert result['id'] == fever and result['reply_count'] == 1
+    # كل الكلمات مطلوبة
+    assert search(doctor, 'صدر حمى')['results'] == []
+
+
+def test_title_matches_rank_above_content(app, nurse, doctor):
+    in_content = create_post(nurse, title='متابعة', content='الم في البطن بعد الاكل')
+    in_title = create_post(nurse, title='الم البطن', content='منذ الصباح')
+    assert [result['id'] for result in search(doctor, 'البطن')['results']] == [in_title, in_content]
+
+
+def test_search_pages_results(app, nurse, doctor):
+    for index in range(25):
+        create_post(nurse, title=f'صداع {index}')
+    first = search(doctor, 'صداع')
+    assert len(first['results']) == 20 and first['next_page'] == 2
+    second = search(doctor, 'صداع', page=2)
+    assert len(second['results']) == 5 and second['next_page'] is None
+
+
+def test_search_is_for_doctors_and_filters_dashboard(app, nurse, doctor):
+    create_post(nurse, title='كسر في الساق', urgency='critical')
+    create_post(nurse, title='كسر في اليد', urgency='low')
+    assert nurse.get('/api/search', query_string={'q': 'كسر'}).status_code == 401
+
+    page = doctor.get('/doctor/dashboard', query_string={'q': 'كسر', 'urgency': 'critical'})
+    assert page.status_code == 200
+    assert 'كسر في الساق' in page.get_data(as_text=True)
+    assert 'كسر في اليد' not in page.get_data(as_text=True)
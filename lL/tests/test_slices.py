@@ -0,0 +1,110 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import imaging
+from conftest import create_post, nifti_bytes
+
+
+@pytest.fixture
+def volume(app, nurse):
+    post_id = create_post(nurse, files=[('scan.nii', nifti_bytes((16, 12, 8)))])
+    return nurse.get(f'/api/post/{post_id}/images').get_json()[0]['id']
+
+
+def dicom_bytes(pixels):
+    import pydicom
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+    meta = FileMetaDataset()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.2'
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    dataset = Dataset()
+    dataset.file_meta = meta
+    dataset.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    dataset.NumberOfFrames, dataset.Rows, dataset.Columns = pixels.shape
+    dataset.SamplesPerPixel = 1
+    dataset.PhotometricInterpretation = 'MONOCHROME2'
+    dataset.BitsAllocated = dataset.BitsStored = 16
+    dataset.HighBit = 15
+    dataset.PixelRepresentation = 1
+    dataset.PixelData = pixels.astype(np.int16).tobytes()
+    buffer = io.BytesIO()
+    dataset.save_as(buffer, enforce_file_format=True)
+    return buffer.getvalue()
+
+
+def slice_png(client, image_id, axis='axial', index=4, **params):
+    return client.get(f'/api/image/{image_id}/slices/{axis}/{index}', query_string=params)
+
+
+def test_slice_info_lists_axes_and_window(nurse, volume):
+    info = nurse.get(f'/api/image/{volume}/slices').get_json()
+    assert info['axes'] == {'axial': 8, 'coronal': 12, 'sagittal': 16}
+    assert info['window']['width'] > 0
+    assert 'lung' in info['presets']
+    assert info['slice_url'] == f'/api/image/{volume}/slices/'
+
+
+def test_window_level_changes_rendered_slice(nurse, volume):
+    default = slice_png(nurse, volume)
+    assert default.status_code == 200
+    assert default.headers['Content-Type'] == 'image/png'
+    narrow = slice_png(nurse, volume, wc=500, ww=10)
+    assert narrow.data != default.data
+    # النافذة الجاهزة تساوي تحديد مركزها وعرضها صراحة
+    preset = slice_png(nurse, volume, preset='lung')
+    assert preset.data == slice_png(nurse, volume, wc=-600, ww=1500).data
+
+
+def test_slice_size_is_clamped(nurse, volume):
+    large = slice_png(nurse, volume, size=100000)
+    assert Image.open(io.BytesIO(large.data)).size[0] == imaging.MAX_SLICE_SIZE
+    # الأحجام خارج الحدود تشترك في نفس مدخل الذاكرة المؤقتة
+    assert large.headers['ETag'] == slice_png(nurse, volume, size=imaging.MAX_SLICE_SIZE).headers['ETag']
+    small = slice_png(nurse, volume, size=1)
+    assert max(Image.open(io.BytesIO(small.data)).size) == imaging.MIN_SLICE_SIZE
+
+
+def test_invalid_slice_requests(app, nurse, volume):
+    assert slice_png(nurse, volume, ww=0).status_code == 400
+    assert slice_png(nurse, volume, wc='abc').status_code == 400
+    assert slice_png(nurse, volume, preset='unknown').status_code == 400
+    assert slice_png(nurse, volume, index=8).status_code == 404
+    assert slice_png(nurse, volume, axis='oblique').status_code == 404
+    assert slice_png(app.test_client(), volume).status_code == 401
+
+
+def test_slice_revalidation_returns_304(nurse, volume):
+    etag = slice_png(nurse, volume, wc=40, ww=80).headers['ETag']
+    response = nurse.get(f'/api/image/{volume}/slices/axial/4', query_string={'wc': 40, 'ww': 80},
+                         headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_dicom_shape_reads_header_only(tmp_path, monkeypatch):
+    file_path = str(tmp_path / 'frames.dcm')
+    with open(file_path, 'wb') as f:
+        f.write(dicom_bytes(np.zeros((3, 8, 6))))
+
+    def fail(file_path):
+        raise AssertionError('pixels decoded')
+    monkeypatch.setattr(imaging, '_decode_dicom', fail)
+    assert imaging.volume_axes(file_path, 'dcm') == {'axial': 3, 'coronal': 8, 'sagittal': 6}
+
+
+def test_pixel_cache_is_bounded_by_bytes():
+    cache = imaging.PixelCache(limit=250)
+    arrays = {name: np.zeros(100, dtype=np.uint8) for name in 'abc'}
+    for name, pixels in arrays.items():
+        cache.set(name, pixels)
+    # a هو الأقدم استخداماً فيخرج أولاً
+    assert cache.get('a') is None
+    assert cache.get('b') is arrays['b'] and cache.get('c') is arrays['c']
+
+    cache.set('big', np.zeros(300, dtype=np.uint8))
+    assert cache.get('big') is None
+    assert cache.get('b') is arrays['b']
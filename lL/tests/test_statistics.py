@@ -0,0 +1,73 @@
+import io
+
+import app as medical_app
+from conftest import add_reply, create_post
+
+
+def check_counters(app):
+    return app.test_cli_runner().invoke(medical_app.rebuild_case_statistics, ['--check'])
+
+
+def make_cases(app, nurse, doctor):
+    answered = create_post(nurse, files=[('a.png', b'\x89PNGa'), ('b.png', b'\x89PNGb')], urgency='critical')
+    unanswered = create_post(nurse, category='medication')
+    nurse.post('/upload_image', data={'post_id': unanswered, 'medical_image': (io.BytesIO(b'\x89PNGc'), 'c.png')},
+               content_type='multipart/form-data')
+    add_reply(doctor, answered)
+    add_reply(doctor, answered)
+    return answered, unanswered
+
+
+def test_counters_follow_posts_images_and_replies(app, nurse, doctor):
+    answered, unanswered = make_cases(app, nurse, doctor)
+    with app.app_context():
+        post = medical_app.db.session.get(medical_app.Post, answered)
+        assert (post.reply_count, post.image_count) == (2, 2)
+        first_reply = medical_app.Reply.query.filter_by(post_id=answered).order_by(medical_app.Reply.id).first()
+        assert post.first_reply_at == first_reply.created_at
+        post = medical_app.db.session.get(medical_app.Post, unanswered)
+        assert (post.reply_count, post.image_count, post.first_reply_at) == (0, 1, None)
+
+    result = check_counters(app)
+    assert result.exit_code == 0, result.output
+
+
+def test_statistics_summary(app, nurse, doctor, login):
+    make_cases(app, nurse, doctor)
+    summary = doctor.get('/api/stats/summary').get_json()
+    assert summary['total']['post_count'] == 2
+    assert summary['total']['answered_count'] == 1
+    assert summary['total']['reply_count'] == 2
+    assert summary['total']['image_count'] == 3
+    assert summary['urgency']['critical']['answered_count'] == 1
+    assert summary['categories']['medication']['image_count'] == 1
+
+    # الممرض يرى حالاته فقط
+    assert nurse.get('/api/stats/summary').get_json()['total']['post_count'] == 2
+    assert login('nurse2').get('/api/stats/summary').get_json()['total']['post_count'] == 0
+    assert app.test_client().get('/api/stats/summary').status_code == 401
+
+
+def test_reply_to_unknown_post_leaves_counters_unchanged(app, nurse, doctor):
+    make_cases(app, nurse, doctor)
+    response = doctor.post('/add_reply', data={'post_id': 999, 'content': 'x'})
+    assert response.status_code == 200
+    assert response.get_json()['success'] is False
+    with app.app_context():
+        assert medical_app.Reply.query.filter_by(post_id=999).count() == 0
+    assert check_counters(app).exit_code == 0
+
+
+def test_rebuild_repairs_drifted_counters(app, nurse, doctor):
+    answered, _ = make_cases(app, nurse, doctor)
+    with app.app_context():
+        medical_app.Post.query.filter_by(id=answered).update({'reply_count': 7, 'first_reply_at': None})
+        medical_app.CaseStatistics.query.filter_by(dimension='all').update({'image_count': 0})
+        medical_app.db.session.commit()
+
+    assert check_counters(app).exit_code == 1
+    result = app.test_cli_runner().invoke(medical_app.rebuild_case_statistics)
+    assert result.exit_code == 0, result.output
+    assert check_counters(app).exit_code == 0
+    with app.app_context():
+        assert medical_app.db.session.get(medical_app.Post, answered).reply_count == 2
@@ -0,0 +1,55 @@
+import hashlib
+import os
+import time
+
+import app as medical_app
+from conftest import create_post, nifti_bytes
+
+
+def post_images(app, post_id):
+    with app.app_context():
+        return medical_app.MedicalImage.query.filter_by(post_id=post_id).order_by(medical_app.MedicalImage.id).all()
+
+
+def test_duplicate_upload_shares_stored_file_and_preview(app, nurse):
+    data = nifti_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    first_post = create_post(nurse, files=[('scan.nii', data)])
+    assert medical_app.wait_for_previews(timeout=60)
+
+    second_post = create_post(nurse, files=[('copy.nii', data)])
+    [first] = post_images(app, first_post)
+    [second] = post_images(app, second_post)
+
+    assert first.filename == second.filename == f'{digest}.nii'
+    assert second.sha256 == digest and second.original_filename == 'copy.nii'
+    # الملف المكرر يأخذ المعاينة الجاهزة مباشرة دون تحويل جديد
+    assert second.preview_status == 'ready'
+    assert second.preview_filename == first.preview_filename
+    assert [name for name in os.listdir(medical_app.UPLOAD_FOLDER) if name.endswith('.nii')] == [first.filename]
+
+
+def test_duplicates_in_one_request_are_stored_once(app, nurse):
+    data = b'\x89PNG' + os.urandom(64)
+    post_id = create_post(nurse, files=[('a.png', data), ('b.png', data)])
+    images = post_images(app, post_id)
+    assert len(images) == 2
+    assert images[0].filename == images[1].filename
+    assert os.path.getsize(os.path.join(medical_app.UPLOAD_FOLDER, images[0].filename)) == len(data)
+
+
+def test_gc_uploads_removes_only_unreferenced_files(app, nurse):
+    post_id = create_post(nurse, files=[('a.png', b'\x89PNG' + os.urandom(64))])
+    [image] = post_images(app, post_id)
+    orphan = os.path.join(medical_app.UPLOAD_FOLDER, f"{'0' * 64}.png")
+    with open(orphan, 'wb') as f:
+        f.write(b'orphan')
+    stored = os.path.join(medical_app.UPLOAD_FOLDER, image.filename)
+    old = time.time() - 2 * 3600
+    for path in (orphan, stored):
+        os.utime(path, (old, old))
+
+    result = app.test_cli_runner().invoke(medical_app.gc_uploads)
+    assert result.exit_code == 0, result.output
+    assert not os.path.exists(orphan)
+    assert os.path.exists(stored)
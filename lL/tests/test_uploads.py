@@ -0,0 +1,100 @@
+import hashlib
+import io
+import os
+
+import app as medical_app
+from conftest import create_post, nifti_bytes
+
+
+def start_upload(client, post_id, data, filename='scan.nii', checksum=None):
+    payload = {'filename': filename, 'size': len(data), 'post_id': post_id}
+    if checksum:
+        payload['checksum'] = checksum
+    return client.post('/api/uploads', json=payload)
+
+
+def send_chunk(client, upload_url, data, offset):
+    return client.patch(upload_url, data=data, headers={
+        'Upload-Offset': str(offset), 'Content-Type': 'application/offset+octet-stream'})
+
+
+def test_upload_image_requires_existing_post(app, nurse):
+    response = nurse.post('/upload_image', data={'post_id': 999, 'medical_image': (io.BytesIO(b'x'), 'a.png')},
+                          content_type='multipart/form-data')
+    assert response.status_code == 404
+    assert os.listdir(medical_app.UPLOAD_FOLDER) == []
+
+
+def test_upload_image_rejects_other_nurses_post(app, nurse, login):
+    post_id = create_post(nurse)
+    other = login('nurse2')
+    response = other.post('/upload_image', data={'post_id': post_id, 'medical_image': (io.BytesIO(b'x'), 'a.png')},
+                          content_type='multipart/form-data')
+    assert response.status_code == 403
+    # الرفض قبل حفظ أي ملف
+    assert os.listdir(medical_app.UPLOAD_FOLDER) == []
+
+
+def test_upload_image_adds_to_own_post(app, nurse):
+    post_id = create_post(nurse)
+    response = nurse.post('/upload_image', data={'post_id': post_id, 'medical_image': (io.BytesIO(b'png'), 'a.png')},
+                          content_type='multipart/form-data')
+    assert response.get_json()['success']
+    assert len(nurse.get(f'/api/post/{post_id}/images').get_json()) == 1
+
+
+def test_upload_session_checks_post_owner(app, nurse, login):
+    post_id = create_post(nurse)
+    assert start_upload(nurse, 999, b'data').status_code == 404
+    assert start_upload(login('nurse2'), post_id, b'data').status_code == 403
+    assert start_upload(login('doctor1', role='doctor'), post_id, b'data').status_code == 401
+
+
+def test_upload_session_is_private_to_its_owner(app, nurse, login):
+    post_id = create_post(nurse)
+    upload_url = start_upload(nurse, post_id, b'data').get_json()['upload_url']
+    assert login('nurse2').head(upload_url).status_code == 404
+
+
+def test_chunked_upload_resumes_from_server_offset(app, nurse):
+    post_id = create_post(nurse)
+    data = nifti_bytes((32, 32, 16))
+    digest = hashlib.sha256(data).hexdigest()
+    response = start_upload(nurse, post_id, data, checksum=digest)
+    assert response.status_code == 201
+    upload_url = response.get_json()['upload_url']
+    half = len(data) // 2
+
+    assert send_chunk(nurse, upload_url, data[:half], 0).get_json()['offset'] == half
+    # جزء بموضع خاطئ يرفض ويعيد الموضع الحالي
+    conflict = send_chunk(nurse, upload_url, data[:10], 0)
+    assert conflict.status_code == 409
+    assert conflict.get_json()['offset'] == half
+    assert nurse.head(upload_url).headers['Upload-Offset'] == str(half)
+
+    # الاستئناف بعد فقد حالة البصمة في الذاكرة (إعادة تشغيل أو عملية أخرى)
+    medical_app._upload_hashers.clear()
+    response = send_chunk(nurse, upload_url, data[half:], half)
+    assert response.status_code == 200, response.get_json()
+    body = response.get_json()
+    assert body['offset'] == len(data)
+
+    with app.app_context():
+        image = medical_app.MedicalImage.query.filter_by(post_id=post_id).one()
+        assert image.sha256 == digest
+        assert os.path.getsize(os.path.join(medical_app.UPLOAD_FOLDER, image.filename)) == len(data)
+    assert send_chunk(nurse, upload_url, b'x', len(data)).status_code == 409
+
+
+def test_chunked_upload_rejects_checksum_mismatch(app, nurse):
+    post_id = create_post(nurse)
+    data = b'\x89PNG' + b'0' * 100
+    upload_url = start_upload(nurse, post_id, data, filename='a.png',
+                              checksum=hashlib.sha256(b'other').hexdigest()).get_json()['upload_url']
+
+    response = send_chunk(nurse, upload_url, data, 0)
+    assert response.status_code == 422
+    assert nurse.head(upload_url).status_code == 404
+    with app.app_context():
+        assert medical_app.MedicalImage.query.count() == 0
+        assert medical_app.db.session.get(medical_app.Post, post_id).image_count == 0
@@ -0,0 +1,182 @@
+from pydicom.uid import RLELossless, JPEG2000Lossless
+from pydicom.pixels import get_encoder
+from storage import STREAM_ARCHIVE_SUFFIXES, archive_path
+import numpy as np
+import pydicom
+import shutil
+import gzip
+import uuid
+import time
+import os
+
+try:
+    import zstandard
+except ImportError:  # zstd اختياري، و gzip متاح دائماً
+    zstandard = None
+
+# طبقة الأرشيف: الملفات الأصلية القديمة يعاد ضغطها بدون فقد في مجلد الأرشيف وتحذف من
+# مجلد الرفع، وعند فتحها يعاد فك ضغطها إلى مكانها في مجلد الرفع (الطبقة الساخنة) فتعمل
+# باقي الشيفرة على المسار المعتاد دون تغيير. النسخ المفكوكة التي لم تفتح منذ مدة تحذف
+# هذه الوحدة لا تعتمد على Flask أو قاعدة البيانات، وتحديث السجلات يتم في app.py
+
+# DICOM يبقى ملف DICOM بصيغة نقل مضغوطة، و NIfTI يضغط كملف كامل
+DICOM_METHODS = {'rle': RLELossless, 'jpeg2000': JPEG2000Lossless}
+STREAM_METHODS = STREAM_ARCHIVE_SUFFIXES
+ARCHIVE_EXTENSIONS = {'dcm': DICOM_METHODS, 'nii': STREAM_METHODS}
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def method_available(method):
+    if method in DICOM_METHODS:
+        return get_encoder(DICOM_METHODS[method]).is_available
+    if method == 'zstd':
+        return zstandard is not None
+    return method in STREAM_METHODS
+
+
+def archive_method(extension, dicom_method, nifti_method):
+    """طريقة الضغط المناسبة للامتداد، أو None إذا كان الملف لا يؤرشف
+
+    .nii.gz و PNG/JPEG مضغوطة أصلاً، وأحجام السلاسل (.npy) تقرأ بـ memory-map عند العرض.
+    """
+    if extension == 'dcm':
+        return dicom_method
+    if extension == 'nii':
+        return nifti_method
+    return None
+
+
+def _temp_path(path):
+    return f"{path}.{uuid.uuid4().hex}.part"
+
+
+def _write_atomic(target, write):
+    """كتابة الملف باسم مؤقت ثم نقله حتى لا يظهر ملف ناقص بالاسم النهائي"""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp_path = _temp_path(target)
+    try:
+        write(temp_path)
+        os.replace(temp_path, target)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _compress_dicom(source, target, method):
+    dicom_data = pydicom.dcmread(source)
+    if dicom_data.file_meta.TransferSyntaxUID.is_compressed or 'PixelData' not in dicom_data:
+        return False
+
+    pixels = dicom_data.pixel_array
+    # نفس SOPInstanceUID حتى يبقى الملف نفس الصورة بالنسبة للأجهزة الأخرى
+    dicom_data.compress(DICOM_METHODS[method], generate_instance_uid=False)
+
+    def write(temp_path):
+        dicom_data.save_as(temp_path, enforce_file_format=True)
+        # التحقق من أن فك الضغط يعيد نفس البكسلات قبل حذف الأصل
+        if not np.array_equal(pydicom.dcmread(temp_path).pixel_array, pixels):
+            raise ValueError(f"{method} round trip changed the pixel data")
+
+    _write_atomic(target, write)
+    return True
+
+
+def _open_compressed(path, method, mode):
+    if method == 'zstd':
+        if mode == 'wb':
+            return zstandard.ZstdCompressor(level=10).stream_writer(open(path, 'wb'), closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return gzip.open(path, mode, compresslevel=6) if mode == 'wb' else gzip.open(path, mode)
+
+
+def _compress_stream(source, target, method):
+    def write(temp_path):
+        with open(source, 'rb') as src, _open_compressed(temp_path, method, 'wb') as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+
+    _write_atomic(target, write)
+    return True
+
+
+def archive_file(file_path, filename, method):
+    """ضغط الملف الأصلي في مجلد الأرشيف دون حذفه
+
+    تعيد حجم الملف المضغوط، أو None إذا لم يكن للضغط فائدة (DICOM مضغوط أصلاً
+    أو بدون بكسلات، أو ناتج أكبر من الأصل) وعندها لا يبقى ملف في الأرشيف.
+    """
+    target = archive_path(filename, method)
+    if method in DICOM_METHODS:
+        written = _compress_dicom(file_path, target, method)
+    else:
+        written = _compress_stream(file_path, target, method)
+    if not written:
+        return None
+
+    archived_size = os.path.getsize(target)
+    if archived_size >= os.path.getsize(file_path):
+        os.remove(target)
+        return None
+    return archived_size
+
+
+def _restore_dicom(source, temp_path):
+    dicom_data = pydicom.dcmread(source)
+    dicom_data.decompress(as_rgb=False, generate_instance_uid=False)
+    dicom_data.save_as(temp_path, enforce_file_format=True)
+
+
+def _restore_stream(source, method, temp_path):
+    with _open_compressed(source, method, 'rb') as src, open(temp_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+
+
+def restore_file(file_path, filename, method):
+    """فك ضغط الملف المؤرشف إلى مساره في مجلد الرفع، ترفع FileNotFoundError إذا لم يوجد
+
+    الطلبات المتزامنة على نفس الملف تكتب كل منها نسخة مؤقتة، و os.replace يجعل النتيجة
+    ملفاً كاملاً واحداً.
+    """
+    source = archive_path(filename, method)
+    if not os.path.exists(source):
+        raise FileNotFoundError(source)
+    if method in DICOM_METHODS:
+        _write_atomic(file_path, lambda temp_path: _restore_dicom(source, temp_path))
+    else:
+        _write_atomic(file_path, lambda temp_path: _restore_stream(source, method, temp_path))
+
+
+def touch(file_path):
+    """تسجيل وقت آخر فتح للنسخة المفكوكة في atime (يبقى mtime الذي تعتمد عليه ذاكرة القراءة)"""
+    stat = os.stat(file_path)
+    os.utime(file_path, ns=(time.time_ns(), stat.st_mtime_ns))
+
+
+def evict_hot_copies(file_paths, max_idle_seconds, max_bytes):
+    """حذف النسخ المفكوكة التي لم تفتح منذ max_idle_seconds، ثم الأقدم فتحاً حتى
+    لا يتجاوز مجموعها max_bytes. تعيد (عدد الملفات المحذوفة، البايتات المحررة)
+    """
+    entries = []
+    for file_path in file_paths:
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_atime, stat.st_size, file_path))
+    entries.sort()
+
+    idle_before = time.time() - max_idle_seconds
+    total = sum(size for _, size, _ in entries)
+    removed = freed = 0
+    for accessed, size, file_path in entries:
+        if accessed >= idle_before and total <= max_bytes:
+            break
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+        freed += size
+    return removed, freed